@@ -0,0 +1,71 @@
+import functools
+import inspect
+
+from fastapi import APIRouter, Depends
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db
+from .salas import get_sala_id, get_sala_id_async
+
+# Dependencias sincrónicas y su reemplazo en las rutas async
+_DEPENDENCIAS_ASYNC = {get_db: get_async_db, get_sala_id: get_sala_id_async}
+
+
+def en_hilo(endpoint):
+    # Marca un endpoint que debe seguir en el threadpool aun en modo async: IO
+    # bloqueante de archivos, uso de la sesión después de responder o trabajo
+    # en memoria que no cede el event loop (cargar un índice de activas o una
+    # clasificación y esperar sus locks)
+    endpoint.en_hilo = True
+    return endpoint
+
+
+def _endpoint_async(endpoint):
+    # Versión async de un endpoint sincrónico: el mismo código corre con
+    # AsyncSession.run_sync en el event loop, sin ocupar un hilo del threadpool
+    # mientras espera a la base (el driver async cede el control en cada consulta)
+    firma = inspect.signature(endpoint)
+    parametros = []
+    nombre_db = None
+    for parametro in firma.parameters.values():
+        dependencia = getattr(parametro.default, "dependency", None)
+        if dependencia is get_db:
+            nombre_db = parametro.name
+            parametro = parametro.replace(annotation=AsyncSession, default=Depends(get_async_db))
+        elif dependencia in _DEPENDENCIAS_ASYNC:
+            parametro = parametro.replace(default=Depends(_DEPENDENCIAS_ASYNC[dependencia]))
+        parametros.append(parametro)
+    if nombre_db is None:
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def envoltura(**kwargs):
+        db = kwargs.pop(nombre_db)
+        return await db.run_sync(lambda sesion: endpoint(**kwargs, **{nombre_db: sesion}))
+
+    envoltura.__signature__ = firma.replace(parameters=parametros)
+    return envoltura
+
+
+def version_async(router):
+    """Copia del router con cada ruta HTTP atendida por AsyncSession.
+
+    Las rutas marcadas con en_hilo y los websockets se copian sin cambios.
+    """
+    nuevo = APIRouter()
+    for ruta in router.routes:
+        if not isinstance(ruta, APIRoute) or getattr(ruta.endpoint, "en_hilo", False):
+            nuevo.routes.append(ruta)
+            continue
+        nuevo.add_api_route(
+            ruta.path,
+            _endpoint_async(ruta.endpoint),
+            methods=list(ruta.methods),
+            status_code=ruta.status_code,
+            name=ruta.name,
+            response_model=ruta.response_model,
+            tags=ruta.tags,
+            summary=ruta.summary,
+            description=ruta.description,
+        )
+    return nuevo
@@ -0,0 +1,73 @@
+import hashlib
+
+from sqlalchemy import select, func, table, column, literal, literal_column
+from . import rondas
+from .estadisticas import MODELOS
+from .historial import LIMITE_POR_DEFECTO
+from .normalizacion import terminos_busqueda
+
+# Palabras que se tienen en cuenta de cada búsqueda
+MAX_TERMINOS = 10
+
+
+def _terminos(texto):
+    return terminos_busqueda(texto)[:MAX_TERMINOS]
+
+
+def clave(texto):
+    # Identifica la búsqueda en el ETag: las mismas palabras dan la misma clave
+    return hashlib.sha256(" ".join(_terminos(texto)).encode("utf-8")).hexdigest()[:16]
+
+
+def _filtrar_sqlite(consulta, modelo, terminos):
+    # Recorre la tabla FTS5 (tokenizer unicode61 sin acentos), que entrega los ids
+    # en orden: cada palabra como prefijo y todas obligatorias. FTS5 pasa las
+    # palabras de la consulta por el mismo tokenizer que el texto indexado
+    fts = table(f"{modelo.__tablename__}_fts", column("rowid"))
+    expresion = " AND ".join('"' + t.replace('"', '""') + '"*' for t in terminos)
+    consulta = consulta.select_from(fts).join(modelo, modelo.id == fts.c.rowid)
+    return consulta.where(literal_column(fts.name).op("MATCH")(expresion)), fts.c.rowid
+
+
+def _filtrar_postgres(consulta, modelo, terminos):
+    # La misma expresión que el índice GIN de trigramas, así el planner lo usa.
+    # Cada palabra se normaliza con esa misma expresión y tiene que empezar una
+    # palabra del texto (una expresión regular, que los trigramas también
+    # resuelven): la misma regla que los prefijos de FTS5
+    texto = func.ruleta_unaccent(func.lower(modelo.frase.op("||")(literal_column("' '")).op("||")(modelo.respuesta)))
+    for termino in terminos:
+        normalizado = func.ruleta_unaccent(func.lower(literal(termino)))
+        escapado = func.regexp_replace(normalizado, "([^[:alnum:]])", r"\\\1", "g")
+        consulta = consulta.where(texto.op("~")(literal("(^|[^[:alnum:]])").op("||")(escapado)))
+    return consulta, modelo.id
+
+
+def buscar(db, modo, sala_id, texto, despues_de=None, limite=LIMITE_POR_DEFECTO):
+    # Preguntas del banco en cuya frase o respuesta cada palabra de la búsqueda
+    # es el comienzo de una palabra, sin distinguir mayúsculas ni acentos.
+    # Paginado por keyset sobre el id, igual que el historial de respondidas.
+    # En PostgreSQL los trigramas necesitan 3 caracteres: si todas las palabras
+    # son más cortas, el índice no acota y se recorre el banco de la sala.
+    modelo = MODELOS[modo]
+    terminos = _terminos(texto)
+    if not terminos:
+        return {"preguntas": [], "siguiente": None}
+
+    respondida = rondas.respondida(modelo.ronda_respondida, sala_id, modo).label("respondida")
+    consulta = select(modelo.id, modelo.frase, modelo.respuesta, respondida)
+    filtrar = _filtrar_postgres if db.get_bind().dialect.name == "postgresql" else _filtrar_sqlite
+    consulta, orden = filtrar(consulta, modelo, terminos)
+    consulta = consulta.where(modelo.sala_id == sala_id).order_by(orden)
+    if despues_de is not None:
+        consulta = consulta.where(orden > despues_de)
+
+    # Se pide una fila de más para saber si hay otra página
+    filas = db.execute(consulta.limit(limite + 1)).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    return {
+        "preguntas": [
+            {"id": f.id, "frase": f.frase, "respuesta": f.respuesta, "respondida": bool(f.respondida)} for f in filas
+        ],
+        "siguiente": filas[-1].id if hay_mas else None,
+    }
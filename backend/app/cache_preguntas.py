@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+from .indices import activas
+from . import rondas, estadisticas
+from .metricas import registro, Contador, Medidor
+from .models import Pregunta, PreguntaAutoevaluacion
+
+# Payloads de preguntas guardados en memoria (0 desactiva la cache)
+PREGUNTAS_CACHE_MAX = int(os.getenv("PREGUNTAS_CACHE_MAX", "10000"))
+
+# Máximo de ids por pedido en lote
+MAX_IDS_POR_PEDIDO = 100
+
+
+def _payload_clasico(fila):
+    return {"id": fila.id, "frase": fila.frase, "opciones": ["VERDADERO", "FALSO"]}
+
+
+def _payload_autoevaluacion(fila):
+    return {"id": fila.id, "frase": fila.frase, "respuesta": fila.respuesta}
+
+
+MODOS = {
+    "clasico": (Pregunta, _payload_clasico),
+    "autoevaluacion": (PreguntaAutoevaluacion, _payload_autoevaluacion),
+}
+
+busquedas = registro.agregar(Contador(
+    "ruleta_cache_preguntas_total", "Búsquedas en la cache de preguntas", ("modo", "resultado")))
+
+
+class CachePreguntas:
+    """LRU acotada de payloads por (modo, sala_id, id).
+
+    Una importación puede reescribir la respuesta de preguntas que ya están
+    en el banco (misma frase), y lo puede hacer otro proceso. Cada payload se
+    guarda con el contenido del banco (ContadorPreguntas.contenido) con el que
+    se leyó y solo se entrega si el pedido trae ese mismo valor: cuando otro
+    proceso cambia el texto, los payloads viejos dejan de valer sin avisarle
+    (a lo sumo estadisticas.VERSIONES_CACHE_TTL después).
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def obtener(self, modo, sala_id, id_, contenido):
+        # contenido: el del banco leído de la base en este pedido
+        clave = (modo, sala_id, id_)
+        with self._lock:
+            guardado = self._payloads.get(clave)
+            if guardado is None:
+                return None
+            if guardado[0] != contenido:
+                del self._payloads[clave]
+                return None
+            self._payloads.move_to_end(clave)
+        return guardado[1]
+
+    def guardar(self, modo, sala_id, payloads, contenido):
+        # contenido: el del banco leído antes que las filas de los payloads
+        if self.maximo <= 0:
+            return
+        with self._lock:
+            for payload in payloads:
+                clave = (modo, sala_id, payload["id"])
+                self._payloads[clave] = (contenido, payload)
+                self._payloads.move_to_end(clave)
+            while len(self._payloads) > self.maximo:
+                self._payloads.popitem(last=False)
+
+    def invalidar(self, modo=None, sala_id=None):
+        with self._lock:
+            if modo is None and sala_id is None:
+                self._payloads.clear()
+                return
+            for clave in [
+                c for c in self._payloads
+                if (modo is None or c[0] == modo) and (sala_id is None or c[1] == sala_id)
+            ]:
+                del self._payloads[clave]
+
+
+cache = CachePreguntas(PREGUNTAS_CACHE_MAX)
+
+registro.agregar(Medidor(
+    "ruleta_cache_preguntas_tamano", "Payloads de preguntas en la cache", (), lambda: {(): len(cache)}))
+
+
+def obtener_activas(db, modo, sala_id, ids):
+    # Devuelve ({id: payload} de las preguntas activas, ids respondidos, ids inexistentes).
+    # Sin consultar las preguntas cuando el payload está en cache y el índice de
+    # activas (ya cargado al girar) confirma que sigue sin responder; el resto va a la base.
+    modelo, armar = MODOS[modo]
+    encontradas, pendientes = {}, []
+    # El índice vale solo si está en la versión del banco de la base y el payload
+    # si se leyó con su contenido (si no, otro proceso los cambió). Las versiones
+    # se reutilizan entre pedidos durante VERSIONES_CACHE_TTL: un acierto no va a la base
+    version, contenido = estadisticas.versiones_recientes(db, sala_id, modo) if ids else (None, None)
+    for id_ in ids:
+        payload = None
+        if activas.contiene((modo, sala_id), id_, version):
+            payload = cache.obtener(modo, sala_id, id_, contenido)
+        busquedas.sumar(1, modo, "hit" if payload is not None else "miss")
+        if payload is not None:
+            encontradas[id_] = payload
+        else:
+            pendientes.append(id_)
+    respondidas = set()
+    if pendientes:
+        filas = db.execute(
+            select(
+                modelo.id, modelo.frase, modelo.respuesta,
+                rondas.respondida(modelo.ronda_respondida, sala_id, modo).label("respondida"),
+            )
+            .where(modelo.sala_id == sala_id, modelo.id.in_(pendientes))
+        ).all()
+        cache.guardar(modo, sala_id, [armar(f) for f in filas], contenido)
+        for fila in filas:
+            if fila.respondida:
+                respondidas.add(fila.id)
+            else:
+                encontradas[fila.id] = armar(fila)
+    inexistentes = set(ids) - set(encontradas) - respondidas
+    return encontradas, respondidas, inexistentes
+
+
+def calentar(db, modo, sala_id):
+    # Carga en cache las preguntas activas de la sala (hasta el tamaño de la cache)
+    if cache.maximo <= 0:
+        return
+    modelo, armar = MODOS[modo]
+    _, contenido = estadisticas.versiones(db, sala_id, modo)
+    filas = db.execute(
+        select(modelo.id, modelo.frase, modelo.respuesta)
+        .where(modelo.sala_id == sala_id, rondas.activa(modelo.ronda_respondida, sala_id, modo))
+        .order_by(modelo.id.desc())
+        .limit(cache.maximo)
+    ).all()
+    cache.guardar(modo, sala_id, [armar(f) for f in reversed(filas)], contenido)
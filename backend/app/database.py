@@ -1,7 +1,10 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from .metricas import instrumentar_engine
 
 # URL de la base de datos PostgreSQL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db/preguntas_db")
@@ -14,16 +17,62 @@ engine = create_engine(
     pool_pre_ping=True,  # Verificar conexión antes de usar
 )
 
+instrumentar_engine(engine)
+
 # Crear SessionLocal
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Modo de acceso a la base de los routers: "sync" (threadpool) o "async"
+DB_MODO = os.getenv("DB_MODO", "sync")
+
+# Drivers async equivalentes a los de la URL sincrónica
+_DRIVERS_ASYNC = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def url_async(url):
+    esquema, resto = url.split("://", 1)
+    return f"{_DRIVERS_ASYNC.get(esquema.split('+')[0], esquema)}://{resto}"
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", url_async(SQLALCHEMY_DATABASE_URL))
+
+# El engine async se crea al primer uso: en modo sync no hace falta el driver
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        # aiosqlite usa NullPool: el tamaño de pool solo aplica a PostgreSQL
+        pool = {} if ASYNC_DATABASE_URL.startswith("sqlite") else {"pool_size": 10, "max_overflow": 20}
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, **pool)
+        instrumentar_engine(_async_engine.sync_engine, "async")
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=True)
+    return _async_engine
+
 # Base para los modelos
 Base = declarative_base()
 
+# INSERT con ON CONFLICT del dialecto de la sesión (PostgreSQL o SQLite)
+def insert_upsert(db, tabla):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(tabla)
+    return sqlite.insert(tabla)
+
 # Función para obtener una sesión de DB
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Función para obtener una sesión async de DB
+async def get_async_db():
+    get_async_engine()
+    async with _AsyncSessionLocal() as db:
+        yield db
+
+async def cerrar_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+from sqlalchemy import func, case, update
+from sqlalchemy.exc import IntegrityError
+from .models import Pregunta, PreguntaAutoevaluacion, ContadorPreguntas
+from . import rondas
+
+# Segundos que se sirven las estadísticas desde memoria (0 = sin cache)
+ESTADISTICAS_CACHE_TTL = float(os.getenv("ESTADISTICAS_CACHE_TTL", "0"))
+
+MODELOS = {
+    "clasico": Pregunta,
+    "autoevaluacion": PreguntaAutoevaluacion,
+}
+
+# Segundos que se reutilizan la versión y el contenido del banco leídos de la
+# base (versiones_recientes); las escrituras de este proceso los descartan antes
+VERSIONES_CACHE_TTL = float(os.getenv("VERSIONES_CACHE_TTL", "1"))
+
+_cache = {}  # (sala_id, modo) -> (expira, version, estadisticas)
+_versiones = {}  # (sala_id, modo) -> (expira, (version, contenido))
+_lock = threading.Lock()
+
+
+def contar_agregado(db, sala_id, modo):
+    # Total y respondidas en una sola pasada con conteo condicional
+    modelo = MODELOS[modo]
+    total, respondidas = db.query(
+        func.count(modelo.id),
+        func.coalesce(func.sum(case((rondas.respondida(modelo.ronda_respondida, sala_id, modo), 1), else_=0)), 0),
+    ).filter(modelo.sala_id == sala_id).one()
+    return total, respondidas
+
+
+def _inicializar(db, sala_id, modo, contenido=0):
+    # Crea el contador a partir del estado actual de la tabla (incluye cambios
+    # no confirmados de esta transacción)
+    total, respondidas = contar_agregado(db, sala_id, modo)
+    try:
+        with db.begin_nested():
+            db.add(ContadorPreguntas(
+                sala_id=sala_id, modo=modo, total=total, respondidas=respondidas, version=1, contenido=contenido,
+            ))
+    except IntegrityError:
+        # Otra request lo creó al mismo tiempo
+        return False
+    return True
+
+
+def _valores_contenido(contenido):
+    return {"contenido": ContadorPreguntas.contenido + 1} if contenido else {}
+
+
+def sumar(db, sala_id, modo, total=0, respondidas=0, contenido=False):
+    # Ajusta los contadores dentro de la transacción del cambio; llamar antes del
+    # commit. Con contenido, el cambio también modificó el texto de preguntas
+    # existentes. Devuelve la nueva versión del banco
+    invalidar(sala_id, modo)
+    version = db.execute(
+        update(ContadorPreguntas)
+        .where(ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == modo)
+        .values(
+            total=ContadorPreguntas.total + total,
+            respondidas=ContadorPreguntas.respondidas + respondidas,
+            version=ContadorPreguntas.version + 1,
+            **_valores_contenido(contenido),
+        )
+        .returning(ContadorPreguntas.version)
+    ).scalar()
+    if version is None:
+        return 1 if _inicializar(db, sala_id, modo, int(contenido)) else sumar(
+            db, sala_id, modo, total, respondidas, contenido
+        )
+    return version
+
+
+def fijar(db, sala_id, modo, total=None, respondidas=None):
+    # Reemplaza los contadores (reinicio, borrado o importación que reemplaza el
+    # banco). Devuelve la nueva versión del banco
+    invalidar(sala_id, modo)
+    valores = {}
+    if total is not None:
+        valores["total"] = total
+    if respondidas is not None:
+        valores["respondidas"] = respondidas
+    version = db.execute(
+        update(ContadorPreguntas)
+        .where(ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == modo)
+        .values(**valores, version=ContadorPreguntas.version + 1)
+        .returning(ContadorPreguntas.version)
+    ).scalar()
+    if version is None:
+        return 1 if _inicializar(db, sala_id, modo) else fijar(db, sala_id, modo, total, respondidas)
+    return version
+
+
+def renovar(db, sala_id, modo):
+    # Nueva generación (y contenido) del banco al vaciarlo, dentro de la
+    # transacción del borrado. Bloquea la fila del contador hasta el commit
+    invalidar(sala_id, modo)
+    generacion = db.execute(
+        update(ContadorPreguntas)
+        .where(ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == modo)
+        .values(
+            generacion=ContadorPreguntas.generacion + 1,
+            version=ContadorPreguntas.version + 1,
+            contenido=ContadorPreguntas.contenido + 1,
+        )
+        .returning(ContadorPreguntas.generacion)
+    ).scalar()
+    if generacion is None:
+        _inicializar(db, sala_id, modo)
+        return renovar(db, sala_id, modo)
+    return generacion
+
+
+def obtener(db, sala_id, modo):
+    return obtener_con_version(db, sala_id, modo)[1]
+
+
+def obtener_con_version(db, sala_id, modo):
+    # (versión, estadísticas) leídas juntas: la versión es el ETag de la respuesta
+    if ESTADISTICAS_CACHE_TTL > 0:
+        with _lock:
+            en_cache = _cache.get((sala_id, modo))
+        if en_cache and en_cache[0] > time.monotonic():
+            return en_cache[1], en_cache[2]
+
+    filtro = (ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == modo)
+    columnas = (ContadorPreguntas.total, ContadorPreguntas.respondidas, ContadorPreguntas.version)
+    contador = db.query(*columnas).filter(*filtro).first()
+    if contador is None:
+        _inicializar(db, sala_id, modo)
+        db.commit()
+        contador = db.query(*columnas).filter(*filtro).one()
+    total, respondidas, version_banco = contador
+
+    estadisticas = {"total": total, "activas": total - respondidas, "respondidas": respondidas}
+    if ESTADISTICAS_CACHE_TTL > 0:
+        with _lock:
+            _cache[(sala_id, modo)] = (time.monotonic() + ESTADISTICAS_CACHE_TTL, version_banco, estadisticas)
+    return version_banco, estadisticas
+
+
+def version(db, sala_id, modo):
+    # Se incrementa con cada escritura del banco (sumar o fijar): una lectura por
+    # clave primaria. 0 si el banco todavía no tiene contador.
+    return db.query(ContadorPreguntas.version).filter(
+        ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == modo
+    ).scalar() or 0
+
+
+def versiones(db, sala_id, modo):
+    # (versión, contenido) del banco en la misma lectura por clave primaria;
+    # (0, 0) si el banco todavía no tiene contador
+    fila = db.query(ContadorPreguntas.version, ContadorPreguntas.contenido).filter(
+        ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == modo
+    ).first()
+    return (0, 0) if fila is None else tuple(fila)
+
+
+def versiones_recientes(db, sala_id, modo):
+    # Como versiones, pero reutilizando la lectura durante VERSIONES_CACHE_TTL:
+    # los cambios de otros procesos se ven a lo sumo ese tiempo después
+    if VERSIONES_CACHE_TTL <= 0:
+        return versiones(db, sala_id, modo)
+    with _lock:
+        en_cache = _versiones.get((sala_id, modo))
+    if en_cache and en_cache[0] > time.monotonic():
+        return en_cache[1]
+    leidas = versiones(db, sala_id, modo)
+    with _lock:
+        _versiones[(sala_id, modo)] = (time.monotonic() + VERSIONES_CACHE_TTL, leidas)
+    return leidas
+
+
+def invalidar(sala_id=None, modo=None):
+    with _lock:
+        for cache in (_cache, _versiones):
+            if sala_id is None:
+                cache.clear()
+            elif modo is None:
+                for clave in [c for c in cache if c[0] == sala_id]:
+                    del cache[clave]
+            else:
+                cache.pop((sala_id, modo), None)
@@ -0,0 +1,259 @@
+import itertools
+import json
+import os
+import random
+import threading
+import uuid
+
+from sqlalchemy import update, event
+from sqlalchemy.exc import IntegrityError
+from .indices import ConjuntoAleatorio
+from .models import Jugador, EstadoJuego
+
+# "memoria" (un solo proceso) o "db" (varios workers/réplicas comparten el estado)
+ESTADO_JUEGO_BACKEND = os.getenv("ESTADO_JUEGO_BACKEND", "memoria")
+
+
+def _jugador_dict(jugador):
+    return {
+        "id": jugador.id,
+        "nombre": jugador.nombre,
+        "puntaje": jugador.puntaje,
+        "consecutivas": jugador.consecutivas
+    }
+
+
+class _EstadoSala:
+    def __init__(self):
+        self.jugadores = {}
+        self.cola = ConjuntoAleatorio()
+        self.turno_actual = None
+        self.version = 0
+
+
+class AlmacenEstadoMemoria:
+    """Estado del juego en el proceso, protegido por un lock.
+
+    Por sala: jugadores en un dict por id y cola de pendientes en un
+    ConjuntoAleatorio: alta, baja y selección al azar en O(1). Los métodos
+    reciben la sesión para compartir la interfaz con AlmacenEstadoDB, pero no
+    la usan.
+
+    Cada cambio le asigna a la sala la siguiente versión de un contador del
+    almacén; con el id del almacén forma la versión que usan los ETags (otro
+    proceso, o el mismo reiniciado, no repite versiones).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._salas = {}
+        self._id = uuid.uuid4().hex[:8]
+        self._versiones = itertools.count(1)
+
+    def _sala(self, sala_id):
+        # Llamar con el lock tomado
+        estado = self._salas.get(sala_id)
+        if estado is None:
+            estado = self._salas[sala_id] = _EstadoSala()
+        return estado
+
+    def _modificada(self, sala_id):
+        # Llamar con el lock tomado, en cada cambio
+        estado = self._sala(sala_id)
+        estado.version = next(self._versiones)
+        return estado
+
+    def version(self, db, sala_id):
+        with self._lock:
+            estado = self._salas.get(sala_id)
+            return f"{self._id}.{0 if estado is None else estado.version}"
+
+    def obtener(self, db, sala_id):
+        with self._lock:
+            estado = self._sala(sala_id)
+            return {
+                "jugadores": [dict(j) for j in estado.jugadores.values()],
+                "turno_actual": estado.turno_actual,
+                "cola_pendientes": list(estado.cola),
+            }
+
+    def iniciar(self, db, sala_id, jugadores):
+        with self._lock:
+            estado = self._modificada(sala_id)
+            estado.jugadores = {j["id"]: dict(j) for j in jugadores}
+            estado.cola = ConjuntoAleatorio(estado.jugadores)
+            estado.turno_actual = None
+
+    def agregar_jugador(self, db, sala_id, jugador):
+        with self._lock:
+            self._modificada(sala_id).jugadores[jugador["id"]] = dict(jugador)
+
+    def eliminar_jugador(self, db, sala_id, jugador_id):
+        with self._lock:
+            estado = self._modificada(sala_id)
+            estado.jugadores.pop(jugador_id, None)
+            estado.cola.quitar(jugador_id)
+            if estado.turno_actual == jugador_id:
+                estado.turno_actual = None
+
+    def actualizar_jugador(self, db, sala_id, jugador_id, puntaje, consecutivas):
+        with self._lock:
+            jugador = self._modificada(sala_id).jugadores.get(jugador_id)
+            if jugador is not None:
+                jugador["puntaje"] = puntaje
+                jugador["consecutivas"] = consecutivas
+
+    def seleccionar(self, db, sala_id):
+        with self._lock:
+            estado = self._modificada(sala_id)
+            jugador_id = estado.cola.elegir()
+            if jugador_id is None:
+                return None
+            estado.cola.quitar(jugador_id)
+            estado.turno_actual = jugador_id
+
+            # Si cola vacía, resetear con todos los jugadores
+            if not len(estado.cola):
+                estado.cola = ConjuntoAleatorio(estado.jugadores)
+            return jugador_id
+
+    def reiniciar(self, db, sala_id):
+        with self._lock:
+            estado = self._modificada(sala_id)
+            estado.turno_actual = None
+            estado.cola = ConjuntoAleatorio(estado.jugadores)
+            for j in estado.jugadores.values():
+                j["puntaje"] = 0
+                j["consecutivas"] = 0
+
+    def _quitar_sala(self, sala_id):
+        with self._lock:
+            self._salas.pop(sala_id, None)
+
+    def eliminar_sala(self, db, sala_id, commit=True):
+        # Con commit=False el estado se descarta recién cuando db confirma la
+        # transacción en curso (si se revierte, la sala conserva su estado)
+        if commit:
+            self._quitar_sala(sala_id)
+        else:
+            event.listen(db, "after_commit", lambda session: self._quitar_sala(sala_id), once=True)
+
+
+class AlmacenEstadoDB:
+    """Estado del juego en la tabla estado_juego, compartido entre procesos.
+
+    Los jugadores y puntajes se leen de la tabla jugadores; la fila de cada
+    sala guarda el turno y la cola. Cada cambio es un UPDATE condicionado a la
+    versión leída (concurrencia optimista): si otro proceso la modificó antes,
+    se vuelve a leer y reintentar. Cada método confirma su propia transacción
+    (salvo eliminar_sala con commit=False).
+    Los cambios de jugadores también incrementan la versión, que así sirve de
+    ETag del estado completo.
+    """
+
+    def _fila(self, db, sala_id):
+        fila = db.query(EstadoJuego.turno_actual, EstadoJuego.cola_pendientes, EstadoJuego.version).filter(
+            EstadoJuego.sala_id == sala_id
+        ).first()
+        if fila is None:
+            try:
+                with db.begin_nested():
+                    db.add(EstadoJuego(sala_id=sala_id, turno_actual=None, cola_pendientes="[]", version=0))
+            except IntegrityError:
+                pass  # Otra request la creó al mismo tiempo
+            return self._fila(db, sala_id)
+        return fila
+
+    def _modificar(self, db, sala_id, cambio):
+        # cambio(turno_actual, cola) -> (turno_actual, cola, resultado)
+        while True:
+            fila = self._fila(db, sala_id)
+            turno_actual, cola, resultado = cambio(fila.turno_actual, json.loads(fila.cola_pendientes))
+            actualizadas = db.execute(
+                update(EstadoJuego)
+                .where(EstadoJuego.sala_id == sala_id, EstadoJuego.version == fila.version)
+                .values(turno_actual=turno_actual, cola_pendientes=json.dumps(cola), version=fila.version + 1)
+            ).rowcount
+            db.commit()
+            if actualizadas:
+                return resultado
+
+    def _tocar(self, db, sala_id):
+        # Nueva versión sin cambiar turno ni cola (cambió la tabla jugadores)
+        self._fila(db, sala_id)
+        db.execute(update(EstadoJuego).where(EstadoJuego.sala_id == sala_id).values(version=EstadoJuego.version + 1))
+        db.commit()
+
+    def version(self, db, sala_id):
+        version = self._fila(db, sala_id).version
+        db.commit()
+        return version
+
+    def _ids_jugadores(self, db, sala_id):
+        return [id_ for (id_,) in db.query(Jugador.id).filter(Jugador.sala_id == sala_id).order_by(Jugador.id)]
+
+    def obtener(self, db, sala_id):
+        fila = self._fila(db, sala_id)
+        jugadores = db.query(Jugador).filter(Jugador.sala_id == sala_id).order_by(Jugador.id).all()
+        estado = {
+            "jugadores": [_jugador_dict(j) for j in jugadores],
+            "turno_actual": fila.turno_actual,
+            "cola_pendientes": json.loads(fila.cola_pendientes),
+        }
+        db.commit()
+        return estado
+
+    def iniciar(self, db, sala_id, jugadores):
+        ids = [j["id"] for j in jugadores]
+        self._modificar(db, sala_id, lambda turno, cola: (None, ids, None))
+
+    def agregar_jugador(self, db, sala_id, jugador):
+        # Los jugadores se leen de su tabla: solo cambia la versión
+        self._tocar(db, sala_id)
+
+    def eliminar_jugador(self, db, sala_id, jugador_id):
+        def cambio(turno, cola):
+            return (None if turno == jugador_id else turno), [i for i in cola if i != jugador_id], None
+        self._modificar(db, sala_id, cambio)
+
+    def actualizar_jugador(self, db, sala_id, jugador_id, puntaje, consecutivas):
+        # El puntaje ya quedó guardado en la tabla jugadores: solo cambia la versión
+        self._tocar(db, sala_id)
+
+    def seleccionar(self, db, sala_id):
+        def cambio(turno, cola):
+            if not cola:
+                return turno, cola, None
+
+            # Elección al azar y swap-remove
+            pos = random.randrange(len(cola))
+            jugador_id = cola[pos]
+            cola[pos] = cola[-1]
+            cola.pop()
+
+            # Si cola vacía, resetear con todos los jugadores
+            if not cola:
+                cola = self._ids_jugadores(db, sala_id)
+            return jugador_id, cola, jugador_id
+
+        return self._modificar(db, sala_id, cambio)
+
+    def reiniciar(self, db, sala_id):
+        self._modificar(db, sala_id, lambda turno, cola: (None, self._ids_jugadores(db, sala_id), None))
+
+    def eliminar_sala(self, db, sala_id, commit=True):
+        # commit=False: el borrado queda en la transacción del llamador
+        db.query(EstadoJuego).filter(EstadoJuego.sala_id == sala_id).delete()
+        if commit:
+            db.commit()
+
+
+def crear_almacen(backend=ESTADO_JUEGO_BACKEND):
+    if backend == "db":
+        return AlmacenEstadoDB()
+    if backend == "memoria":
+        return AlmacenEstadoMemoria()
+    raise ValueError(f"ESTADO_JUEGO_BACKEND desconocido: {backend}")
+
+
+almacen = crear_almacen()
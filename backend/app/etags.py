@@ -0,0 +1,32 @@
+from fastapi import Request, Response
+
+# Los clientes pueden guardar la respuesta pero deben revalidarla en cada uso
+CACHE_CONTROL = "no-cache"
+
+
+def etag(*partes):
+    # ETag fuerte a partir de la versión del dato (y de lo que cambie el cuerpo,
+    # como la sala o los parámetros de la consulta)
+    return '"' + "-".join(str(p) for p in partes) + '"'
+
+
+def _coincide(if_none_match, valor):
+    # If-None-Match se compara en forma débil: un proxy que comprime puede
+    # devolver el ETag con el prefijo W/
+    if if_none_match.strip() == "*":
+        return True
+    return any(v.strip().removeprefix("W/") == valor for v in if_none_match.split(","))
+
+
+def no_modificado(request: Request, response: Response, valor):
+    """Agrega el ETag a la respuesta y devuelve un 304 si el cliente ya lo tiene.
+
+    Llamar antes de armar el cuerpo: si devuelve una respuesta, el endpoint la
+    devuelve tal cual sin consultar nada más.
+    """
+    encabezados = {"ETag": valor, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _coincide(if_none_match, valor):
+        return Response(status_code=304, headers=encabezados)
+    response.headers.update(encabezados)
+    return None
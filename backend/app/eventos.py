@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+
+from sqlalchemy import text
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+# Eventos pendientes por suscriptor antes de considerarlo lento
+EVENTOS_MAX_PENDIENTES = int(os.getenv("EVENTOS_MAX_PENDIENTES", "100"))
+
+# "memoria" (los eventos llegan a los clientes de este proceso: un solo worker)
+# o "postgres" (se difunden con NOTIFY a los clientes de todos los workers)
+EVENTOS_BACKEND = os.getenv("EVENTOS_BACKEND", "memoria")
+
+# Canal de LISTEN/NOTIFY y segundos de espera antes de reconectar el listener
+CANAL_NOTIFY = "ruleta_eventos"
+ESPERA_RECONEXION = 1
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado, atendida en su event loop."""
+
+    def __init__(self, loop, maximo_pendientes):
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=maximo_pendientes)
+
+    def _entregar(self, mensaje, seq):
+        # Corre en el event loop del suscriptor
+        if self.cola.full():
+            # Cliente lento: en vez de acumular sin límite (o frenar al resto)
+            # se descarta lo pendiente y se le pide que vuelva a leer el estado
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            mensaje = json.dumps({"tipo": "resincronizar", "seq": seq})
+        self.cola.put_nowait(mensaje)
+
+
+class CanalEventos:
+    """Difusión de eventos del juego a los clientes suscriptos a cada sala.
+
+    Los routers publican desde cualquier hilo; cada evento se serializa una
+    sola vez y se encola en la Suscripcion de cada cliente con
+    call_soon_threadsafe. Las colas son acotadas: un cliente lento recibe
+    "resincronizar" en lugar de frenar la publicación. Cada sala numera sus
+    eventos con seq para que el cliente detecte huecos. Solo llega a los
+    clientes conectados a este proceso (con varios workers, CanalEventosPostgres).
+    """
+
+    def __init__(self, maximo_pendientes=EVENTOS_MAX_PENDIENTES):
+        self.maximo_pendientes = maximo_pendientes
+        self._lock = threading.Lock()
+        self._suscripciones = {}  # sala_id -> set de Suscripcion
+        self._seq = {}  # sala_id -> último seq publicado
+
+    def suscribir(self, sala_id):
+        # Llamar desde el event loop que va a consumir la cola
+        suscripcion = Suscripcion(asyncio.get_running_loop(), self.maximo_pendientes)
+        with self._lock:
+            self._suscripciones.setdefault(sala_id, set()).add(suscripcion)
+            seq = self._seq.get(sala_id, 0)
+        return suscripcion, seq
+
+    def desuscribir(self, sala_id, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(sala_id)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._suscripciones[sala_id]
+
+    def suscriptores(self, sala_id):
+        with self._lock:
+            return len(self._suscripciones.get(sala_id, ()))
+
+    def iniciar(self):
+        pass
+
+    def cerrar(self):
+        pass
+
+    def publicar(self, sala_id, tipo, **datos):
+        return self._difundir(sala_id, tipo, datos)
+
+    def _difundir(self, sala_id, tipo, datos):
+        # A los clientes de este proceso; devuelve el seq del evento en la sala
+        with self._lock:
+            seq = self._seq[sala_id] = self._seq.get(sala_id, 0) + 1
+            suscripciones = list(self._suscripciones.get(sala_id, ()))
+        if not suscripciones:
+            return seq
+
+        mensaje = json.dumps({"tipo": tipo, "seq": seq, **datos})
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._entregar, mensaje, seq)
+            except RuntimeError:
+                # El event loop del cliente ya se cerró
+                self.desuscribir(sala_id, suscripcion)
+        return seq
+
+
+class CanalEventosPostgres(CanalEventos):
+    """Canal que reparte los eventos entre procesos con LISTEN/NOTIFY.
+
+    publicar() solo envía un NOTIFY (fuera de la transacción del cambio, que
+    ya se confirmó); un hilo por proceso escucha el canal y difunde cada
+    notificación a sus clientes, también las propias. PostgreSQL entrega las
+    notificaciones a todos los listeners en el mismo orden, así que cada
+    proceso numera los eventos de la sala igual a partir de que empezó a
+    escuchar (el seq de una conexión no tiene huecos falsos). Si el listener
+    se desconecta, al reconectar se publica "resincronizar" en las salas con
+    clientes: lo notificado mientras tanto se perdió.
+    """
+
+    def __init__(self, engine, maximo_pendientes=EVENTOS_MAX_PENDIENTES):
+        super().__init__(maximo_pendientes)
+        self.engine = engine
+        self._hilo = None
+        self._fin = threading.Event()
+
+    def publicar(self, sala_id, tipo, **datos):
+        self._notificar(json.dumps({"sala_id": sala_id, "tipo": tipo, "datos": datos}))
+
+    def _notificar(self, payload):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": CANAL_NOTIFY, "payload": payload})
+        except Exception:
+            # Los clientes se enteran al volver a leer el estado: no falla la request
+            logger.exception("No se pudo notificar un evento del juego")
+
+    def _recibir(self, payload):
+        evento = json.loads(payload)
+        self._difundir(evento["sala_id"], evento["tipo"], evento["datos"])
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._fin.clear()
+            self._hilo = threading.Thread(target=self._escuchar, name="eventos_juego", daemon=True)
+        self._hilo.start()
+
+    def cerrar(self):
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo is not None:
+            self._fin.set()
+            hilo.join()
+
+    def _escuchar(self):
+        reconexion = False
+        while not self._fin.is_set():
+            try:
+                # Conexión propia, fuera del pool: queda tomada mientras escucha
+                conexion = self.engine.raw_connection()
+                conexion.detach()
+                pg = conexion.driver_connection
+                try:
+                    pg.autocommit = True
+                    pg.cursor().execute(f"LISTEN {CANAL_NOTIFY}")
+                    if reconexion:
+                        with self._lock:
+                            salas = list(self._suscripciones)
+                        for sala_id in salas:
+                            self._difundir(sala_id, "resincronizar", {})
+                    while not self._fin.is_set():
+                        if select.select([pg], [], [], ESPERA_RECONEXION) == ([], [], []):
+                            continue
+                        pg.poll()
+                        while pg.notifies:
+                            self._recibir(pg.notifies.pop(0).payload)
+                finally:
+                    conexion.close()
+            except Exception:
+                logger.warning("Se perdió la conexión que escucha los eventos del juego", exc_info=True)
+                self._fin.wait(ESPERA_RECONEXION)
+            reconexion = True
+
+
+def crear_canal(backend=EVENTOS_BACKEND):
+    if backend == "postgres":
+        return CanalEventosPostgres(engine)
+    if backend == "memoria":
+        return CanalEventos()
+    raise ValueError(f"EVENTOS_BACKEND desconocido: {backend}")
+
+
+# Canal compartido por los routers del proceso
+canal = crear_canal()
@@ -0,0 +1,50 @@
+import json
+
+from sqlalchemy import select
+from . import rondas
+from .estadisticas import MODELOS
+
+# Tamaño de página por defecto y máximo del historial de respondidas
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+# Líneas NDJSON acumuladas antes de enviar un bloque al cliente
+LINEAS_POR_BLOQUE = 500
+
+
+def _respondidas(modelo, sala_id, modo):
+    # Recorre el índice (sala_id, ronda_respondida, id) en orden de id
+    return (
+        select(modelo.id, modelo.frase, modelo.respuesta)
+        .where(modelo.sala_id == sala_id, rondas.respondida(modelo.ronda_respondida, sala_id, modo))
+        .order_by(modelo.id)
+    )
+
+
+def pagina_respondidas(db, modo, sala_id, despues_de=None, limite=LIMITE_POR_DEFECTO):
+    # Paginación por keyset: la página siguiente empieza después del último id
+    # entregado, así que cada página cuesta lo mismo sin importar cuántas haya antes
+    modelo = MODELOS[modo]
+    consulta = _respondidas(modelo, sala_id, modo)
+    if despues_de is not None:
+        consulta = consulta.where(modelo.id > despues_de)
+    # Se pide una fila de más para saber si hay otra página
+    filas = db.execute(consulta.limit(limite + 1)).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    return {
+        "respondidas": [{"id": f.id, "frase": f.frase, "respuesta": f.respuesta} for f in filas],
+        "siguiente": filas[-1].id if hay_mas else None,
+    }
+
+
+def iterar_respondidas_ndjson(db, modo, sala_id):
+    # Exportación completa en NDJSON (una pregunta por línea) sin cargarla entera en memoria
+    filas = db.execute(_respondidas(MODELOS[modo], sala_id, modo).execution_options(yield_per=1000))
+    bloque = []
+    for fila in filas:
+        bloque.append(json.dumps({"id": fila.id, "frase": fila.frase, "respuesta": fila.respuesta}, ensure_ascii=False))
+        if len(bloque) >= LINEAS_POR_BLOQUE:
+            yield "\n".join(bloque) + "\n"
+            bloque = []
+    if bloque:
+        yield "\n".join(bloque) + "\n"
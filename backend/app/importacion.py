@@ -0,0 +1,642 @@
+import codecs
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, delete, update, literal, text, func, and_, or_
+from .database import insert_upsert
+from .indices import activas
+from .parseo_csv import (
+    parsear_clasico, parsear_autoevaluacion, registros, cortar_registros, parsear_bloque, COLUMNAS,
+)
+from . import estadisticas, cache_preguntas, registro_respuestas
+from .models import Pregunta, PreguntaAutoevaluacion, PreguntaJugador, Jugador, Importacion, FilaStaging, ErrorImportacion
+
+# Filas por lote de inserción (configurable por entorno o por request)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+# Bytes leídos del upload en cada iteración
+TAMANO_BLOQUE_LECTURA = 64 * 1024
+
+# Máximo de filas con error guardadas por importación (se siguen contando todas)
+MAX_ERRORES_REPORTE = int(os.getenv("IMPORT_MAX_ERRORES", "10000"))
+
+# Segundos sin un punto de control tras los que una importación en progreso se
+# da por abandonada (terminó el proceso que la corría) y otro la puede retomar
+IMPORT_ABANDONADA_SEGUNDOS = int(os.getenv("IMPORT_ABANDONADA_SEGUNDOS", "600"))
+
+# Procesos que parsean y validan los archivos grandes (1 = en el hilo de la importación)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Tamaño desde el que un archivo se parsea en el pool, y de cada bloque que se le envía
+IMPORT_PARALELO_MIN_BYTES = int(os.getenv("IMPORT_PARALELO_MIN_BYTES", str(8 * 1024 * 1024)))
+TAMANO_BLOQUE_PARALELO = 4 * 1024 * 1024
+# Sin un fin de registro visible en más que estos bloques (una comilla suelta o un
+# registro enorme), el bloque siguiente se parsea en el proceso
+MAX_BLOQUES_SIN_CORTE = 1
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def leer_lineas(stream, encoding="utf-8", tamano_bloque=TAMANO_BLOQUE_LECTURA):
+    # Decodifica el stream de a bloques sin cargar el archivo completo en memoria.
+    # Se corta solo en "\n" (igual que io.StringIO) para que el lector CSV maneje
+    # los saltos de línea dentro de campos entre comillas.
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pendiente = ""
+    while True:
+        bloque = stream.read(tamano_bloque)
+        texto = pendiente + decoder.decode(bloque, final=not bloque)
+        lineas = texto.split("\n")
+        pendiente = lineas.pop()
+        for linea in lineas:
+            yield linea + "\n"
+        if not bloque:
+            break
+    if pendiente:
+        yield pendiente
+
+
+def hash_contenido(stream, tamano_bloque=TAMANO_BLOQUE_LECTURA):
+    # SHA-256 del upload completo; deja el stream al inicio para parsearlo
+    h = hashlib.sha256()
+    for bloque in iter(lambda: stream.read(tamano_bloque), b""):
+        h.update(bloque)
+    stream.seek(0)
+    return h.hexdigest()
+
+
+# Configuración de cada modo: tabla destino, columnas, parser y tablas que
+# referencian a la destino (se vacían antes al reemplazar el banco)
+MODOS = {
+    "clasico": {
+        "tabla": Pregunta.__table__,
+        "columnas": list(COLUMNAS["clasico"]),
+        "parsear": parsear_clasico,
+        "dependientes": [],
+    },
+    "autoevaluacion": {
+        "tabla": PreguntaAutoevaluacion.__table__,
+        "columnas": list(COLUMNAS["autoevaluacion"]),
+        "parsear": parsear_autoevaluacion,
+        "dependientes": [PreguntaJugador.__table__],
+    },
+}
+
+
+def _copy_postgres(db, tabla, filas):
+    columnas = list(filas[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for fila in filas:
+        writer.writerow(
+            ("true" if v else "false") if isinstance(v, bool) else v
+            for v in (fila[c] for c in columnas)
+        )
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {tabla.name} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def insertar_lote(db, tabla, filas):
+    if not filas:
+        return
+    # PostgreSQL: COPY FROM STDIN; resto (SQLite en tests): executemany de Core
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_postgres(db, tabla, filas)
+    else:
+        db.execute(insert(tabla), filas)
+
+
+def _obtener_pool(workers):
+    # Pool de procesos compartido por las importaciones; "spawn" porque el
+    # proceso tiene hilos (servidor, escritor de eventos) y fork los copiaría a medias
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            contexto = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+            _pool_workers = workers
+        return _pool
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _registros_secuenciales(stream, parsear, desde=(0, 1)):
+    # (línea, resultado, inicio) parseando en este hilo, con el stream ya en el
+    # byte de desde (byte, línea)
+    return _registros_hasta(stream, parsear, *desde)
+
+
+def _lineas_con_posicion(stream, consumido, tamano_bloque=TAMANO_BLOQUE_LECTURA):
+    # Como leer_lineas, pero anota en consumido [bytes, líneas] lo entregado hasta
+    # cada línea. Se corta en b"\n", que en UTF-8 no aparece dentro de un carácter
+    pendiente = b""
+    while True:
+        bloque = stream.read(tamano_bloque)
+        lineas = (pendiente + bloque).split(b"\n")
+        pendiente = lineas.pop()
+        for linea in lineas:
+            consumido[0] += len(linea) + 1
+            consumido[1] += 1
+            yield linea.decode("utf-8") + "\n"
+        if not bloque:
+            break
+    if pendiente:
+        consumido[0] += len(pendiente)
+        consumido[1] += 1
+        yield pendiente.decode("utf-8")
+
+
+def _registros_hasta(stream, parsear, desde_byte, primera_linea, hasta_byte=None):
+    """Parsea en el proceso desde un límite de registro hasta pasar hasta_byte.
+
+    El stream ya está en desde_byte. Genera (línea, resultado, inicio), con
+    inicio el (byte, línea) donde empieza el registro, y devuelve (byte, línea)
+    del primer fin de registro real en hasta_byte o después (el lector CSV sabe
+    dónde terminan los registros aunque haya comillas sueltas), o None si llegó
+    al final del archivo.
+    """
+    consumido = [desde_byte, 0]
+    inicio = desde_byte
+    for linea, resultado in registros(_lineas_con_posicion(stream, consumido), parsear, primera_linea):
+        yield linea, resultado, (inicio, linea)
+        inicio = consumido[0]
+        if hasta_byte is not None and inicio >= hasta_byte:
+            return inicio, primera_linea + consumido[1]
+    return None
+
+
+def _registros_paralelos(stream, modo, workers, tamano_bloque=TAMANO_BLOQUE_PARALELO, desde=(0, 1)):
+    """Parsea y valida el archivo en el pool, devolviendo los registros en orden.
+
+    El archivo se corta en bloques que terminan en un fin de registro (un "\n"
+    fuera de comillas) y cada bloque viaja con la línea física donde empieza,
+    así los números de línea son los mismos que al parsear en el proceso. Si
+    un bloque resulta cortado dentro de un campo entre comillas (comillas
+    sueltas) o no aparece un fin de registro en más de MAX_BLOQUES_SIN_CORTE
+    bloques, se descarta lo cortado después y solo ese tramo se parsea en el
+    proceso; desde el primer fin de registro real que le sigue se vuelve a
+    cortar (la paridad de comillas arranca de nuevo) y a parsear en el pool.
+    Los registros de un bloque llevan como inicio el del bloque.
+    """
+    pool = _obtener_pool(workers)
+    parsear = MODOS[modo]["parsear"]
+    columnas = MODOS[modo]["columnas"]
+    pendientes = deque()  # (futuro o None para seguir en el proceso, byte inicial, línea inicial, byte final)
+    enviados, linea = desde
+    resto = b""
+    leyendo = True
+    try:
+        while True:
+            # Hasta dos bloques por proceso en vuelo: acota la memoria si la base es más lenta
+            while leyendo and len(pendientes) < 2 * workers:
+                bloque = stream.read(tamano_bloque)
+                resto += bloque
+                corte = len(resto) if not bloque else cortar_registros(resto)
+                if corte == -1:
+                    if len(resto) > MAX_BLOQUES_SIN_CORTE * tamano_bloque:
+                        pendientes.append((None, enviados, linea, enviados + tamano_bloque))
+                        leyendo = False
+                    continue
+                datos, resto = resto[:corte], resto[corte:]
+                leyendo = bool(bloque)
+                if datos:
+                    futuro = pool.submit(parsear_bloque, modo, datos, linea, not bloque)
+                    pendientes.append((futuro, enviados, linea, enviados + len(datos)))
+                    enviados += len(datos)
+                    linea += datos.count(b"\n")
+            if not pendientes:
+                return
+
+            futuro, desde_byte, desde_linea, hasta_byte = pendientes.popleft()
+            if futuro is not None:
+                resultados, desalineado = futuro.result()
+                if not desalineado:
+                    for linea_registro, valores, error in resultados:
+                        if valores is not None:
+                            resultado = (dict(zip(columnas, valores)), None)
+                        else:
+                            resultado = None if error is None else (None, error)
+                        yield linea_registro, resultado, (desde_byte, desde_linea)
+                    continue
+
+            for futuro, *_ in pendientes:
+                if futuro is not None:
+                    futuro.cancel()
+            pendientes.clear()
+            stream.seek(desde_byte)
+            limite = yield from _registros_hasta(stream, parsear, desde_byte, desde_linea, hasta_byte)
+            if limite is None:
+                return
+            enviados, linea = limite
+            stream.seek(enviados)
+            resto = b""
+            leyendo = True
+    finally:
+        for futuro, *_ in pendientes:
+            if futuro is not None:
+                futuro.cancel()
+
+
+def leer_registros(stream, modo, workers=None, desde=(0, 1)):
+    # (línea, resultado, inicio) por registro del archivo desde el límite de
+    # registro desde (byte, línea). inicio es el (byte, línea) de un límite de
+    # registro en el que empieza el registro o uno anterior: retomar desde ahí
+    # vuelve a leerlo. Los archivos grandes (y que se pueden releer) se parsean
+    # en el pool de procesos
+    workers = IMPORT_WORKERS if workers is None else workers
+    if desde[0]:
+        stream.seek(desde[0])
+    if workers > 1 and stream.seekable():
+        inicio = stream.tell()
+        tamano = stream.seek(0, io.SEEK_END) - inicio
+        stream.seek(inicio)
+        if tamano >= IMPORT_PARALELO_MIN_BYTES:
+            return _registros_paralelos(stream, modo, workers, desde=desde)
+    return _registros_secuenciales(stream, MODOS[modo]["parsear"], desde)
+
+
+def _disponible():
+    # Importaciones que un trabajo puede tomar: en cola, fallidas o abandonadas
+    vencida = datetime.utcnow() - timedelta(seconds=IMPORT_ABANDONADA_SEGUNDOS)
+    return or_(
+        Importacion.estado.in_(("en_cola", "fallida")),
+        and_(Importacion.estado == "en_progreso", Importacion.punto_control_at < vencida),
+    )
+
+
+def reclamar(db, importacion):
+    # La pasa a "en_progreso" si ningún otro trabajo la tiene: el UPDATE
+    # condicional decide entre procesos (el segundo espera el bloqueo de la
+    # fila y ya no la encuentra disponible). Devuelve False si no la tomó
+    ahora = datetime.utcnow()
+    tomada = db.execute(
+        update(Importacion)
+        .where(Importacion.id == importacion.id, _disponible())
+        .values(estado="en_progreso", iniciada_at=ahora, punto_control_at=ahora, filas_procesadas=0,
+                bytes_procesados=0)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    db.refresh(importacion)
+    return tomada == 1
+
+
+def preparar_importacion(db, sala_id, modo, hash_, bytes_totales=0, reemplazar=False):
+    if not reemplazar:
+        # El mismo archivo ya se importó completo y el banco no se vació desde
+        # entonces: se registra como completada sin leerlo (todas omitidas)
+        anterior = db.query(Importacion).filter(
+            Importacion.sala_id == sala_id,
+            Importacion.modo == modo,
+            Importacion.hash_contenido == hash_,
+            Importacion.estado == "completada",
+            Importacion.vigente.is_(True),
+        ).order_by(Importacion.id.desc()).first()
+        if anterior:
+            ahora = datetime.utcnow()
+            importacion = Importacion(
+                sala_id=sala_id,
+                modo=modo,
+                hash_contenido=hash_,
+                estado="completada",
+                ultima_fila=anterior.ultima_fila,
+                importadas=anterior.importadas,
+                rechazadas=0,
+                insertadas=0,
+                actualizadas=0,
+                omitidas=anterior.importadas,
+                filas_procesadas=0,
+                bytes_totales=bytes_totales,
+                bytes_procesados=bytes_totales,
+                iniciada_at=ahora,
+                finalizada_at=ahora,
+            )
+            db.add(importacion)
+            db.commit()
+            return importacion, False
+
+    # Reanudar una importación incompleta del mismo archivo en la sala, si existe.
+    # Si la está corriendo otro trabajo (de cualquier proceso) queda como está:
+    # el que llama ve estado "en_progreso" y devuelve ese trabajo
+    importacion = db.query(Importacion).filter(
+        Importacion.sala_id == sala_id,
+        Importacion.modo == modo,
+        Importacion.hash_contenido == hash_,
+        Importacion.estado != "completada",
+    ).order_by(Importacion.id.desc()).first()
+    if importacion:
+        db.execute(
+            update(Importacion)
+            .where(Importacion.id == importacion.id, _disponible())
+            .values(estado="en_cola", error=None, bytes_totales=bytes_totales)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        db.refresh(importacion)
+        return importacion, True
+
+    importacion = Importacion(
+        sala_id=sala_id,
+        modo=modo,
+        hash_contenido=hash_,
+        estado="en_cola",
+        ultima_fila=0,
+        importadas=0,
+        rechazadas=0,
+        bytes_totales=bytes_totales,
+    )
+    db.add(importacion)
+    db.commit()
+    return importacion, False
+
+
+def _guardar_lote(db, importacion, lote, errores, progreso):
+    insertar_lote(db, FilaStaging.__table__, lote)
+    insertar_lote(db, ErrorImportacion.__table__, errores)
+    for campo, valor in progreso.items():
+        setattr(importacion, campo, valor)
+    importacion.punto_control_at = datetime.utcnow()
+    db.commit()  # Punto de control: un reintento retoma desde reanudar_byte
+
+
+def _compartidas(db, sala_id, tablas):
+    # True si alguna otra sala tiene filas en esas tablas
+    return any(db.execute(select(t.c.id).where(t.c.sala_id != sala_id).limit(1)).first() for t in tablas)
+
+
+def vaciar_banco(db, sala_id, modo):
+    # Borra el banco de la sala y sus dependientes dentro de la transacción en
+    # curso y devuelve cuántas preguntas había. En PostgreSQL, si ninguna otra
+    # sala tiene filas en esas tablas se vacían con TRUNCATE (libera las páginas
+    # sin escribir WAL por fila). Con otras salas en las tablas (lo habitual)
+    # basta una lectura sin bloqueos para descartarlo; solo si parece posible
+    # se bloquean las tablas y se vuelve a comprobar, así ninguna otra sala
+    # confirma filas en el medio. Si no, y siempre en SQLite (los triggers de
+    # búsqueda impiden que un DELETE sin WHERE se resuelva como truncado),
+    # DELETE de las filas de la sala.
+    config = MODOS[modo]
+    tablas = config["dependientes"] + [config["tabla"]]
+    registro_respuestas.olvidar_preguntas(db, sala_id, modo)
+    if config["dependientes"]:
+        # Los índices de los jugadores quedan vacíos: también en los otros procesos
+        db.execute(update(Jugador).where(Jugador.sala_id == sala_id).values(version=Jugador.version + 1))
+    # Las importaciones anteriores ya no están en el banco: reenviar el mismo archivo vuelve a cargarlo
+    db.execute(
+        update(Importacion)
+        .where(Importacion.sala_id == sala_id, Importacion.modo == modo, Importacion.estado == "completada")
+        .values(vigente=False)
+    )
+    if db.get_bind().dialect.name == "postgresql" and not _compartidas(db, sala_id, tablas):
+        # El mismo modo que toma TRUNCATE: hasta el commit nadie lee ni escribe las tablas
+        db.execute(text(f"LOCK TABLE {', '.join(t.name for t in tablas)} IN ACCESS EXCLUSIVE MODE"))
+        if not _compartidas(db, sala_id, tablas):
+            total = estadisticas.obtener(db, sala_id, modo)["total"]
+            db.execute(text(f"TRUNCATE TABLE {', '.join(t.name for t in tablas)}"))
+            return total
+
+    borradas = 0
+    for tabla in tablas:
+        borradas = db.execute(delete(tabla).where(tabla.c.sala_id == sala_id)).rowcount
+    return borradas
+
+
+def _fusionar(db, importacion, config, reemplazar):
+    # Pasa las filas de staging a la tabla destino en una sola transacción.
+    # Las frases que ya están en el banco de la sala (mismo hash_frase) no se
+    # duplican: se actualiza la respuesta si cambió y si no se omiten. Si se
+    # actualizó alguna, el contenido nuevo del banco descarta los payloads
+    # guardados en la cache de cada proceso.
+    tabla = config["tabla"]
+    columnas = config["columnas"]
+    sala_id = importacion.sala_id
+    staging = FilaStaging.__table__
+    if reemplazar:
+        # Solo se reemplaza el banco de la sala de la importación
+        vaciar_banco(db, sala_id, importacion.modo)
+
+    de_la_importacion = staging.c.importacion_id == importacion.id
+    filas_archivo = db.execute(select(func.count()).select_from(staging).where(de_la_importacion)).scalar_one()
+    # Si una frase se repite en el archivo vale su última aparición
+    ultimas = select(func.max(staging.c.id)).where(de_la_importacion).group_by(staging.c.hash_frase)
+    actualizadas = db.execute(
+        select(func.count())
+        .select_from(staging)
+        .join(tabla, and_(tabla.c.sala_id == sala_id, tabla.c.hash_frase == staging.c.hash_frase))
+        .where(staging.c.id.in_(ultimas), tabla.c.respuesta != staging.c.respuesta)
+    ).scalar_one()
+
+    origen = select(
+        literal(sala_id),
+        *[staging.c[c] for c in columnas],
+        literal(0),
+    ).where(staging.c.id.in_(ultimas)).order_by(staging.c.id)
+    sentencia = insert_upsert(db, tabla).from_select(["sala_id"] + columnas + ["ronda_respondida"], origen)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=["sala_id", "hash_frase"],
+        set_={c: sentencia.excluded[c] for c in columnas if c not in ("frase", "hash_frase")},
+        where=tabla.c.respuesta != sentencia.excluded.respuesta,
+    )
+    # rowcount cuenta filas insertadas más actualizadas
+    insertadas = db.execute(sentencia).rowcount - actualizadas
+    importacion.insertadas = insertadas
+    importacion.actualizadas = actualizadas
+    importacion.omitidas = filas_archivo - insertadas - actualizadas
+    if reemplazar:
+        estadisticas.fijar(db, sala_id, importacion.modo, total=insertadas, respondidas=0)
+    else:
+        estadisticas.sumar(db, sala_id, importacion.modo, total=insertadas, contenido=actualizadas > 0)
+    db.execute(delete(FilaStaging).where(FilaStaging.importacion_id == importacion.id))
+    importacion.estado = "completada"
+    importacion.finalizada_at = datetime.utcnow()
+    db.commit()
+    activas.invalidar((importacion.modo, sala_id))
+    if reemplazar and config["dependientes"]:
+        activas.invalidar_prefijo("jugador", sala_id)
+    # El banco cambió: descartar los payloads de la sala y precargar los activos
+    cache_preguntas.cache.invalidar(importacion.modo, sala_id)
+    cache_preguntas.calentar(db, importacion.modo, sala_id)
+    db.commit()
+
+
+def procesar_importacion(db, importacion, stream, batch_size=None, reemplazar=False, workers=None):
+    # Devuelve False sin leer el archivo si otro trabajo ya la está corriendo
+    config = MODOS[importacion.modo]
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    if not reclamar(db, importacion):
+        return False
+
+    importacion_id = importacion.id
+    desde_fila = importacion.ultima_fila
+    # Un reintento sigue leyendo desde el punto de control, sin volver a parsear
+    # el archivo: (byte, línea) de un límite de registro y el número del registro
+    # que empieza ahí. Los ya cargados que se relean (del mismo bloque) se saltean
+    corte = (importacion.reanudar_byte or 0, importacion.reanudar_linea or 1)
+    fila_corte = importacion.reanudar_fila or 0
+    # Contadores locales; se vuelcan a la fila de la importación en cada punto de control
+    progreso = {
+        "ultima_fila": desde_fila,
+        "reanudar_byte": corte[0],
+        "reanudar_linea": corte[1],
+        "reanudar_fila": fila_corte,
+        "importadas": importacion.importadas,
+        "rechazadas": importacion.rechazadas,
+        "filas_procesadas": 0,
+        "bytes_procesados": corte[0],
+    }
+    lote = []
+    errores = []
+
+    def rechazar(linea, motivo, contenido):
+        progreso["rechazadas"] += 1
+        if progreso["rechazadas"] <= MAX_ERRORES_REPORTE:
+            errores.append({
+                "importacion_id": importacion_id,
+                "linea": linea,
+                "motivo": motivo,
+                "contenido": contenido,
+            })
+
+    # i cuenta registros (para retomar); linea es la línea del archivo donde empieza
+    registros_archivo = leer_registros(stream, importacion.modo, workers, corte)
+    for i, (linea, resultado, inicio) in enumerate(registros_archivo, fila_corte):
+        if inicio != corte:
+            corte, fila_corte = inicio, i
+        if i == 0:  # Saltar header si existe
+            continue
+        if i <= desde_fila:  # Ya cargada en un intento anterior
+            continue
+        progreso["ultima_fila"] = i
+        progreso["reanudar_byte"], progreso["reanudar_linea"] = corte
+        progreso["reanudar_fila"] = fila_corte
+        progreso["filas_procesadas"] += 1
+        if resultado is None:
+            continue
+        fila, error = resultado
+        if error is not None:
+            rechazar(linea, *error)
+            continue
+
+        fila["importacion_id"] = importacion_id
+        fila["linea"] = linea
+        lote.append(fila)
+
+        if len(lote) >= batch_size:
+            progreso["importadas"] += len(lote)
+            progreso["bytes_procesados"] = corte[0]
+            _guardar_lote(db, importacion, lote, errores, progreso)
+            lote = []
+            errores = []
+
+    # Último lote
+    progreso["importadas"] += len(lote)
+    progreso["bytes_procesados"] = importacion.bytes_totales or corte[0]
+    _guardar_lote(db, importacion, lote, errores, progreso)
+
+    _fusionar(db, importacion, config, reemplazar)
+    return True
+
+
+def importar_csv_stream(db, stream, sala_id, modo, batch_size=None, reemplazar=False):
+    # Importación sincrónica completa (los endpoints usan trabajos en segundo plano)
+    inicio = time.perf_counter()
+    importacion, reanudada = preparar_importacion(db, sala_id, modo, hash_contenido(stream), reemplazar=reemplazar)
+    if importacion.estado != "completada":
+        procesar_importacion(db, importacion, stream, batch_size, reemplazar)
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "importacion_id": importacion.id,
+        "reanudada": reanudada,
+        "importadas": importacion.importadas,
+        "rechazadas": importacion.rechazadas,
+        "insertadas": importacion.insertadas,
+        "actualizadas": importacion.actualizadas,
+        "omitidas": importacion.omitidas,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(importacion.filas_procesadas / segundos, 1) if segundos > 0 else None,
+    }
+
+
+def estado_importacion(importacion):
+    # Progreso, throughput y ETA estimados a partir de los bytes consumidos
+    transcurridos = None
+    filas_por_segundo = None
+    eta_segundos = None
+    progreso = 1.0 if importacion.estado == "completada" else 0.0
+    if importacion.bytes_totales:
+        progreso = max(progreso, min(importacion.bytes_procesados / importacion.bytes_totales, 1.0))
+
+    if importacion.iniciada_at:
+        fin = importacion.finalizada_at or datetime.utcnow()
+        transcurridos = (fin - importacion.iniciada_at).total_seconds()
+        if transcurridos > 0:
+            filas_por_segundo = round(importacion.filas_procesadas / transcurridos, 1)
+            if importacion.estado == "en_progreso" and 0 < progreso < 1:
+                eta_segundos = round(transcurridos * (1 - progreso) / progreso, 1)
+        if importacion.estado == "completada":
+            eta_segundos = 0
+
+    return {
+        "id": importacion.id,
+        "modo": importacion.modo,
+        "estado": importacion.estado,
+        "filas_procesadas": importacion.filas_procesadas,
+        "importadas": importacion.importadas,
+        "rechazadas": importacion.rechazadas,
+        "insertadas": importacion.insertadas,
+        "actualizadas": importacion.actualizadas,
+        "omitidas": importacion.omitidas,
+        "bytes_procesados": importacion.bytes_procesados,
+        "bytes_totales": importacion.bytes_totales,
+        "progreso": round(progreso, 4),
+        "segundos": round(transcurridos, 3) if transcurridos is not None else None,
+        "filas_por_segundo": filas_por_segundo,
+        "eta_segundos": eta_segundos,
+        "error": importacion.error,
+        "errores_url": f"/api/importaciones/{importacion.id}/errores",
+    }
+
+
+def iterar_reporte_errores(db, importacion_id):
+    # CSV descargable con las filas rechazadas
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["linea", "motivo", "contenido"])
+    filas = db.execute(
+        select(ErrorImportacion.linea, ErrorImportacion.motivo, ErrorImportacion.contenido)
+        .where(ErrorImportacion.importacion_id == importacion_id)
+        .order_by(ErrorImportacion.linea)
+        .execution_options(yield_per=1000)
+    )
+    for fila in filas:
+        writer.writerow(fila)
+        if buffer.tell() >= TAMANO_BLOQUE_LECTURA:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,365 @@
+import random
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from .models import Sala, Pregunta, PreguntaAutoevaluacion, PreguntaJugador, Jugador, ContadorPreguntas
+from . import rondas, estadisticas
+
+
+class ConjuntoAleatorio:
+    """Conjunto de ids con alta, baja y elección al azar en O(1).
+
+    Los ids viven en una lista y un dict guarda la posición de cada uno; para
+    quitar se mueve el último elemento al hueco (swap-remove).
+    """
+
+    def __init__(self, ids=()):
+        self._ids = list(ids)
+        self._pos = {id_: i for i, id_ in enumerate(self._ids)}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, id_):
+        return id_ in self._pos
+
+    def __iter__(self):
+        return iter(list(self._ids))
+
+    def agregar(self, id_):
+        if id_ not in self._pos:
+            self._pos[id_] = len(self._ids)
+            self._ids.append(id_)
+
+    def quitar(self, id_):
+        pos = self._pos.pop(id_, None)
+        if pos is None:
+            return False
+        ultimo = self._ids.pop()
+        if pos < len(self._ids):
+            self._ids[pos] = ultimo
+            self._pos[ultimo] = pos
+        return True
+
+    def elegir(self):
+        if not self._ids:
+            return None
+        return self._ids[random.randrange(len(self._ids))]
+
+    def muestra(self, k):
+        # random.sample sobre un range no materializa la lista: O(k)
+        return [self._ids[i] for i in random.sample(range(len(self._ids)), min(k, len(self._ids)))]
+
+
+class ConjuntoActivo:
+    """Preguntas activas de un banco, guardadas como arrays compactos.
+
+    _universo tiene todos los ids del banco ordenados (respondidos o no).
+    _orden es una permutación de posiciones del universo en la que las
+    primeras _activas son las preguntas sin responder, y _lugar es su
+    inversa. Quitar es un intercambio dentro de _orden; contar y elegir al
+    azar son O(1), y reiniciar solo corre el límite de activas (O(1)) e
+    incrementa la generación. Ocupa 24 bytes por pregunta.
+
+    version es la versión del banco en la base que refleja el índice (None
+    si no se conoce): la del contador del banco o la del jugador.
+    """
+
+    def __init__(self, filas=()):
+        # filas: pares (id, respondida)
+        filas = sorted(filas)
+        self._universo = array("q", [id_ for id_, _ in filas])
+        activas = [i for i, (_, respondida) in enumerate(filas) if not respondida]
+        respondidas = [i for i, (_, respondida) in enumerate(filas) if respondida]
+        self._orden = array("q", activas + respondidas)
+        self._lugar = array("q", bytes(8 * len(self._orden)))
+        for i, posicion in enumerate(self._orden):
+            self._lugar[posicion] = i
+        self._activas = len(activas)
+        self.generacion = 0
+        self.version = None
+
+    def __len__(self):
+        return self._activas
+
+    def __contains__(self, id_):
+        posicion = self._posicion(id_)
+        return posicion is not None and self._lugar[posicion] < self._activas
+
+    def __iter__(self):
+        return iter([self._universo[p] for p in self._orden[:self._activas]])
+
+    @property
+    def total(self):
+        return len(self._universo)
+
+    def _posicion(self, id_):
+        posicion = bisect_left(self._universo, id_)
+        if posicion < len(self._universo) and self._universo[posicion] == id_:
+            return posicion
+        return None
+
+    def _intercambiar(self, i, j):
+        pi, pj = self._orden[i], self._orden[j]
+        self._orden[i], self._orden[j] = pj, pi
+        self._lugar[pj], self._lugar[pi] = i, j
+
+    def agregar(self, id_):
+        posicion = self._posicion(id_)
+        if posicion is None:
+            if self._universo and id_ < self._universo[-1]:
+                # Id intermedio (no pasa con ids autoincrementales): rearmar
+                generacion, version = self.generacion, self.version
+                filas = [(i, i not in self) for i in self._universo] + [(id_, False)]
+                self.__init__(filas)
+                self.generacion, self.version = generacion, version
+                return
+            posicion = len(self._universo)
+            self._universo.append(id_)
+            self._orden.append(posicion)
+            self._lugar.append(posicion)
+        if self._lugar[posicion] >= self._activas:
+            self._intercambiar(self._lugar[posicion], self._activas)
+            self._activas += 1
+
+    def quitar(self, id_):
+        posicion = self._posicion(id_)
+        if posicion is None or self._lugar[posicion] >= self._activas:
+            return False
+        self._intercambiar(self._lugar[posicion], self._activas - 1)
+        self._activas -= 1
+        return True
+
+    def reiniciar(self):
+        # Todas vuelven a estar activas sin recorrer nada
+        self._activas = len(self._universo)
+        self.generacion += 1
+
+    def elegir(self):
+        if not self._activas:
+            return None
+        return self._universo[self._orden[random.randrange(self._activas)]]
+
+    def muestra(self, k):
+        return [self._universo[self._orden[i]] for i in random.sample(range(self._activas), min(k, self._activas))]
+
+
+class RegistroIndices:
+    """Índices de preguntas activas por clave: ("clasico", sala_id),
+    ("autoevaluacion", sala_id) o ("jugador", sala_id, jugador_id).
+
+    Se arman todos al iniciar el proceso (reconstruir) y los que falten se
+    cargan de la base la primera vez que se usan; cargar() devuelve pares
+    (id, respondida). Es una guía rápida para elegir y listar preguntas: la
+    base sigue siendo la fuente de verdad y los ids que resultan ya
+    respondidos se descartan al girar.
+
+    Cada índice guarda la versión del banco con la que se cargó. Los cambios
+    de este proceso la avanzan junto con el índice (quitar, reiniciar y seguir
+    reciben la versión que dejó su escritura); si al usarlo la versión de la
+    base es otra, cambió desde otro proceso y el índice se vuelve a cargar.
+    """
+
+    def __init__(self):
+        self._indices = {}
+        self._tocados = None  # Prefijos modificados durante una reconstrucción
+        self._lock = threading.Lock()
+
+    def _tocar(self, prefijo):
+        if self._tocados is not None:
+            self._tocados.append(prefijo)
+
+    def obtener(self, clave, cargar, version=None):
+        # version: la del banco leída de la base antes de usar el índice (None = no verificar)
+        with self._lock:
+            indice = self._indices.get(clave)
+        if indice is None or (version is not None and indice.version != version):
+            nuevo = ConjuntoActivo(cargar())
+            nuevo.version = version
+            with self._lock:
+                actual = self._indices.get(clave)
+                if actual is indice:
+                    if indice is not None:
+                        # Las respuestas leídas con la generación anterior ya están en la carga
+                        nuevo.generacion = indice.generacion + 1
+                    self._indices[clave] = indice = nuevo
+                else:
+                    indice = actual  # Otro hilo lo cargó mientras tanto
+        return indice
+
+    def contiene(self, clave, id_, version=None):
+        # None si el índice no se cargó o quedó atrás de la versión de la base:
+        # no se sabe sin ir a la base
+        with self._lock:
+            indice = self._indices.get(clave)
+            if indice is None or (version is not None and indice.version != version):
+                return None
+            return id_ in indice
+
+    def generacion(self, clave):
+        with self._lock:
+            indice = self._indices.get(clave)
+            return None if indice is None else indice.generacion
+
+    @staticmethod
+    def _seguir(indice, version):
+        # Llamar con el lock tomado. La escritura de este proceso dejó el banco en
+        # version: si el índice estaba en la anterior, ya refleja la base. Si no,
+        # hubo escrituras de otros procesos y queda atrás (se recarga al usarse)
+        if version is not None and indice.version is not None and version == indice.version + 1:
+            indice.version = version
+
+    def seguir(self, clave, version):
+        # Escritura que cambió la versión del banco sin cambiar las activas
+        with self._lock:
+            indice = self._indices.get(clave)
+            if indice is not None:
+                self._seguir(indice, version)
+
+    def quitar(self, clave, id_, generacion=None, version=None):
+        # Con generacion, se ignora si el índice se reinició o recargó después de
+        # leerla (la respuesta es de la ronda anterior o ya está en la carga)
+        with self._lock:
+            self._tocar(clave)
+            indice = self._indices.get(clave)
+            if indice is not None and (generacion is None or indice.generacion == generacion):
+                indice.quitar(id_)
+                self._seguir(indice, version)
+
+    def reiniciar(self, clave, version=None):
+        with self._lock:
+            self._tocar(clave)
+            indice = self._indices.get(clave)
+            if indice is not None:
+                indice.reiniciar()
+                self._seguir(indice, version)
+
+    def iniciar_reconstruccion(self):
+        # Desde acá se anotan las claves que cambian mientras se lee la base
+        with self._lock:
+            self._tocados = []
+
+    def completar(self, indices):
+        # Agrega los índices reconstruidos salvo los que ya se cargaron solos
+        # o cambiaron durante la lectura: esos se cargan de nuevo al usarse
+        with self._lock:
+            tocados, self._tocados = self._tocados or [], None
+            for clave, indice in indices.items():
+                if clave not in self._indices and not any(clave[:len(p)] == p for p in tocados):
+                    self._indices[clave] = indice
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._tocar(clave)
+            self._indices.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._tocar(())
+            self._indices.clear()
+
+    def invalidar_prefijo(self, *prefijo):
+        # Invalida todas las claves que empiezan con el prefijo, p. ej. ("jugador", sala_id)
+        with self._lock:
+            self._tocar(prefijo)
+            for clave in [c for c in self._indices if c[:len(prefijo)] == prefijo]:
+                del self._indices[clave]
+
+    def girar(self, clave, cargar, obtener_pregunta, tamano_muestra, version=None, intentos=5):
+        # Elige una pregunta activa al azar y una muestra de ids para animar la ruleta.
+        # obtener_pregunta(id) devuelve el payload o None si ya no está activa.
+        # Con version el índice está al día con la base antes de elegir; si no se
+        # conoce, un índice vacío o que solo da ids descartados se recarga una vez.
+        for recargar in (False, True):
+            if recargar:
+                self.invalidar(clave)
+            indice = self.obtener(clave, cargar, version)
+            for _ in range(intentos):
+                with self._lock:
+                    pregunta_id = indice.elegir()
+                if pregunta_id is None:
+                    if version is None and not recargar:
+                        break
+                    return None
+                pregunta = obtener_pregunta(pregunta_id)
+                if pregunta is None:
+                    # Respondida o borrada por otro proceso: descartar y reintentar
+                    with self._lock:
+                        indice.quitar(pregunta_id)
+                    continue
+                with self._lock:
+                    muestra = [i for i in indice.muestra(tamano_muestra) if i != pregunta_id]
+                muestra = muestra[:tamano_muestra - 1]
+                posicion = random.randint(0, len(muestra))
+                muestra.insert(posicion, pregunta_id)
+                return {
+                    "pregunta": pregunta,
+                    "muestra": muestra,
+                    "indice": posicion,
+                    "activas": len(indice),
+                }
+        return None
+
+
+# Índices compartidos por los routers del proceso
+activas = RegistroIndices()
+
+MODELOS = {"clasico": Pregunta, "autoevaluacion": PreguntaAutoevaluacion}
+
+
+def version_banco(db, clave):
+    # Versión en la base del banco de un índice (lectura por clave primaria): la
+    # del contador del banco o la del jugador (None si el jugador no existe)
+    if clave[0] == "jugador":
+        _, sala_id, jugador_id = clave
+        return db.query(Jugador.version).filter(Jugador.id == jugador_id, Jugador.sala_id == sala_id).scalar()
+    modo, sala_id = clave
+    return estadisticas.version(db, sala_id, modo)
+
+
+def cargador(db, clave):
+    # Función que lee de la base el universo de un índice: pares (id, respondida)
+    if clave[0] == "jugador":
+        _, sala_id, jugador_id = clave
+        respondida = rondas.respondida(PreguntaJugador.ronda_respondida, sala_id, "jugador")
+        return lambda: db.query(PreguntaJugador.pregunta_id, respondida).filter(
+            PreguntaJugador.sala_id == sala_id, PreguntaJugador.jugador_id == jugador_id
+        ).all()
+    modo, sala_id = clave
+    modelo = MODELOS[modo]
+    respondida = rondas.respondida(modelo.ronda_respondida, sala_id, modo)
+    return lambda: db.query(modelo.id, respondida).filter(modelo.sala_id == sala_id).all()
+
+
+def reconstruir(db, registro=activas):
+    # Arma los índices de todas las salas con una pasada por tabla (al iniciar el proceso).
+    # Las versiones se leen antes que las filas: si algo cambia en el medio, el
+    # índice queda con una versión vieja y se recarga al usarse
+    registro.iniciar_reconstruccion()
+    versiones = {(modo, sala_id): version for sala_id, modo, version in db.query(
+        ContadorPreguntas.sala_id, ContadorPreguntas.modo, ContadorPreguntas.version
+    )}
+    versiones.update({("jugador", sala_id, id_): version for sala_id, id_, version in db.query(
+        Jugador.sala_id, Jugador.id, Jugador.version
+    )})
+    filas = defaultdict(list)
+    for modo, modelo in MODELOS.items():
+        consulta = db.query(modelo.sala_id, modelo.id, modelo.ronda_respondida == rondas.COLUMNAS[modo]).join(
+            Sala, Sala.id == modelo.sala_id
+        ).yield_per(10000)
+        for sala_id, id_, respondida in consulta:
+            filas[(modo, sala_id)].append((id_, respondida))
+    consulta = db.query(
+        PreguntaJugador.sala_id, PreguntaJugador.jugador_id, PreguntaJugador.pregunta_id,
+        PreguntaJugador.ronda_respondida == Sala.ronda_juego,
+    ).join(Sala, Sala.id == PreguntaJugador.sala_id).yield_per(10000)
+    for sala_id, jugador_id, pregunta_id, respondida in consulta:
+        filas[("jugador", sala_id, jugador_id)].append((pregunta_id, respondida))
+    indices = {}
+    for clave, f in filas.items():
+        indices[clave] = ConjuntoActivo(f)
+        indices[clave].version = versiones.get(clave, 0)
+    registro.completar(indices)
+    return len(filas)
@@ -1,29 +1,113 @@
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from .database import engine, get_db, DB_MODO, cerrar_async_engine
+from .asincrono import version_async
+from . import trabajos, metricas, indices, migraciones, registro_respuestas
+from .eventos import canal
 from .routes import preguntas
 from .routes import autoevaluacion
 from .routes import jugadores
+from .routes import importaciones
+from .routes import salas
 
-# Crear las tablas en la base de datos
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Ruleta de Preguntas API", version="1.0.0")
+# El esquema se crea y actualiza con `python -m app.migraciones` antes de
+# levantar los workers. Con MIGRAR_AL_INICIAR=1 lo hace cada proceso al
+# arrancar (cómodo en desarrollo; importar la app no abre conexiones).
+MIGRAR_AL_INICIAR = os.getenv("MIGRAR_AL_INICIAR", "0") == "1"
 
-# Configurar CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  # Origen del frontend
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Respuestas de al menos estos bytes se comprimen si el cliente lo acepta
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1000"))
 
-# Incluir las rutas
-app.include_router(preguntas.router, prefix="/api", tags=["preguntas"])
-app.include_router(autoevaluacion.router, prefix="/api/autoevaluacion", tags=["autoevaluacion"])
-app.include_router(jugadores.router, prefix="/api/jugadores", tags=["jugadores"])
+try:
+    # Brotli es opcional (paquete brotli-asgi): sin él se usa solo gzip
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
-@app.get("/")
-def read_root():
-    return {"message": "API de Ruleta de Preguntas"}
\ No newline at end of file
+def _reconstruir_indices(obtener_db):
+    # En segundo plano: el worker atiende mientras tanto y los índices que se
+    # pidan antes se cargan solos. Sin base disponible quedan para el primer uso.
+    # obtener_db: get_db o su override, para usar la misma base que las rutas
+    try:
+        sesiones = obtener_db()
+        try:
+            indices.reconstruir(next(sesiones))
+        finally:
+            sesiones.close()
+    except Exception:
+        logger.warning("No se pudieron armar los índices de preguntas al iniciar", exc_info=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRAR_AL_INICIAR:
+        await run_in_threadpool(migraciones.migrar, engine)
+    # Índices de preguntas activas armados sin demorar el arranque
+    obtener_db = app.dependency_overrides.get(get_db, get_db)
+    threading.Thread(target=_reconstruir_indices, args=(obtener_db,), name="indices", daemon=True).start()
+    # Con EVENTOS_BACKEND=postgres, escuchar los eventos del juego de todos los workers
+    canal.iniciar()
+    yield
+    canal.cerrar()
+    # Esperar a que terminen las importaciones en curso y escribir los eventos encolados
+    trabajos.cerrar()
+    registro_respuestas.escritor.cerrar()
+    await cerrar_async_engine()
+
+# Routers de la API y su prefijo
+RUTAS = [
+    (preguntas.router, "/api", "preguntas"),
+    (autoevaluacion.router, "/api/autoevaluacion", "autoevaluacion"),
+    (jugadores.router, "/api/jugadores", "jugadores"),
+    (importaciones.router, "/api", "importaciones"),
+    (salas.router, "/api/salas", "salas"),
+]
+
+def crear_app(modo=DB_MODO):
+    if modo not in ("sync", "async"):
+        raise ValueError(f"DB_MODO desconocido: {modo}")
+
+    app = FastAPI(title="Ruleta de Preguntas API", version="1.0.0", lifespan=lifespan)
+
+    # Compresión negociada con Accept-Encoding (br si está disponible, si no gzip).
+    # Va por dentro de CORS y de las métricas, que miden la respuesta completa.
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESION_MIN_BYTES, gzip_fallback=True)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESION_MIN_BYTES)
+
+    # Configurar CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173"],  # Origen del frontend
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Latencia por ruta y sentencias SQL por request, expuestas en /metrics
+    app.add_middleware(metricas.MiddlewareMetricas)
+
+    # Incluir las rutas (en modo async, atendidas con AsyncSession)
+    for router, prefijo, tag in RUTAS:
+        app.include_router(version_async(router) if modo == "async" else router, prefix=prefijo, tags=[tag])
+
+    @app.get("/")
+    def read_root():
+        return {"message": "API de Ruleta de Preguntas"}
+
+    @app.get("/metrics", include_in_schema=False)
+    def exponer_metricas():
+        # Formato de texto de Prometheus
+        return PlainTextResponse(metricas.registro.exponer(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+app = crear_app()
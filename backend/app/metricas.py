@@ -0,0 +1,304 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Requests más lentos que esto (ms) se registran con sus consultas; 0 lo desactiva
+METRICAS_LENTO_MS = float(os.getenv("METRICAS_LENTO_MS", "0"))
+# Veces que una misma sentencia puede repetirse en un request antes de marcarla como N+1
+METRICAS_REPETICIONES_NMAS1 = int(os.getenv("METRICAS_REPETICIONES_NMAS1", "5"))
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)) + "}"
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, valor=1, *etiquetas):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + valor
+
+    def valor(self, *etiquetas):
+        with self._lock:
+            return self._valores.get(etiquetas, 0)
+
+    def exponer(self):
+        with self._lock:
+            valores = dict(self._valores)
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for etiquetas, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}")
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por bucket, suma, cantidad]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def cantidad(self, *etiquetas):
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            return serie[2] if serie else 0
+
+    def exponer(self):
+        with self._lock:
+            series = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        nombres = self.etiquetas + ("le",)
+        for etiquetas, (conteos, suma, cantidad) in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(nombres, etiquetas + (limite,))} {acumulado}")
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(nombres, etiquetas + ('+Inf',))} {cantidad}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {cantidad}")
+        return lineas
+
+
+class Medidor:
+    """Valor leído en el momento de exponer: leer() -> {etiquetas: valor}."""
+
+    def __init__(self, nombre, ayuda, etiquetas, leer):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.leer = leer
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge"]
+        for etiquetas, valor in sorted(self.leer().items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+
+    def agregar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def exponer(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+requests_total = registro.agregar(Contador(
+    "ruleta_http_requests_total", "Requests HTTP atendidos", ("ruta", "metodo", "estado")))
+duracion_request = registro.agregar(Histograma(
+    "ruleta_http_duracion_segundos", "Latencia de los requests HTTP", ("ruta", "metodo")))
+consultas_por_request = registro.agregar(Histograma(
+    "ruleta_db_consultas_por_request", "Sentencias SQL por request", ("ruta",), BUCKETS_CONSULTAS))
+tiempo_db_por_request = registro.agregar(Histograma(
+    "ruleta_db_tiempo_por_request_segundos", "Tiempo en la base por request", ("ruta",)))
+consultas_repetidas = registro.agregar(Contador(
+    "ruleta_db_consultas_repetidas_total",
+    "Requests con una misma sentencia repetida (posible N+1)", ("ruta",)))
+consultas_total = registro.agregar(Contador(
+    "ruleta_db_consultas_total", "Sentencias SQL ejecutadas (incluye trabajos en segundo plano)"))
+consultas_segundos = registro.agregar(Contador(
+    "ruleta_db_consultas_segundos_total", "Tiempo acumulado de las sentencias SQL"))
+espera_pool = registro.agregar(Histograma(
+    "ruleta_db_pool_espera_segundos", "Espera para obtener una conexión del pool", ("engine",)))
+
+_pools = weakref.WeakValueDictionary()  # nombre -> engine instrumentado
+
+
+def _estado_pools(metodo):
+    def leer():
+        valores = {}
+        for nombre, engine in list(_pools.items()):
+            funcion = getattr(engine.pool, metodo, None)
+            if funcion is not None:
+                valores[(nombre,)] = funcion()
+        return valores
+    return leer
+
+
+registro.agregar(Medidor(
+    "ruleta_db_pool_en_uso", "Conexiones prestadas del pool", ("engine",), _estado_pools("checkedout")))
+registro.agregar(Medidor(
+    "ruleta_db_pool_tamano", "Tamaño configurado del pool", ("engine",), _estado_pools("size")))
+registro.agregar(Medidor(
+    "ruleta_db_pool_desborde", "Conexiones por encima del tamaño del pool", ("engine",), _estado_pools("overflow")))
+
+
+class MedicionRequest:
+    """Sentencias y tiempo de base de un request (se comparte con el threadpool vía contextvars)."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos_db = 0.0
+        self.sentencias = Counter()  # sentencia -> veces
+        self.segundos_sentencia = Counter()  # sentencia -> segundos
+
+    def registrar(self, sentencia, segundos):
+        self.consultas += 1
+        self.segundos_db += segundos
+        self.sentencias[sentencia] += 1
+        self.segundos_sentencia[sentencia] += segundos
+
+    def repetidas(self, umbral=None):
+        umbral = umbral or METRICAS_REPETICIONES_NMAS1
+        return {s: n for s, n in self.sentencias.items() if n >= umbral}
+
+
+_medicion = ContextVar("medicion_request", default=None)
+
+
+def _antes_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+
+def _despues_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    inicios = conn.info.get("metricas_inicio")
+    if not inicios:
+        return
+    segundos = time.perf_counter() - inicios.pop()
+    consultas_total.sumar(1)
+    consultas_segundos.sumar(segundos)
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.registrar(sentencia, segundos)
+
+
+def _medir_pool(engine, nombre):
+    # Engine.raw_connection llama a pool.connect(): su duración es la espera por
+    # una conexión libre (o el costo de abrir una nueva)
+    pool = engine.pool
+    conectar = pool.connect
+
+    def connect():
+        inicio = time.perf_counter()
+        try:
+            return conectar()
+        finally:
+            espera_pool.observar(time.perf_counter() - inicio, nombre)
+    pool.connect = connect
+
+
+def instrumentar_engine(engine, nombre="principal"):
+    # Cuenta sentencias y tiempo de base, y mide la espera del pool. Con un
+    # AsyncEngine pasar engine.sync_engine
+    if _pools.get(nombre) is engine:
+        return
+    _pools[nombre] = engine
+    event.listen(engine, "before_cursor_execute", _antes_de_ejecutar)
+    event.listen(engine, "after_cursor_execute", _despues_de_ejecutar)
+    # dispose() reemplaza el pool: volver a envolver el nuevo
+    event.listen(engine, "engine_disposed", lambda e: _medir_pool(e, nombre))
+    _medir_pool(engine, nombre)
+
+
+def _plantilla_ruta(scope):
+    # Ruta con parámetros sin expandir ("/api/preguntas/{pregunta_id}") para
+    # no crear una serie por id
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "sin_ruta"
+    for ruta in getattr(app, "routes", ()):
+        if getattr(ruta, "endpoint", None) is endpoint:
+            return ruta.path
+    return getattr(endpoint, "__name__", "sin_ruta")
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: latencia por ruta y sentencias SQL por request."""
+
+    def __init__(self, app, lento_ms=None):
+        self.app = app
+        self.lento_ms = METRICAS_LENTO_MS if lento_ms is None else lento_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicion = MedicionRequest()
+        token = _medicion.set(medicion)
+        estado = 500
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            segundos = time.perf_counter() - inicio
+            _medicion.reset(token)
+            self._registrar(scope, estado, segundos, medicion)
+
+    def _registrar(self, scope, estado, segundos, medicion):
+        ruta = _plantilla_ruta(scope)
+        metodo = scope["method"]
+        requests_total.sumar(1, ruta, metodo, str(estado))
+        duracion_request.observar(segundos, ruta, metodo)
+        consultas_por_request.observar(medicion.consultas, ruta)
+        tiempo_db_por_request.observar(medicion.segundos_db, ruta)
+
+        repetidas = medicion.repetidas()
+        if repetidas:
+            consultas_repetidas.sumar(1, ruta)
+            sentencia, veces = max(repetidas.items(), key=lambda par: par[1])
+            logger.warning("Posible N+1 en %s %s: %d ejecuciones de %s", metodo, ruta, veces, " ".join(sentencia.split()))
+
+        if self.lento_ms and segundos * 1000 >= self.lento_ms:
+            peores = sorted(medicion.segundos_sentencia.items(), key=lambda par: par[1], reverse=True)[:5]
+            detalle = "; ".join(
+                f"{medicion.sentencias[s]}x {t * 1000:.1f} ms {' '.join(s.split())[:200]}" for s, t in peores
+            )
+            logger.warning(
+                "Request lento %s %s: %.1f ms, %d consultas, %.1f ms en la base. %s",
+                metodo, ruta, segundos * 1000, medicion.consultas, medicion.segundos_db * 1000, detalle,
+            )
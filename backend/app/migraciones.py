@@ -0,0 +1,462 @@
+"""Migraciones del esquema de la base.
+
+Se aplican en un paso explícito, antes de levantar los workers:
+
+    python -m app.migraciones [--database-url URL]
+
+La tabla schema_version guarda las versiones aplicadas; correrlo con la base
+al día es una sola consulta. La primera migración crea un esquema fijo y las
+siguientes lo llevan hasta los modelos actuales, igual en una base nueva que
+en una creada por versiones anteriores de la app (por eso comprueban qué
+columnas existen).
+"""
+import argparse
+import logging
+from datetime import datetime
+
+from sqlalchemy import (
+    MetaData, Table, Column, Index, ForeignKey, Integer, String, Text, Boolean, DateTime, create_engine, inspect,
+    insert, select, update, delete, text, func, bindparam,
+)
+from .database import Base
+from .normalizacion import hash_frase
+from . import models
+
+logger = logging.getLogger(__name__)
+
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String, nullable=False),
+    Column("aplicada_at", DateTime, default=datetime.utcnow),
+)
+
+# Clave del advisory lock de PostgreSQL: dos procesos no migran a la vez
+_CLAVE_LOCK = 7_210_018
+
+# Tablas que existían antes de las salas y las rondas
+_TABLAS_PREGUNTAS = ("preguntas", "preguntas_autoevaluacion", "preguntas_jugadores")
+_TABLAS_ORIGINALES = ("preguntas", "preguntas_autoevaluacion", "jugadores", "preguntas_jugadores")
+
+
+def _columnas(conn, tabla):
+    return {c["name"] for c in inspect(conn).get_columns(tabla)}
+
+
+# Esquema de la versión 1, fijo: las migraciones siguientes lo completan hasta
+# los modelos actuales. No se modifica al cambiar los modelos (eso es una
+# migración nueva)
+_esquema_v1 = MetaData()
+
+Table(
+    "salas", _esquema_v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("nombre", String, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+    Column("ronda_clasico", Integer, default=1, server_default="1", nullable=False),
+    Column("ronda_autoevaluacion", Integer, default=1, server_default="1", nullable=False),
+    Column("ronda_juego", Integer, default=1, server_default="1", nullable=False),
+)
+Table(
+    "preguntas", _esquema_v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sala_id", Integer, ForeignKey("salas.id"), nullable=False),
+    Column("frase", String, nullable=False),
+    Column("respuesta", String, nullable=False),
+    Column("verdadero", Boolean, nullable=False),
+    Column("ronda_respondida", Integer, default=0, server_default="0", nullable=False),
+    Index("ix_preguntas_sala_ronda_id", "sala_id", "ronda_respondida", "id"),
+)
+Table(
+    "preguntas_autoevaluacion", _esquema_v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sala_id", Integer, ForeignKey("salas.id"), nullable=False),
+    Column("frase", String, nullable=False),
+    Column("respuesta", String, nullable=False),
+    Column("ronda_respondida", Integer, default=0, server_default="0", nullable=False),
+    Index("ix_preguntas_autoevaluacion_sala_ronda_id", "sala_id", "ronda_respondida", "id"),
+)
+Table(
+    "jugadores", _esquema_v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sala_id", Integer, ForeignKey("salas.id"), nullable=False, index=True),
+    Column("nombre", String, nullable=False),
+    Column("puntaje", Integer, default=0),
+    Column("consecutivas", Integer, default=0),
+    Column("created_at", DateTime, default=datetime.utcnow),
+)
+Table(
+    "preguntas_jugadores", _esquema_v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sala_id", Integer, ForeignKey("salas.id"), nullable=False, index=True),
+    Column("jugador_id", Integer, ForeignKey("jugadores.id"), nullable=False),
+    Column("pregunta_id", Integer, ForeignKey("preguntas_autoevaluacion.id"), nullable=False),
+    Column("ronda_respondida", Integer, default=0, server_default="0", nullable=False),
+    Index("ix_preguntas_jugadores_jugador_ronda", "jugador_id", "ronda_respondida"),
+)
+Table(
+    "importaciones", _esquema_v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sala_id", Integer, ForeignKey("salas.id"), nullable=False),
+    Column("modo", String, nullable=False),
+    Column("hash_contenido", String(64), nullable=False, index=True),
+    Column("estado", String, nullable=False, default="en_cola"),
+    Column("ultima_fila", Integer, default=0),
+    Column("importadas", Integer, default=0),
+    Column("rechazadas", Integer, default=0),
+    Column("filas_procesadas", Integer, default=0),
+    Column("bytes_totales", Integer, default=0),
+    Column("bytes_procesados", Integer, default=0),
+    Column("error", String, nullable=True),
+    Column("created_at", DateTime, default=datetime.utcnow),
+    Column("iniciada_at", DateTime, nullable=True),
+    Column("finalizada_at", DateTime, nullable=True),
+)
+Table(
+    "importaciones_staging", _esquema_v1,
+    Column("id", Integer, primary_key=True),
+    Column("importacion_id", Integer, ForeignKey("importaciones.id"), nullable=False, index=True),
+    Column("linea", Integer, nullable=False),
+    Column("frase", String, nullable=False),
+    Column("respuesta", String, nullable=False),
+    Column("verdadero", Boolean, nullable=True),
+)
+Table(
+    "importaciones_errores", _esquema_v1,
+    Column("id", Integer, primary_key=True),
+    Column("importacion_id", Integer, ForeignKey("importaciones.id"), nullable=False, index=True),
+    Column("linea", Integer, nullable=False),
+    Column("motivo", String, nullable=False),
+    Column("contenido", String, nullable=False),
+)
+Table(
+    "contadores_preguntas", _esquema_v1,
+    Column("sala_id", Integer, ForeignKey("salas.id"), primary_key=True),
+    Column("modo", String, primary_key=True),
+    Column("total", Integer, nullable=False, default=0),
+    Column("respondidas", Integer, nullable=False, default=0),
+)
+Table(
+    "estado_juego", _esquema_v1,
+    Column("sala_id", Integer, ForeignKey("salas.id"), primary_key=True),
+    Column("turno_actual", Integer, nullable=True),
+    Column("cola_pendientes", Text, nullable=False, default="[]"),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+
+# Índices de las migraciones 5 y 7, fijos como el esquema de la versión 1.
+# Las tablas tienen solo las columnas indexadas (existen desde la migración 1)
+_esquema_indices = MetaData()
+_preguntas_v5 = Table(
+    "preguntas", _esquema_indices, Column("sala_id", Integer), Column("hash_frase", String(64)),
+)
+_preguntas_autoevaluacion_v5 = Table(
+    "preguntas_autoevaluacion", _esquema_indices, Column("sala_id", Integer), Column("hash_frase", String(64)),
+)
+_jugadores_v7 = Table(
+    "jugadores", _esquema_indices, Column("id", Integer), Column("sala_id", Integer), Column("puntaje", Integer),
+)
+_INDICES_V5 = (
+    Index("ux_preguntas_sala_hash_frase", _preguntas_v5.c.sala_id, _preguntas_v5.c.hash_frase, unique=True),
+    Index(
+        "ux_preguntas_autoevaluacion_sala_hash_frase",
+        _preguntas_autoevaluacion_v5.c.sala_id, _preguntas_autoevaluacion_v5.c.hash_frase, unique=True,
+    ),
+)
+_INDICES_V7 = (
+    Index("ix_jugadores_sala_puntaje_id", _jugadores_v7.c.sala_id, _jugadores_v7.c.puntaje.desc(), _jugadores_v7.c.id),
+)
+
+
+def _tablas_base(conn):
+    # Crea las tablas de la versión 1 que falten (en una base anterior a las
+    # salas, las que ya existen las completan las migraciones siguientes)
+    _esquema_v1.create_all(conn)
+
+
+def _salas(conn):
+    # Todo lo anterior a las salas pasa a la sala 1
+    salas = _esquema_v1.tables["salas"]
+    if not conn.execute(select(salas.c.id).where(salas.c.id == 1)).first():
+        conn.execute(insert(salas).values(id=1, nombre="Sala principal"))
+    if conn.dialect.name == "postgresql":
+        # El id se insertó a mano: que la secuencia no lo vuelva a entregar
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('salas', 'id'), (SELECT max(id) FROM salas))"))
+    for tabla in _TABLAS_ORIGINALES:
+        if "sala_id" not in _columnas(conn, tabla):
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN sala_id INTEGER NOT NULL DEFAULT 1 REFERENCES salas(id)"))
+
+
+def _rondas(conn):
+    columnas = _columnas(conn, "salas")
+    for banco in ("clasico", "autoevaluacion", "juego"):
+        if f"ronda_{banco}" not in columnas:
+            conn.execute(text(f"ALTER TABLE salas ADD COLUMN ronda_{banco} INTEGER NOT NULL DEFAULT 1"))
+    for tabla in _TABLAS_PREGUNTAS:
+        columnas = _columnas(conn, tabla)
+        if "ronda_respondida" in columnas:
+            continue
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN ronda_respondida INTEGER NOT NULL DEFAULT 0"))
+        if "respondida" in columnas:
+            # Lo respondido queda respondido en la ronda 1 (la vigente de cada sala)
+            conn.execute(text(f"UPDATE {tabla} SET ronda_respondida = 1 WHERE respondida"))
+            conn.execute(text(f"DROP INDEX IF EXISTS ix_{tabla}_respondida"))
+            conn.execute(text(f"ALTER TABLE {tabla} DROP COLUMN respondida"))
+
+
+def _crear_indices(conn, indices):
+    # Crea los índices que falten en tablas creadas por versiones anteriores.
+    # Las tablas que todavía no existen las crea su migración, con sus índices
+    for indice in indices:
+        if not inspect(conn).has_table(indice.table.name):
+            continue
+        columnas = _columnas(conn, indice.table.name)
+        if all(c.name in columnas for c in indice.columns):
+            indice.create(conn, checkfirst=True)
+
+
+def _indices(conn):
+    # Los de la versión 1: una base anterior a las salas tiene las tablas sin ellos
+    _crear_indices(conn, [indice for tabla in _esquema_v1.sorted_tables for indice in tabla.indexes])
+
+
+def _completar_hashes(conn, tabla, lote=5000):
+    # Calcula hash_frase de las filas que no lo tienen (en Python: la normalización es Unicode),
+    # de a lotes por keyset sobre el id: no carga la tabla entera en memoria
+    sentencia = update(tabla).where(tabla.c.id == bindparam("b_id")).values(hash_frase=bindparam("b_hash"))
+    ultimo = 0
+    while True:
+        filas = conn.execute(
+            select(tabla.c.id, tabla.c.frase)
+            .where(tabla.c.hash_frase.is_(None), tabla.c.id > ultimo)
+            .order_by(tabla.c.id)
+            .limit(lote)
+        ).all()
+        if not filas:
+            return
+        conn.execute(sentencia, [{"b_id": f.id, "b_hash": hash_frase(f.frase)} for f in filas])
+        ultimo = filas[-1].id
+
+
+def _hash_frase(conn):
+    for tabla in (models.Pregunta.__table__, models.PreguntaAutoevaluacion.__table__, models.FilaStaging.__table__):
+        if "hash_frase" not in _columnas(conn, tabla.name):
+            conn.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN hash_frase VARCHAR(64)"))
+        _completar_hashes(conn, tabla)
+
+    # Los bancos pueden tener frases repetidas de importaciones anteriores: queda la primera
+    hubo_repetidas = False
+    for tabla, dependiente in (
+        (models.Pregunta.__table__, None),
+        (models.PreguntaAutoevaluacion.__table__, models.PreguntaJugador.__table__),
+    ):
+        primeras = select(func.min(tabla.c.id)).group_by(tabla.c.sala_id, tabla.c.hash_frase)
+        repetidas = select(tabla.c.id).where(tabla.c.id.not_in(primeras))
+        if dependiente is not None:
+            conn.execute(delete(dependiente).where(dependiente.c.pregunta_id.in_(repetidas)))
+        hubo_repetidas |= conn.execute(delete(tabla).where(tabla.c.id.in_(repetidas))).rowcount > 0
+    if hubo_repetidas:
+        # Los contadores se vuelven a calcular de la tabla al primer uso
+        conn.execute(delete(models.ContadorPreguntas))
+
+    columnas = _columnas(conn, "importaciones")
+    for columna in ("insertadas", "actualizadas", "omitidas"):
+        if columna not in columnas:
+            conn.execute(text(f"ALTER TABLE importaciones ADD COLUMN {columna} INTEGER DEFAULT 0"))
+    if "vigente" not in columnas:
+        conn.execute(text("ALTER TABLE importaciones ADD COLUMN vigente BOOLEAN NOT NULL DEFAULT TRUE"))
+    _crear_indices(conn, _INDICES_V5)
+
+
+def _indice_ranking(conn):
+    _crear_indices(conn, _INDICES_V7)
+
+
+def _respuestas_cliente(conn):
+    models.RespuestaCliente.__table__.create(conn, checkfirst=True)
+
+
+def _version_bancos(conn):
+    if "version" not in _columnas(conn, "contadores_preguntas"):
+        conn.execute(text("ALTER TABLE contadores_preguntas ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+
+# Bancos con búsqueda de texto: frase y respuesta sin distinguir mayúsculas ni acentos
+_TABLAS_BUSQUEDA = ("preguntas", "preguntas_autoevaluacion")
+
+
+def _busqueda_sqlite(conn, tabla):
+    # Tabla FTS5 de contenido externo (lee el texto de la tabla del banco) que
+    # los triggers mantienen al día en cada INSERT, DELETE o cambio de texto,
+    # también en las cargas por INSERT ... SELECT y los upserts de importación
+    fts = f"{tabla}_fts"
+    conn.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5(frase, respuesta, content='{tabla}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    ))
+    insertar = f"INSERT INTO {fts}(rowid, frase, respuesta) VALUES (new.id, new.frase, new.respuesta);"
+    borrar = f"INSERT INTO {fts}({fts}, rowid, frase, respuesta) VALUES ('delete', old.id, old.frase, old.respuesta);"
+    for nombre, evento, cuerpo in (
+        ("ai", "AFTER INSERT", insertar),
+        ("ad", "AFTER DELETE", borrar),
+        ("au", "AFTER UPDATE OF frase, respuesta", borrar + " " + insertar),
+    ):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{nombre}"))
+        conn.execute(text(f"CREATE TRIGGER {fts}_{nombre} {evento} ON {tabla} BEGIN {cuerpo} END"))
+    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def _busqueda_postgres(conn, tabla):
+    # Índice GIN de trigramas sobre el texto sin acentos. unaccent() no es
+    # IMMUTABLE (depende del diccionario configurado): se envuelve en una función
+    # que fija el diccionario para poder indexar la expresión
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+    conn.execute(text(
+        "CREATE OR REPLACE FUNCTION ruleta_unaccent(text) RETURNS text "
+        "AS $$ SELECT public.unaccent('public.unaccent', $1) $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT"
+    ))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_{tabla}_busqueda ON {tabla} "
+        "USING gin (ruleta_unaccent(lower(frase || ' ' || respuesta)) gin_trgm_ops)"
+    ))
+
+
+def _busqueda(conn):
+    for tabla in _TABLAS_BUSQUEDA:
+        if conn.dialect.name == "postgresql":
+            _busqueda_postgres(conn, tabla)
+        else:
+            _busqueda_sqlite(conn, tabla)
+
+
+def _eventos_respuesta(conn):
+    for modelo in (models.EventoRespuesta, models.EstadisticaPregunta, models.EstadisticaJugador):
+        modelo.__table__.create(conn, checkfirst=True)
+
+
+def _version_jugadores(conn):
+    if "version" not in _columnas(conn, "jugadores"):
+        conn.execute(text("ALTER TABLE jugadores ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+
+def _generacion_bancos(conn):
+    if "generacion" not in _columnas(conn, "contadores_preguntas"):
+        conn.execute(text("ALTER TABLE contadores_preguntas ADD COLUMN generacion INTEGER NOT NULL DEFAULT 0"))
+
+
+def _contenido_bancos(conn):
+    if "contenido" not in _columnas(conn, "contadores_preguntas"):
+        conn.execute(text("ALTER TABLE contadores_preguntas ADD COLUMN contenido INTEGER NOT NULL DEFAULT 0"))
+
+
+# Tabla de la migración 14, fija: la migración 15 la quita. salas está solo
+# para resolver la clave foránea (ya existe desde la migración 1)
+_esquema_v14 = MetaData()
+Table("salas", _esquema_v14, Column("id", Integer, primary_key=True))
+_versiones_ranking_v14 = Table(
+    "versiones_ranking", _esquema_v14,
+    Column("sala_id", Integer, ForeignKey("salas.id"), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+
+def _versiones_ranking(conn):
+    _versiones_ranking_v14.create(conn, checkfirst=True)
+
+
+def _sin_versiones_ranking(conn):
+    # Las clasificaciones comparan la versión de cada jugador: una fila por sala
+    # que cada respuesta actualizaba serializaba las respuestas de la sala
+    _versiones_ranking_v14.drop(conn, checkfirst=True)
+
+
+def _reanudar_importaciones(conn):
+    columnas = _columnas(conn, "importaciones")
+    for nombre, defecto in (("reanudar_byte", 0), ("reanudar_linea", 1), ("reanudar_fila", 0)):
+        if nombre not in columnas:
+            conn.execute(text(f"ALTER TABLE importaciones ADD COLUMN {nombre} INTEGER DEFAULT {defecto}"))
+
+
+def _punto_control_importaciones(conn):
+    if "punto_control_at" not in _columnas(conn, "importaciones"):
+        tipo = DateTime().compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE importaciones ADD COLUMN punto_control_at {tipo}"))
+
+
+# (versión, descripción, función): solo se agregan al final
+MIGRACIONES = [
+    (1, "tablas base", _tablas_base),
+    (2, "salas", _salas),
+    (3, "rondas de respuesta", _rondas),
+    (4, "índices", _indices),
+    (5, "hash de frases e importaciones sin duplicados", _hash_frase),
+    (6, "respuestas en lote idempotentes", _respuestas_cliente),
+    (7, "índice del ranking de jugadores", _indice_ranking),
+    (8, "versión de los bancos para ETags", _version_bancos),
+    (9, "búsqueda de texto en los bancos", _busqueda),
+    (10, "registro de respuestas y sus acumulados", _eventos_respuesta),
+    (11, "versión de los jugadores para sus índices", _version_jugadores),
+    (12, "generación de los bancos para los acumulados de respuestas", _generacion_bancos),
+    (13, "versión del contenido de los bancos para la cache de preguntas", _contenido_bancos),
+    (14, "versión del ranking de cada sala", _versiones_ranking),
+    (15, "ranking por versión de cada jugador", _sin_versiones_ranking),
+    (16, "punto de control de las importaciones por byte", _reanudar_importaciones),
+    (17, "trabajos de importación tomados en la base", _punto_control_importaciones),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+def version(conn):
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(select(func.coalesce(func.max(schema_version.c.version), 0))).scalar_one()
+
+
+def migrar(engine):
+    # Aplica las migraciones pendientes, cada una en su transacción. Devuelve las aplicadas.
+    aplicadas = []
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": _CLAVE_LOCK})
+            conn.commit()
+        try:
+            with conn.begin():
+                schema_version.create(conn, checkfirst=True)
+                actual = version(conn)
+            for numero, descripcion, aplicar in MIGRACIONES:
+                if numero <= actual:
+                    continue
+                with conn.begin():
+                    logger.info("Migración %d: %s", numero, descripcion)
+                    aplicar(conn)
+                    conn.execute(insert(schema_version).values(version=numero, descripcion=descripcion))
+                aplicadas.append(numero)
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": _CLAVE_LOCK})
+                conn.commit()
+    return aplicadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes del esquema.")
+    parser.add_argument("--database-url", default=None, help="Por defecto DATABASE_URL")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from .database import engine
+    aplicadas = migrar(engine)
+    print(f"Esquema en la versión {VERSION_ACTUAL}" + (f" (aplicadas: {aplicadas})" if aplicadas else " (sin cambios)"))
+
+
+if __name__ == "__main__":
+    main()
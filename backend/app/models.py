@@ -1,41 +1,202 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index, true
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
+from .normalizacion import hash_frase
+
+def _hash_de_la_frase(contexto):
+    # Valor por defecto de hash_frase en inserts que no lo traen (el importador sí lo trae)
+    return hash_frase(contexto.get_current_parameters()["frase"])
+
+class Sala(Base):
+    __tablename__ = "salas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    nombre = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Ronda vigente de cada banco: reiniciar la incrementa y todo lo respondido
+    # en rondas anteriores vuelve a estar activo
+    ronda_clasico = Column(Integer, default=1, server_default="1", nullable=False)
+    ronda_autoevaluacion = Column(Integer, default=1, server_default="1", nullable=False)
+    ronda_juego = Column(Integer, default=1, server_default="1", nullable=False)
 
 class Pregunta(Base):
     __tablename__ = "preguntas"
+    __table_args__ = (
+        Index("ix_preguntas_sala_ronda_id", "sala_id", "ronda_respondida", "id"),
+        # Una misma frase (normalizada) no se repite en el banco de la sala
+        Index("ux_preguntas_sala_hash_frase", "sala_id", "hash_frase", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    sala_id = Column(Integer, ForeignKey("salas.id"), nullable=False)
     frase = Column(String, nullable=False)
+    hash_frase = Column(String(64), nullable=False, default=_hash_de_la_frase)
     respuesta = Column(String, nullable=False)
     verdadero = Column(Boolean, nullable=False)
-    respondida = Column(Boolean, default=False, index=True)
+    ronda_respondida = Column(Integer, default=0, server_default="0", nullable=False)  # 0 = nunca respondida
 
 class PreguntaAutoevaluacion(Base):
     __tablename__ = "preguntas_autoevaluacion"
+    __table_args__ = (
+        Index("ix_preguntas_autoevaluacion_sala_ronda_id", "sala_id", "ronda_respondida", "id"),
+        Index("ux_preguntas_autoevaluacion_sala_hash_frase", "sala_id", "hash_frase", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    sala_id = Column(Integer, ForeignKey("salas.id"), nullable=False)
     frase = Column(String, nullable=False)
+    hash_frase = Column(String(64), nullable=False, default=_hash_de_la_frase)
     respuesta = Column(String, nullable=False)
-    respondida = Column(Boolean, default=False, index=True)
+    ronda_respondida = Column(Integer, default=0, server_default="0", nullable=False)  # 0 = nunca respondida
 
 class Jugador(Base):
     __tablename__ = "jugadores"
 
     id = Column(Integer, primary_key=True, index=True)
+    sala_id = Column(Integer, ForeignKey("salas.id"), nullable=False, index=True)
     nombre = Column(String, nullable=False)
     puntaje = Column(Integer, default=0)
     consecutivas = Column(Integer, default=0)  # Respuestas correctas consecutivas
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Se incrementa con cada cambio de sus preguntas o su puntaje: versión del
+    # índice de activas del jugador
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+# Ranking de la sala: recorre los jugadores ya ordenados por puntaje
+Index("ix_jugadores_sala_puntaje_id", Jugador.sala_id, Jugador.puntaje.desc(), Jugador.id)
 
 class PreguntaJugador(Base):
     __tablename__ = "preguntas_jugadores"
+    __table_args__ = (
+        Index("ix_preguntas_jugadores_jugador_ronda", "jugador_id", "ronda_respondida"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    sala_id = Column(Integer, ForeignKey("salas.id"), nullable=False, index=True)
     jugador_id = Column(Integer, ForeignKey("jugadores.id"), nullable=False)
     pregunta_id = Column(Integer, ForeignKey("preguntas_autoevaluacion.id"), nullable=False)
-    respondida = Column(Boolean, default=False)
+    ronda_respondida = Column(Integer, default=0, server_default="0", nullable=False)  # 0 = nunca respondida
 
     jugador = relationship("Jugador")
-    pregunta = relationship("PreguntaAutoevaluacion")
\ No newline at end of file
+    pregunta = relationship("PreguntaAutoevaluacion")
+
+class Importacion(Base):
+    __tablename__ = "importaciones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sala_id = Column(Integer, ForeignKey("salas.id"), nullable=False)
+    modo = Column(String, nullable=False)  # "clasico" o "autoevaluacion"
+    hash_contenido = Column(String(64), nullable=False, index=True)
+    estado = Column(String, nullable=False, default="en_cola")  # "en_cola", "en_progreso", "completada" o "fallida"
+    ultima_fila = Column(Integer, default=0)  # Última fila del CSV ya cargada en staging
+    # Punto de control para retomar sin releer el archivo: byte y línea de un
+    # límite de registro y número del registro que empieza ahí
+    reanudar_byte = Column(Integer, default=0)
+    reanudar_linea = Column(Integer, default=1)
+    reanudar_fila = Column(Integer, default=0)
+    importadas = Column(Integer, default=0)  # Filas válidas del archivo
+    rechazadas = Column(Integer, default=0)
+    insertadas = Column(Integer, default=0)  # Preguntas nuevas en el banco
+    actualizadas = Column(Integer, default=0)  # Ya estaban con otra respuesta
+    omitidas = Column(Integer, default=0)  # Ya estaban iguales o repetidas en el archivo
+    vigente = Column(Boolean, nullable=False, default=True, server_default=true())  # False al vaciar el banco
+    filas_procesadas = Column(Integer, default=0)  # Filas leídas en la ejecución actual
+    bytes_totales = Column(Integer, default=0)
+    bytes_procesados = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    iniciada_at = Column(DateTime, nullable=True)
+    punto_control_at = Column(DateTime, nullable=True)  # Último punto de control del trabajo que la corre
+    finalizada_at = Column(DateTime, nullable=True)
+
+class FilaStaging(Base):
+    __tablename__ = "importaciones_staging"
+
+    id = Column(Integer, primary_key=True)
+    importacion_id = Column(Integer, ForeignKey("importaciones.id"), nullable=False, index=True)
+    linea = Column(Integer, nullable=False)
+    frase = Column(String, nullable=False)
+    hash_frase = Column(String(64), nullable=True)
+    respuesta = Column(String, nullable=False)
+    verdadero = Column(Boolean, nullable=True)  # Solo modo clásico
+
+class ErrorImportacion(Base):
+    __tablename__ = "importaciones_errores"
+
+    id = Column(Integer, primary_key=True)
+    importacion_id = Column(Integer, ForeignKey("importaciones.id"), nullable=False, index=True)
+    linea = Column(Integer, nullable=False)
+    motivo = Column(String, nullable=False)
+    contenido = Column(String, nullable=False)
+
+class ContadorPreguntas(Base):
+    __tablename__ = "contadores_preguntas"
+
+    sala_id = Column(Integer, ForeignKey("salas.id"), primary_key=True)
+    modo = Column(String, primary_key=True)  # "clasico" o "autoevaluacion"
+    total = Column(Integer, nullable=False, default=0)
+    respondidas = Column(Integer, nullable=False, default=0)
+    # Se incrementa con cada escritura del banco: ETag de los listados y estadísticas
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Se incrementa cada vez que se vacía el banco: los eventos de respuesta de
+    # una generación anterior no suman a los acumulados (los ids pueden reutilizarse)
+    generacion = Column(Integer, nullable=False, default=0, server_default="0")
+    # Se incrementa cuando puede cambiar el texto de preguntas ya cargadas (una
+    # importación que actualiza respuestas o un banco vaciado): los payloads en
+    # cache de cualquier proceso guardados con otro valor ya no valen
+    contenido = Column(Integer, nullable=False, default=0, server_default="0")
+
+class RespuestaCliente(Base):
+    __tablename__ = "respuestas_cliente"
+
+    # Respuestas enviadas en lote, por el id que les asigna el cliente: un lote
+    # reenviado devuelve los resultados guardados sin volver a aplicarlas
+    sala_id = Column(Integer, ForeignKey("salas.id"), primary_key=True)
+    modo = Column(String, primary_key=True)  # "clasico", "autoevaluacion" o "jugador"
+    id_cliente = Column(String(64), primary_key=True)
+    respondida_en = Column(DateTime, nullable=True)  # Hora del cliente (UTC)
+    recibida_at = Column(DateTime, default=datetime.utcnow, index=True)
+    resultado = Column(Text, nullable=True)  # JSON del resultado devuelto
+
+class EventoRespuesta(Base):
+    __tablename__ = "eventos_respuesta"
+
+    # Un registro por intento de respuesta, solo se agregan filas. Lo escribe un
+    # hilo en lotes después de responder; por eso sala_id no tiene clave foránea
+    # (un lote no falla si la sala se borró mientras tanto). Las estadísticas se
+    # leen de los acumulados, nunca de esta tabla.
+    id = Column(Integer, primary_key=True)
+    sala_id = Column(Integer, nullable=False)
+    modo = Column(String, nullable=False)  # "clasico", "autoevaluacion" o "jugador"
+    pregunta_id = Column(Integer, nullable=False)
+    jugador_id = Column(Integer, nullable=True)
+    correcta = Column(Boolean, nullable=False)
+    respondida_en = Column(DateTime, nullable=False)
+
+class EstadisticaPregunta(Base):
+    __tablename__ = "estadisticas_preguntas"
+
+    # Acumulados de eventos_respuesta por pregunta, sumados en el mismo lote
+    sala_id = Column(Integer, primary_key=True)
+    modo = Column(String, primary_key=True)
+    pregunta_id = Column(Integer, primary_key=True)
+    intentos = Column(Integer, nullable=False, default=0)
+    correctas = Column(Integer, nullable=False, default=0)
+
+class EstadisticaJugador(Base):
+    __tablename__ = "estadisticas_jugadores"
+
+    # Acumulados de eventos_respuesta por jugador (modo "jugador")
+    sala_id = Column(Integer, primary_key=True)
+    jugador_id = Column(Integer, primary_key=True)
+    intentos = Column(Integer, nullable=False, default=0)
+    correctas = Column(Integer, nullable=False, default=0)
+
+class EstadoJuego(Base):
+    __tablename__ = "estado_juego"
+
+    sala_id = Column(Integer, ForeignKey("salas.id"), primary_key=True)
+    turno_actual = Column(Integer, nullable=True)
+    cola_pendientes = Column(Text, nullable=False, default="[]")  # JSON con ids de jugadores
+    version = Column(Integer, nullable=False, default=0)  # Control de concurrencia optimista
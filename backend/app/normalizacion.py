@@ -0,0 +1,25 @@
+import hashlib
+import re
+import unicodedata
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_frase(texto):
+    # Misma pregunta aunque cambien mayúsculas, espacios o la forma Unicode de los acentos
+    return _ESPACIOS.sub(" ", unicodedata.normalize("NFKC", texto).casefold()).strip()
+
+
+def hash_frase(texto):
+    # SHA-256 de la frase normalizada: clave única de la pregunta dentro de la sala
+    return hashlib.sha256(normalizar_frase(texto).encode("utf-8")).hexdigest()
+
+
+# Letras y dígitos: el guion bajo separa palabras, como en el tokenizer de FTS5
+_PALABRAS = re.compile(r"[^\W_]+")
+
+
+def terminos_busqueda(texto):
+    # Palabras de una búsqueda en minúsculas, con sus acentos: cada base les
+    # quita los acentos con las mismas reglas que usa su índice
+    return _PALABRAS.findall(unicodedata.normalize("NFC", texto).lower())
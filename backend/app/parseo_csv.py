@@ -0,0 +1,121 @@
+"""Parseo y validación de las filas del CSV de preguntas.
+
+No depende de la base ni de la app: lo usa la importación en el proceso y
+también los procesos del pool de parseo, que importan solo este módulo.
+"""
+import csv
+import io
+
+from .normalizacion import hash_frase
+
+
+class FilaInvalida(ValueError):
+    """Fila del CSV con contenido que no se puede importar."""
+
+
+def parsear_clasico(pregunta_texto, respuesta_texto):
+    # Extraer frase y determinar si es verdadero/falso
+    primera_palabra = respuesta_texto.split()[0].upper().rstrip('.')
+    if primera_palabra not in ['VERDADERO', 'FALSO']:
+        raise FilaInvalida("Respuesta inválida: debe empezar con VERDADERO o FALSO")
+
+    return {
+        "frase": pregunta_texto,
+        "respuesta": respuesta_texto,
+        "verdadero": primera_palabra == 'VERDADERO',
+    }
+
+
+def parsear_autoevaluacion(pregunta_texto, respuesta_texto):
+    return {
+        "frase": pregunta_texto,
+        "respuesta": respuesta_texto,
+    }
+
+
+PARSERS = {"clasico": parsear_clasico, "autoevaluacion": parsear_autoevaluacion}
+# Columnas de una fila válida de cada modo, en el orden en que viajan desde el pool
+COLUMNAS = {
+    "clasico": ("frase", "hash_frase", "respuesta", "verdadero"),
+    "autoevaluacion": ("frase", "hash_frase", "respuesta"),
+}
+
+
+def validar(parsear, row):
+    # Resultado de un registro: None si está vacío, (fila, None) si es válido
+    # (sin importacion_id ni línea) o (None, (motivo, contenido)) si se rechaza
+    if not row:
+        return None
+    try:
+        if len(row) < 2:
+            raise FilaInvalida("Se esperaban dos columnas: pregunta,respuesta")
+
+        # Formato simple: pregunta,respuesta
+        pregunta_texto = row[0].strip()
+        respuesta_texto = row[1].strip()
+        if not pregunta_texto or not respuesta_texto:
+            raise FilaInvalida("Pregunta o respuesta vacía")
+
+        fila = parsear(pregunta_texto, respuesta_texto)
+    except FilaInvalida as e:
+        return None, (str(e), ",".join(row))
+    fila["hash_frase"] = hash_frase(pregunta_texto)
+    return fila, None
+
+
+def registros(lineas, parsear, primera_linea=1):
+    # (línea donde empieza el registro, resultado) por cada registro del CSV.
+    # line_num del lector cuenta líneas físicas: un campo entre comillas con
+    # saltos de línea no corre la numeración de los registros siguientes
+    lector = csv.reader(lineas)
+    inicio = primera_linea
+    for row in lector:
+        yield inicio, validar(parsear, row)
+        inicio = primera_linea + lector.line_num
+
+
+def cortar_registros(datos):
+    # Posición siguiente al último "\n" de datos que no cae dentro de un campo
+    # entre comillas (hay una cantidad par de comillas antes); -1 si no hay.
+    # Las comillas escapadas ("") no cambian la paridad.
+    comillas = datos.count(b'"')
+    fin = len(datos)
+    posicion = datos.rfind(b"\n")
+    while posicion != -1:
+        comillas -= datos.count(b'"', posicion, fin)
+        if comillas % 2 == 0:
+            return posicion + 1
+        fin = posicion
+        posicion = datos.rfind(b"\n", 0, posicion)
+    return -1
+
+
+def parsear_bloque(modo, datos, primera_linea, final):
+    """Parsea un bloque de bytes del archivo que empieza en un límite de registro.
+
+    Corre en los procesos del pool. Devuelve (resultados, desalineado): una
+    tupla (línea, valores, error) por registro, con los valores de una fila
+    válida en el orden de COLUMNAS (viajan al proceso principal sin las claves
+    de cada dict), y si el bloque terminó dentro de un campo entre comillas (la
+    paridad de comillas falla con una comilla suelta dentro de un campo sin
+    comillas). En ese caso ese tramo se vuelve a parsear en el proceso.
+    """
+    parsear = PARSERS[modo]
+    columnas = COLUMNAS[modo]
+    lector = csv.reader(io.StringIO(datos.decode("utf-8")))
+    resultados = []
+    inicio = primera_linea
+    row = None
+    for row in lector:
+        resultado = validar(parsear, row)
+        if resultado is None:
+            resultados.append((inicio, None, None))
+        elif resultado[1] is not None:
+            resultados.append((inicio, None, resultado[1]))
+        else:
+            resultados.append((inicio, tuple(resultado[0][c] for c in columnas), None))
+        inicio = primera_linea + lector.line_num
+    # Sin comillas abiertas, el "\n" final cierra el último registro; si quedó
+    # dentro de un campo, el lector lo incluye en el valor
+    desalineado = not final and bool(row) and row[-1].endswith("\n")
+    return resultados, desalineado
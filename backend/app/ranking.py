@@ -0,0 +1,197 @@
+import threading
+from bisect import bisect_left, insort
+
+from .models import Jugador
+
+# Máximo de jugadores por pedido de ranking
+MAX_TOP = 1000
+
+
+class Clasificacion:
+    """Jugadores de una sala ordenados por (puntaje DESC, id).
+
+    _orden es una lista ordenada de claves (-puntaje, id): la posición de un
+    jugador es una búsqueda binaria (O(log n)) y moverlo cuando cambia su
+    puntaje es quitar e insertar su clave: búsqueda binaria más un corrimiento
+    de la lista, O(n) pero un memmove de punteros. Los empates se ordenan por
+    id, igual que el índice de la base.
+
+    Cada jugador guarda la versión de su fila (Jugador.version) que reflejan
+    sus datos: un cambio con una versión que no es posterior llegó tarde
+    (otra respuesta concurrente ya se aplicó) y se ignora.
+    """
+
+    def __init__(self, filas=()):
+        # filas: (id, nombre, puntaje, consecutivas, version)
+        self._jugadores = {}
+        self._versiones = {}
+        for id_, nombre, puntaje, consecutivas, version in filas:
+            self._jugadores[id_] = {"id": id_, "nombre": nombre, "puntaje": puntaje or 0, "consecutivas": consecutivas or 0}
+            self._versiones[id_] = version
+        self._orden = sorted((-j["puntaje"], id_) for id_, j in self._jugadores.items())
+
+    def __len__(self):
+        return len(self._orden)
+
+    def _clave(self, id_):
+        return (-self._jugadores[id_]["puntaje"], id_)
+
+    def posicion(self, id_):
+        # 1 para el primero; None si el jugador no está
+        if id_ not in self._jugadores:
+            return None
+        return bisect_left(self._orden, self._clave(id_)) + 1
+
+    def jugador(self, id_):
+        jugador = self._jugadores.get(id_)
+        return None if jugador is None else {**jugador, "posicion": self.posicion(id_)}
+
+    def top(self, n):
+        return [{**self._jugadores[id_], "posicion": i + 1} for i, (_, id_) in enumerate(self._orden[:n])]
+
+    def agregar(self, id_, nombre, puntaje=0, consecutivas=0, version=None):
+        self.quitar(id_)
+        self._jugadores[id_] = {"id": id_, "nombre": nombre, "puntaje": puntaje, "consecutivas": consecutivas}
+        self._versiones[id_] = version
+        insort(self._orden, self._clave(id_))
+
+    def quitar(self, id_):
+        if id_ in self._jugadores:
+            del self._orden[bisect_left(self._orden, self._clave(id_))]
+            del self._jugadores[id_]
+            del self._versiones[id_]
+
+    def diferencias(self, versiones):
+        # (ids con otra versión o que faltan en memoria, ids que ya no están en la sala)
+        cambiados = [id_ for id_, version in versiones.items() if self._versiones.get(id_, -1) != version]
+        return cambiados, [id_ for id_ in self._jugadores if id_ not in versiones]
+
+    def aplicar(self, filas, quitados=()):
+        # filas: (id, nombre, puntaje, consecutivas, version) leídas de la base
+        for id_, nombre, puntaje, consecutivas, version in filas:
+            if id_ in self._jugadores:
+                self.actualizar(id_, puntaje or 0, consecutivas or 0, version)
+            else:
+                self.agregar(id_, nombre, puntaje or 0, consecutivas or 0, version)
+        for id_ in quitados:
+            self.quitar(id_)
+
+    def actualizar(self, id_, puntaje, consecutivas, version=None):
+        # Devuelve (posición anterior, posición nueva); None si el jugador no está.
+        # Con version, un cambio que no es posterior al aplicado deja todo igual
+        jugador = self._jugadores.get(id_)
+        if jugador is None:
+            return None
+        anterior = self.posicion(id_)
+        if version is not None:
+            if self._versiones[id_] is not None and version <= self._versiones[id_]:
+                return anterior, anterior
+            self._versiones[id_] = version
+        if puntaje != jugador["puntaje"]:
+            del self._orden[anterior - 1]
+            jugador["puntaje"] = puntaje
+            insort(self._orden, self._clave(id_))
+        jugador["consecutivas"] = consecutivas
+        return anterior, self.posicion(id_)
+
+
+class RegistroRanking:
+    """Clasificación por sala, cargada de la base la primera vez que se usa.
+
+    Como los índices de preguntas activas, es por proceso. Los cambios de
+    puntaje de este proceso se aplican al responder; los de otros procesos se
+    detectan al leerla comparando Jugador.version de cada jugador de la sala
+    (que toda escritura de puntajes incrementa) con la que tiene en memoria:
+    solo los jugadores que cambiaron se vuelven a leer y se mueven, los que ya
+    no están se quitan y los nuevos se agregan. Si cambió más de la mitad de
+    la sala (iniciar o reiniciar el juego) se carga entera.
+    """
+
+    def __init__(self):
+        self._salas = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, sala_id, cargar, versiones=None):
+        # cargar(ids=None): filas (id, nombre, puntaje, consecutivas, version) de
+        # la sala o de esos jugadores. versiones: {id: Jugador.version} leídas de
+        # la base antes de usarla (None = no verificar)
+        with self._lock:
+            clasificacion = self._salas.get(sala_id)
+            cambiados, quitados = [], []
+            if clasificacion is not None and versiones is not None:
+                cambiados, quitados = clasificacion.diferencias(versiones)
+        if clasificacion is None or len(cambiados) > len(versiones or ()) // 2:
+            nueva = Clasificacion(cargar())
+            with self._lock:
+                actual = self._salas.get(sala_id)
+                if actual is clasificacion:
+                    self._salas[sala_id] = clasificacion = nueva
+                else:
+                    clasificacion = actual  # Otro hilo la cargó mientras tanto
+        elif cambiados or quitados:
+            filas = cargar(cambiados) if cambiados else []
+            with self._lock:
+                clasificacion.aplicar(filas, quitados)
+        return clasificacion
+
+    def top(self, sala_id, cargar, n, versiones=None):
+        clasificacion = self.obtener(sala_id, cargar, versiones)
+        with self._lock:
+            return len(clasificacion), clasificacion.top(n)
+
+    def jugador(self, sala_id, cargar, id_, versiones=None):
+        clasificacion = self.obtener(sala_id, cargar, versiones)
+        with self._lock:
+            return len(clasificacion), clasificacion.jugador(id_)
+
+    def actualizar(self, sala_id, id_, puntaje, consecutivas, version=None):
+        # Delta para los clientes: {"posicion", "posicion_anterior"} o None si la
+        # sala no está cargada en este proceso. version: la que dejó el UPDATE del
+        # puntaje (RETURNING), para no aplicar cambios fuera de orden
+        with self._lock:
+            clasificacion = self._salas.get(sala_id)
+            cambio = None if clasificacion is None else clasificacion.actualizar(id_, puntaje, consecutivas, version)
+        if cambio is None:
+            return None
+        return {"posicion_anterior": cambio[0], "posicion": cambio[1]}
+
+    def agregar(self, sala_id, id_, nombre, version=None):
+        with self._lock:
+            clasificacion = self._salas.get(sala_id)
+            if clasificacion is not None:
+                clasificacion.agregar(id_, nombre, version=version)
+
+    def quitar(self, sala_id, id_):
+        with self._lock:
+            clasificacion = self._salas.get(sala_id)
+            if clasificacion is not None:
+                clasificacion.quitar(id_)
+
+    def invalidar(self, sala_id):
+        with self._lock:
+            self._salas.pop(sala_id, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._salas.clear()
+
+
+# Clasificaciones compartidas por los routers del proceso
+clasificaciones = RegistroRanking()
+
+
+def versiones(db, sala_id):
+    # {id: Jugador.version} de los jugadores de la sala, para detectar los cambios de otros procesos
+    return dict(db.query(Jugador.id, Jugador.version).filter(Jugador.sala_id == sala_id).all())
+
+
+def cargador(db, sala_id):
+    # Sin ids recorre el índice (sala_id, puntaje DESC, id): las filas ya llegan en orden
+    def cargar(ids=None):
+        consulta = db.query(Jugador.id, Jugador.nombre, Jugador.puntaje, Jugador.consecutivas, Jugador.version).filter(
+            Jugador.sala_id == sala_id
+        )
+        if ids is not None:
+            return consulta.filter(Jugador.id.in_(ids)).all()
+        return consulta.order_by(Jugador.puntaje.desc(), Jugador.id).all()
+    return cargar
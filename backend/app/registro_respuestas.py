@@ -0,0 +1,299 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import select, insert, delete, exists, bindparam, func, cast, Float
+from .database import SessionLocal, insert_upsert
+from .metricas import registro, Contador, Medidor
+from .models import (
+    Pregunta, PreguntaAutoevaluacion, Jugador, EventoRespuesta, EstadisticaPregunta, EstadisticaJugador,
+    ContadorPreguntas,
+)
+from . import estadisticas
+
+logger = logging.getLogger(__name__)
+
+# Eventos por lote y segundos que espera un lote incompleto antes de escribirse
+EVENTOS_RESPUESTA_LOTE = int(os.getenv("EVENTOS_RESPUESTA_LOTE", "500"))
+EVENTOS_RESPUESTA_INTERVALO = float(os.getenv("EVENTOS_RESPUESTA_INTERVALO", "1"))
+# Eventos en memoria sin escribir; con la cola llena se descartan (no se frena la respuesta)
+EVENTOS_RESPUESTA_MAX_PENDIENTES = int(os.getenv("EVENTOS_RESPUESTA_MAX_PENDIENTES", "100000"))
+
+# Máximo de filas por pedido de estadísticas
+MAX_ESTADISTICAS = 500
+
+# Banco de cada modo (las preguntas de los jugadores son de autoevaluación)
+BANCOS = {"clasico": Pregunta, "autoevaluacion": PreguntaAutoevaluacion, "jugador": PreguntaAutoevaluacion}
+# Contador (y generación) del banco de cada modo
+CONTADORES = {"clasico": "clasico", "autoevaluacion": "autoevaluacion", "jugador": "autoevaluacion"}
+
+eventos_total = registro.agregar(Contador(
+    "ruleta_eventos_respuesta_total", "Eventos de respuesta registrados", ("resultado",)))
+
+
+class EscritorRespuestas:
+    """Escribe los eventos de respuesta en lotes desde un hilo propio.
+
+    registrar() solo encola: la respuesta al cliente no espera a la base. El
+    hilo junta hasta EVENTOS_RESPUESTA_LOTE eventos (o los que lleguen en
+    EVENTOS_RESPUESTA_INTERVALO segundos) y en una transacción los inserta y
+    suma sus acumulados por pregunta y por jugador, así que los acumulados
+    coinciden con el registro (hasta que se vacía el banco o se borra el
+    jugador, que descartan sus acumulados). Arranca con el primer evento.
+
+    Cada evento lleva la generación del banco y el alta del jugador que leyó
+    la respuesta: los que se escriben después de vaciar el banco o borrar el
+    jugador, desde la cola de cualquier proceso, quedan en el registro pero no
+    suman a los acumulados, sin esperar a que las colas se vacíen.
+    """
+
+    def __init__(self, fabrica=SessionLocal, tamano_lote=EVENTOS_RESPUESTA_LOTE,
+                 intervalo=EVENTOS_RESPUESTA_INTERVALO, max_pendientes=EVENTOS_RESPUESTA_MAX_PENDIENTES):
+        self.fabrica = fabrica
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola = queue.Queue(max_pendientes)
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def registrar(self, sala_id, modo, pregunta_id, correcta, jugador_id=None, respondida_en=None,
+                  generacion=None, alta=None):
+        # generacion: la del banco (estadisticas.generacion) y alta: created_at
+        # del jugador, leídas en la transacción de la respuesta
+        self._iniciar()
+        evento = {
+            "sala_id": sala_id, "modo": modo, "pregunta_id": pregunta_id, "jugador_id": jugador_id,
+            "correcta": bool(correcta), "respondida_en": respondida_en or datetime.utcnow(),
+            "generacion": generacion, "alta": alta,
+        }
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            eventos_total.sumar(1, "descartado")
+
+    def _iniciar(self):
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._correr, name="eventos_respuesta", daemon=True)
+                    self._hilo.start()
+
+    def _correr(self):
+        # En la cola hay eventos (dict), pedidos de vaciado (Event) o None para terminar
+        while True:
+            lote, avisos, fin = [], [], False
+            item = self._cola.get()
+            limite = time.monotonic() + self.intervalo
+            while True:
+                if item is None:
+                    fin = True
+                    break
+                if isinstance(item, threading.Event):
+                    avisos.append(item)
+                    break
+                lote.append(item)
+                if len(lote) >= self.tamano_lote:
+                    break
+                try:
+                    item = self._cola.get(timeout=max(limite - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if lote:
+                self._escribir(lote)
+            for aviso in avisos:
+                aviso.set()
+            if fin:
+                return
+
+    def _escribir(self, lote):
+        db = self.fabrica()
+        try:
+            escribir_lote(db, lote)
+            db.commit()
+            eventos_total.sumar(len(lote), "escrito")
+        except Exception:
+            db.rollback()
+            eventos_total.sumar(len(lote), "descartado")
+            logger.exception("No se pudieron escribir %d eventos de respuesta", len(lote))
+        finally:
+            db.close()
+
+    def vaciar(self, timeout=None):
+        # Espera a que se escriba lo encolado hasta ahora; False si no terminó a
+        # tiempo (timeout cuenta también la espera para entrar en una cola llena)
+        if self._hilo is None:
+            return True
+        limite = None if timeout is None else time.monotonic() + timeout
+        aviso = threading.Event()
+        try:
+            self._cola.put(aviso, timeout=timeout)
+        except queue.Full:
+            return False
+        return aviso.wait(None if limite is None else max(limite - time.monotonic(), 0))
+
+    def cerrar(self):
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo is not None:
+            self._cola.put(None)
+            hilo.join()
+
+
+def _sumar(db, modelo, claves, filas, vigente):
+    # INSERT ... SELECT ... ON CONFLICT que suma a los acumulados existentes las
+    # filas para las que vigente (una condición con parámetros de cada fila) se
+    # cumple en la misma sentencia. Ordenadas por clave: dos procesos que
+    # escriben a la vez toman los bloqueos en el mismo orden
+    columnas = [*claves, "intentos", "correctas"]
+    tabla = modelo.__table__
+    origen = select(*(bindparam(c, type_=tabla.c[c].type) for c in columnas)).where(vigente)
+    sentencia = insert_upsert(db, tabla).from_select(columnas, origen)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=claves,
+        set_={
+            "intentos": modelo.intentos + sentencia.excluded.intentos,
+            "correctas": modelo.correctas + sentencia.excluded.correctas,
+        },
+    )
+    db.execute(sentencia, [
+        {**dict(zip(claves, clave)), **dict(condicion), "intentos": intentos, "correctas": correctas}
+        for (clave, condicion), (intentos, correctas) in sorted(filas.items(), key=lambda f: f[0][0])
+    ])
+
+
+def _acumular(filas, clave, condicion, correcta):
+    # Por clave y por los parámetros de la condición (un lote puede traer
+    # eventos de antes y de después de vaciar el banco)
+    acumulado = filas.setdefault((clave, tuple(sorted(condicion.items()))), [0, 0])
+    acumulado[0] += 1
+    acumulado[1] += correcta
+
+
+def generacion(sala_id, modo):
+    # Subconsulta escalar con la generación vigente del banco del modo, para
+    # leerla en la misma sentencia que responde (NULL si el banco no tiene contador)
+    return select(ContadorPreguntas.generacion).where(
+        ContadorPreguntas.sala_id == sala_id, ContadorPreguntas.modo == CONTADORES[modo]
+    ).scalar_subquery()
+
+
+# Condiciones de _sumar: el banco sigue en la generación del evento y el
+# jugador es el mismo (no fue borrado, ni su id reutilizado)
+_BANCO_VIGENTE = select(ContadorPreguntas.generacion).where(
+    ContadorPreguntas.sala_id == bindparam("sala_id"), ContadorPreguntas.modo == bindparam("contador"),
+).scalar_subquery().is_not_distinct_from(bindparam("generacion"))  # NULL, NULL: el banco sin contador
+_JUGADOR_VIGENTE = exists().where(Jugador.id == bindparam("jugador_id"), Jugador.created_at == bindparam("alta"))
+
+
+def escribir_lote(db, eventos):
+    # Inserta los eventos y suma sus acumulados en la transacción en curso. Los
+    # eventos de una generación anterior del banco (o de un jugador borrado)
+    # quedan en el registro pero no suman. La comparación se hace dentro del
+    # upsert de los acumulados, sin bloquear contadores ni jugadores: las
+    # respuestas que los actualizan mientras tanto no esperan al lote
+    columnas = [c.key for c in EventoRespuesta.__table__.columns if c.key != "id"]
+    db.execute(insert(EventoRespuesta), [{c: e[c] for c in columnas} for e in eventos])
+
+    por_pregunta, por_jugador = {}, {}
+    for evento in eventos:
+        banco = {"contador": CONTADORES[evento["modo"]], "generacion": evento["generacion"]}
+        _acumular(por_pregunta, (evento["sala_id"], evento["modo"], evento["pregunta_id"]), banco, evento["correcta"])
+        if evento["jugador_id"] is not None:
+            _acumular(por_jugador, (evento["sala_id"], evento["jugador_id"]), {"alta": evento["alta"]}, evento["correcta"])
+
+    if por_pregunta:
+        _sumar(db, EstadisticaPregunta, ["sala_id", "modo", "pregunta_id"], por_pregunta, _BANCO_VIGENTE)
+    if por_jugador:
+        _sumar(db, EstadisticaJugador, ["sala_id", "jugador_id"], por_jugador, _JUGADOR_VIGENTE)
+
+
+def _tasa(modelo):
+    return cast(modelo.correctas, Float) / modelo.intentos
+
+
+def _fila(id_, intentos, correctas, **datos):
+    return {
+        "id": id_, **datos, "intentos": intentos, "correctas": correctas, "incorrectas": intentos - correctas,
+        "tasa_acierto": round(correctas / intentos, 4) if intentos else None,
+    }
+
+
+def estadisticas_preguntas(db, sala_id, modo, orden="dificiles", limite=50, min_intentos=1):
+    # Desde los acumulados (clave primaria sala_id, modo, pregunta_id), sin leer
+    # los eventos. "dificiles": menor tasa de acierto primero; "intentos": más intentadas
+    banco = BANCOS[modo]
+    criterios = {
+        "dificiles": (_tasa(EstadisticaPregunta), EstadisticaPregunta.intentos.desc()),
+        "intentos": (EstadisticaPregunta.intentos.desc(),),
+    }[orden]
+    filas = db.execute(
+        select(EstadisticaPregunta.pregunta_id, banco.frase, EstadisticaPregunta.intentos, EstadisticaPregunta.correctas)
+        .join(banco, banco.id == EstadisticaPregunta.pregunta_id)
+        .where(
+            EstadisticaPregunta.sala_id == sala_id,
+            EstadisticaPregunta.modo == modo,
+            EstadisticaPregunta.intentos >= min_intentos,
+        )
+        .order_by(*criterios, EstadisticaPregunta.pregunta_id)
+        .limit(limite)
+    ).all()
+    return {"preguntas": [_fila(f.pregunta_id, f.intentos, f.correctas, frase=f.frase) for f in filas]}
+
+
+def estadisticas_jugadores(db, sala_id):
+    # Todos los jugadores de la sala (los que no respondieron, con 0 intentos),
+    # de mayor a menor tasa de acierto
+    intentos = func.coalesce(EstadisticaJugador.intentos, 0)
+    filas = db.execute(
+        select(Jugador.id, Jugador.nombre, intentos.label("intentos"),
+               func.coalesce(EstadisticaJugador.correctas, 0).label("correctas"))
+        .outerjoin(EstadisticaJugador, (EstadisticaJugador.sala_id == sala_id) & (EstadisticaJugador.jugador_id == Jugador.id))
+        .where(Jugador.sala_id == sala_id)
+        .order_by(_tasa(EstadisticaJugador).desc().nulls_last(), intentos.desc(), Jugador.id)
+    ).all()
+    return {"jugadores": [_fila(f.id, f.intentos, f.correctas, nombre=f.nombre) for f in filas]}
+
+
+def estadisticas_jugador(db, sala_id, jugador_id):
+    # Un jugador por clave primaria; None si no existe
+    fila = db.execute(
+        select(Jugador.id, Jugador.nombre, EstadisticaJugador.intentos, EstadisticaJugador.correctas)
+        .outerjoin(EstadisticaJugador, (EstadisticaJugador.sala_id == sala_id) & (EstadisticaJugador.jugador_id == Jugador.id))
+        .where(Jugador.id == jugador_id, Jugador.sala_id == sala_id)
+    ).first()
+    return None if fila is None else _fila(fila.id, fila.intentos or 0, fila.correctas or 0, nombre=fila.nombre)
+
+
+def olvidar_preguntas(db, sala_id, modo):
+    # Al vaciar un banco sus acumulados dejan de aplicar (los ids pueden reutilizarse).
+    # Los eventos quedan: el registro es histórico. La generación nueva del banco
+    # deja fuera de los acumulados a los eventos todavía encolados en cualquier proceso
+    estadisticas.renovar(db, sala_id, modo)
+    modos = ("autoevaluacion", "jugador") if modo == "autoevaluacion" else (modo,)
+    db.execute(delete(EstadisticaPregunta).where(
+        EstadisticaPregunta.sala_id == sala_id, EstadisticaPregunta.modo.in_(modos)
+    ))
+
+
+def olvidar_jugador(db, sala_id, jugador_id):
+    # Llamar en la transacción que borra al jugador. Su fila se bloquea antes de
+    # borrar los acumulados (el jugador primero, como al responder); los eventos
+    # que se escriban después no lo encuentran y no suman
+    db.execute(select(Jugador.id).where(Jugador.id == jugador_id).with_for_update())
+    db.execute(delete(EstadisticaJugador).where(
+        EstadisticaJugador.sala_id == sala_id, EstadisticaJugador.jugador_id == jugador_id
+    ))
+
+
+# Escritor compartido por los routers del proceso
+escritor = EscritorRespuestas()
+
+registro.agregar(Medidor(
+    "ruleta_eventos_respuesta_pendientes", "Eventos de respuesta encolados sin escribir", (),
+    lambda: {(): escritor.pendientes()}))
@@ -0,0 +1,352 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete, bindparam
+from .database import insert_upsert
+from .indices import activas
+from .estado_juego import almacen
+from .eventos import canal
+from .models import Pregunta, PreguntaAutoevaluacion, PreguntaJugador, Jugador, RespuestaCliente
+from . import estadisticas, rondas, ranking, registro_respuestas
+
+# Máximo de respuestas por lote
+MAX_RESPUESTAS_POR_LOTE = 500
+
+# Días que se guardan los id_cliente ya aplicados (0 = para siempre)
+RESPUESTAS_CLIENTE_DIAS = float(os.getenv("RESPUESTAS_CLIENTE_DIAS", "7"))
+
+# Segundos entre purgas de id_cliente vencidos en este proceso
+_INTERVALO_PURGA = 3600
+_ultima_purga = 0.0
+
+
+def _error(status, detalle):
+    return {"error": {"status": status, "detalle": detalle}}
+
+
+def _utc(momento):
+    # Horas del cliente sin zona horaria se toman como UTC
+    if momento is not None and momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    return momento
+
+
+def _en_orden(items):
+    # Se aplican en el orden en que el cliente respondió; las que no traen hora,
+    # al final y en el orden del lote
+    return sorted(items, key=lambda i: (i.respondida_en is None, _utc(i.respondida_en) or datetime.min))
+
+
+def _purgar(db):
+    global _ultima_purga
+    ahora = time.monotonic()
+    if RESPUESTAS_CLIENTE_DIAS <= 0 or ahora - _ultima_purga < _INTERVALO_PURGA:
+        return
+    _ultima_purga = ahora
+    limite = datetime.utcnow() - timedelta(days=RESPUESTAS_CLIENTE_DIAS)
+    db.execute(delete(RespuestaCliente).where(RespuestaCliente.recibida_at < limite))
+
+
+def _reclamar(db, sala_id, modo, items):
+    # Registra los id_cliente del lote con un INSERT ... ON CONFLICT DO NOTHING.
+    # Devuelve las respuestas a aplicar y los resultados guardados de las que ya
+    # se habían aplicado (lote reenviado); con dos lotes simultáneos que comparten
+    # un id solo uno lo registra, el otro espera y devuelve su resultado.
+    _purgar(db)
+    primeras = {}
+    for item in items:
+        primeras.setdefault(item.id_cliente, item)
+    primeras = list(primeras.values())
+    if not primeras:
+        return [], {}
+    ahora = datetime.utcnow()
+    tabla = RespuestaCliente.__table__
+    nuevos = set(db.execute(
+        insert_upsert(db, tabla)
+        .values([
+            {"sala_id": sala_id, "modo": modo, "id_cliente": i.id_cliente,
+             "respondida_en": _utc(i.respondida_en), "recibida_at": ahora}
+            for i in primeras
+        ])
+        .on_conflict_do_nothing()
+        .returning(tabla.c.id_cliente)
+    ).scalars())
+    previos = {}
+    repetidos = [i.id_cliente for i in primeras if i.id_cliente not in nuevos]
+    if repetidos:
+        for id_cliente, resultado in db.execute(
+            select(RespuestaCliente.id_cliente, RespuestaCliente.resultado).where(
+                RespuestaCliente.sala_id == sala_id,
+                RespuestaCliente.modo == modo,
+                RespuestaCliente.id_cliente.in_(repetidos),
+            )
+        ):
+            previos[id_cliente] = json.loads(resultado) if resultado else _error(409, "Respuesta en proceso")
+    return [i for i in primeras if i.id_cliente in nuevos], previos
+
+
+def _guardar(db, sala_id, modo, resultados):
+    if not resultados:
+        return
+    tabla = RespuestaCliente.__table__
+    db.execute(
+        update(tabla)
+        .where(tabla.c.sala_id == sala_id, tabla.c.modo == modo, tabla.c.id_cliente == bindparam("b_id"))
+        .values(resultado=bindparam("b_resultado")),
+        [{"b_id": id_cliente, "b_resultado": json.dumps(r, ensure_ascii=False)} for id_cliente, r in resultados.items()],
+    )
+
+
+def _salida(items, aplicados, previos):
+    # Resultados en el orden del pedido; los id_cliente repetidos (en el lote o
+    # de un envío anterior) llevan "repetida"
+    salida = []
+    entregados = set()
+    for item in items:
+        if item.id_cliente in aplicados and item.id_cliente not in entregados:
+            resultado = aplicados[item.id_cliente]
+        else:
+            resultado = {**(aplicados.get(item.id_cliente) or previos[item.id_cliente]), "repetida": True}
+        entregados.add(item.id_cliente)
+        salida.append({"id_cliente": item.id_cliente, **resultado})
+    return {
+        "resultados": salida,
+        "aplicadas": len(aplicados),
+        "repetidas": len(items) - len(aplicados),
+    }
+
+
+def _marcar(db, modelo, sala_id, modo, ids):
+    # Un solo UPDATE marca todas las preguntas del lote que siguen activas
+    if not ids:
+        return set()
+    return set(db.execute(
+        update(modelo)
+        .where(modelo.id.in_(ids), modelo.sala_id == sala_id, rondas.activa(modelo.ronda_respondida, sala_id, modo))
+        .values(ronda_respondida=rondas.actual(sala_id, modo))
+        .returning(modelo.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+
+
+def _leer_preguntas(db, modelo, sala_id, modo, ids, *columnas):
+    if not ids:
+        return {}
+    filas = db.execute(
+        select(modelo.id, modelo.respuesta, *columnas,
+               rondas.respondida(modelo.ronda_respondida, sala_id, modo).label("respondida"))
+        .where(modelo.sala_id == sala_id, modelo.id.in_(ids))
+    ).all()
+    return {f.id: f for f in filas}
+
+
+def _responder_banco(db, sala_id, modo, modelo, items, evaluar, columnas=()):
+    # Común a clásico y autoevaluación. evaluar(item, pregunta) devuelve
+    # (acierta, resultado si acierta, resultado si no) o un error.
+    aplicar, previos = _reclamar(db, sala_id, modo, items)
+    clave = (modo, sala_id)
+    preguntas = _leer_preguntas(
+        db, modelo, sala_id, modo, {i.id for i in aplicar},
+        *columnas, registro_respuestas.generacion(sala_id, modo).label("generacion"),
+    )
+    evaluadas = {
+        i.id_cliente: evaluar(i, preguntas[i.id]) if i.id in preguntas else _error(404, "Pregunta no encontrada")
+        for i in aplicar
+    }
+    aciertos = {i.id for i in aplicar if isinstance(evaluadas[i.id_cliente], tuple) and evaluadas[i.id_cliente][0]}
+    generacion = activas.generacion(clave)
+    marcadas = _marcar(db, modelo, sala_id, modo, aciertos)
+
+    # Recorrido en el orden del cliente: el primer acierto sobre una pregunta
+    # activa la responde; lo que llega después la encuentra respondida
+    libres = set(marcadas)
+    aplicados = {}
+    intentos = []  # (item, acierta) de las respuestas que cuentan como intento
+    for item in _en_orden(aplicar):
+        evaluada = evaluadas[item.id_cliente]
+        if not isinstance(evaluada, tuple):
+            aplicados[item.id_cliente] = evaluada
+            continue
+        acierta, si_acierta, si_no = evaluada
+        # Respondida antes del lote, por otro request a la vez o antes en el lote
+        respondida = preguntas[item.id].respondida or (item.id in aciertos and item.id not in libres)
+        if acierta and item.id in libres:
+            libres.discard(item.id)
+            aplicados[item.id_cliente] = si_acierta
+            intentos.append((item, True))
+        elif respondida:
+            aplicados[item.id_cliente] = (
+                {**si_acierta, "ya_respondida": True} if acierta else _error(400, "Pregunta ya respondida")
+            )
+        else:
+            aplicados[item.id_cliente] = si_no
+            intentos.append((item, acierta))
+
+    version = None
+    if marcadas:
+        version = estadisticas.sumar(db, sala_id, modo, respondidas=len(marcadas))
+    _guardar(db, sala_id, modo, aplicados)
+    db.commit()
+    for pregunta_id in marcadas:
+        activas.quitar(clave, pregunta_id, generacion, version)
+    for item, acierta in intentos:
+        registro_respuestas.escritor.registrar(
+            sala_id, modo, item.id, acierta, respondida_en=_utc(item.respondida_en),
+            generacion=preguntas[item.id].generacion,
+        )
+    return _salida(items, aplicados, previos)
+
+
+def responder_clasico(db, sala_id, items):
+    def evaluar(item, pregunta):
+        correcto = (item.respuesta.upper().rstrip('.') == 'VERDADERO') == pregunta.verdadero
+        return (
+            correcto,
+            {"correcto": True, "respuesta_correcta": pregunta.respuesta},
+            {"correcto": False, "respuesta_correcta": pregunta.respuesta},
+        )
+    return _responder_banco(db, sala_id, "clasico", Pregunta, items, evaluar, (Pregunta.verdadero,))
+
+
+def responder_autoevaluacion(db, sala_id, items):
+    def evaluar(item, pregunta):
+        evaluacion = item.evaluacion.lower()
+        if evaluacion not in ("bien", "mal"):
+            return _error(400, "Evaluación debe ser 'bien' o 'mal'")
+        return (
+            evaluacion == "bien",
+            {"evaluacion": evaluacion, "respondida": True, "respuesta_correcta": pregunta.respuesta},
+            {"evaluacion": evaluacion, "respondida": False, "respuesta_correcta": pregunta.respuesta},
+        )
+    return _responder_banco(db, sala_id, "autoevaluacion", PreguntaAutoevaluacion, items, evaluar)
+
+
+def puntos_mal(puntaje_previo):
+    # Un "mal" resta un punto sin bajar de 0: lo que cambió el puntaje, calculado
+    # igual en la ruta individual y en el lote
+    return -1 if puntaje_previo > 0 else 0
+
+
+def responder_jugador(db, sala_id, jugador_id, items):
+    # El puntaje depende del orden (bono por consecutivas): se recorre el lote en
+    # el orden del cliente con el jugador bloqueado y se escribe el resultado una vez
+    aplicar, previos = _reclamar(db, sala_id, "jugador", items)
+    jugador = db.execute(
+        select(
+            Jugador.puntaje, Jugador.consecutivas, Jugador.created_at,
+            registro_respuestas.generacion(sala_id, "jugador").label("generacion"),
+        )
+        .where(Jugador.id == jugador_id, Jugador.sala_id == sala_id)
+        .with_for_update()
+    ).first()
+    if jugador is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Jugador no encontrado")
+
+    clave = ("jugador", sala_id, jugador_id)
+    asignadas = {}
+    ids = {i.pregunta_id for i in aplicar}
+    if ids:
+        asignadas = {f.pregunta_id: f for f in db.execute(
+            select(
+                PreguntaJugador.pregunta_id,
+                PreguntaAutoevaluacion.respuesta,
+                rondas.respondida(PreguntaJugador.ronda_respondida, sala_id, "jugador").label("respondida"),
+            )
+            .join(PreguntaAutoevaluacion, PreguntaAutoevaluacion.id == PreguntaJugador.pregunta_id)
+            .where(
+                PreguntaJugador.sala_id == sala_id,
+                PreguntaJugador.jugador_id == jugador_id,
+                PreguntaJugador.pregunta_id.in_(ids),
+            )
+        )}
+    bien = {i.pregunta_id for i in aplicar if i.evaluacion.lower() == "bien" and i.pregunta_id in asignadas}
+    generacion = activas.generacion(clave)
+    reclamadas = set()
+    if bien:
+        reclamadas = set(db.execute(
+            update(PreguntaJugador)
+            .where(
+                PreguntaJugador.sala_id == sala_id,
+                PreguntaJugador.jugador_id == jugador_id,
+                PreguntaJugador.pregunta_id.in_(bien),
+                rondas.activa(PreguntaJugador.ronda_respondida, sala_id, "jugador"),
+            )
+            .values(ronda_respondida=rondas.actual(sala_id, "jugador"))
+            .returning(PreguntaJugador.pregunta_id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+
+    puntaje, consecutivas = jugador.puntaje or 0, jugador.consecutivas or 0
+    libres = set(reclamadas)
+    aplicados = {}
+    evaluadas = []  # (pregunta_id, evaluacion, puntos, respondida_en) de las que cambiaron el puntaje
+    for item in _en_orden(aplicar):
+        evaluacion = item.evaluacion.lower()
+        asignada = asignadas.get(item.pregunta_id)
+        if evaluacion not in ("bien", "mal"):
+            aplicados[item.id_cliente] = _error(400, "Evaluación debe ser 'bien' o 'mal'")
+            continue
+        if asignada is None:
+            aplicados[item.id_cliente] = _error(404, "Pregunta no asignada a este jugador")
+            continue
+        respondida = asignada.respondida or (item.pregunta_id in bien and item.pregunta_id not in libres)
+        if evaluacion == "bien" and item.pregunta_id in libres:
+            libres.discard(item.pregunta_id)
+            consecutivas += 1
+            puntaje += consecutivas  # 1 + consecutivas previas
+            puntos = consecutivas
+        elif evaluacion == "bien" and respondida:
+            # Reenvío del mismo "bien": sin volver a puntuar
+            aplicados[item.id_cliente] = {
+                "evaluacion": evaluacion, "puntos_ganados": 0, "puntaje_total": puntaje,
+                "consecutivas": consecutivas, "respondida": True, "respuesta_correcta": asignada.respuesta,
+                "ya_respondida": True,
+            }
+            continue
+        elif respondida:
+            aplicados[item.id_cliente] = _error(400, "Pregunta ya respondida")
+            continue
+        else:
+            puntos = puntos_mal(puntaje)
+            puntaje, consecutivas = puntaje + puntos, 0
+        evaluadas.append((item.pregunta_id, evaluacion, puntos, _utc(item.respondida_en)))
+        aplicados[item.id_cliente] = {
+            "evaluacion": evaluacion, "puntos_ganados": puntos, "puntaje_total": puntaje,
+            "consecutivas": consecutivas, "respondida": evaluacion == "bien", "respuesta_correcta": asignada.respuesta,
+        }
+
+    version = None
+    if evaluadas:
+        version = db.execute(
+            update(Jugador).where(Jugador.id == jugador_id, Jugador.sala_id == sala_id)
+            .values(puntaje=puntaje, consecutivas=consecutivas, version=Jugador.version + 1)
+            .returning(Jugador.version)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+    _guardar(db, sala_id, "jugador", aplicados)
+    db.commit()
+    for pregunta_id in reclamadas:
+        activas.quitar(clave, pregunta_id, generacion, version)
+    if version is not None:
+        activas.seguir(clave, version)
+    for pregunta_id, evaluacion, _, respondida_en in evaluadas:
+        registro_respuestas.escritor.registrar(
+            sala_id, "jugador", pregunta_id, evaluacion == "bien", jugador_id, respondida_en,
+            generacion=jugador.generacion, alta=jugador.created_at,
+        )
+
+    if evaluadas:
+        almacen.actualizar_jugador(db, sala_id, jugador_id, puntaje, consecutivas)
+        posicion = ranking.clasificaciones.actualizar(sala_id, jugador_id, puntaje, consecutivas, version)
+        for pregunta_id, evaluacion, puntos, _ in evaluadas:
+            canal.publicar(sala_id, "respuesta_evaluada", jugador_id=jugador_id, pregunta_id=pregunta_id,
+                           evaluacion=evaluacion, puntos_ganados=puntos)
+            if evaluacion == "bien":
+                canal.publicar(sala_id, "pregunta_quitada", jugador_id=jugador_id, pregunta_id=pregunta_id)
+        canal.publicar(sala_id, "puntaje_actualizado", jugador_id=jugador_id,
+                       puntaje=puntaje, consecutivas=consecutivas, **(posicion or {}))
+    return _salida(items, aplicados, previos)
@@ -0,0 +1,30 @@
+from sqlalchemy import select, update
+from .models import Sala
+
+# Columna de Sala con la ronda vigente de cada banco
+COLUMNAS = {
+    "clasico": Sala.ronda_clasico,
+    "autoevaluacion": Sala.ronda_autoevaluacion,
+    "jugador": Sala.ronda_juego,
+}
+
+
+def actual(sala_id, modo):
+    # Subconsulta escalar con la ronda vigente: va dentro de la misma sentencia,
+    # sin una consulta extra por request
+    return select(COLUMNAS[modo]).where(Sala.id == sala_id).scalar_subquery()
+
+
+def respondida(columna, sala_id, modo):
+    # Una pregunta está respondida solo si se respondió en la ronda vigente
+    return columna == actual(sala_id, modo)
+
+
+def activa(columna, sala_id, modo):
+    return columna != actual(sala_id, modo)
+
+
+def avanzar(db, sala_id, modo):
+    # Reinicio del banco actualizando una sola fila, sin tocar las preguntas
+    columna = COLUMNAS[modo]
+    db.execute(update(Sala).where(Sala.id == sala_id).values({columna.key: columna + 1}))
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import update
+from sqlalchemy.orm import Session, sessionmaker
 from ..database import get_db
+from ..asincrono import en_hilo
+from ..salas import get_sala_id
 from ..models import PreguntaAutoevaluacion
-from pydantic import BaseModel
-import csv
-import io
+from ..trabajos import encolar_importacion
+from ..importacion import vaciar_banco
+from ..indices import activas, cargador
+from .. import estadisticas, historial, etags, busqueda, registro_respuestas, cache_preguntas, rondas, respuestas_lote
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
 
 router = APIRouter()
 
@@ -12,110 +20,246 @@ class ResponderAutoevaluacionRequest(BaseModel):
     id: int
     evaluacion: str  # "bien" o "mal"
 
-@router.post("/importar_csv")
-def importar_csv_autoevaluacion(file: UploadFile = File(...), db: Session = Depends(get_db)):
+class RespuestaLoteAutoevaluacion(BaseModel):
+    id_cliente: str = Field(..., min_length=1, max_length=64)
+    id: int
+    evaluacion: str  # "bien" o "mal"
+    respondida_en: Optional[datetime] = None
+
+class ResponderLoteAutoevaluacionRequest(BaseModel):
+    respuestas: List[RespuestaLoteAutoevaluacion]
+
+@router.post("/importar_csv", status_code=202)
+@en_hilo
+def importar_csv_autoevaluacion(
+    file: UploadFile = File(...),
+    batch_size: Optional[int] = Query(None, ge=1, le=100000),
+    reemplazar: bool = Query(False),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="El archivo debe ser un CSV")
 
-    content = file.file.read()
-    text_content = content.decode('utf-8')
-    csv_reader = csv.reader(io.StringIO(text_content))
-    preguntas = []
-    chunk_size = 100  # Procesar en chunks de 100
-
-    for i, row in enumerate(csv_reader):
-        if i == 0:  # Saltar header si existe
-            continue
-        if not row or len(row) < 2:
-            continue
-
-        # Formato simple: pregunta,respuesta
-        pregunta_texto = row[0].strip()
-        respuesta_texto = row[1].strip()
-
-        if not pregunta_texto or not respuesta_texto:
-            continue
-
-        pregunta = PreguntaAutoevaluacion(
-            frase=pregunta_texto,
-            respuesta=respuesta_texto
-        )
-        preguntas.append(pregunta)
-
-        # Procesar en chunks
-        if len(preguntas) >= chunk_size:
-            db.add_all(preguntas)
-            db.commit()
-            preguntas = []  # Reset para siguiente chunk
-
-    # Procesar último chunk
-    if preguntas:
-        db.add_all(preguntas)
-        db.commit()
+    # El parseo y la carga corren en segundo plano; el progreso se consulta en estado_url.
+    # Las filas inválidas no abortan la importación: quedan en el reporte de errores.
+    job_id, reanudada = encolar_importacion(
+        sessionmaker(bind=db.get_bind()), file.file, sala_id, "autoevaluacion", batch_size, reemplazar
+    )
 
-    return {"message": "Preguntas de autoevaluación importadas exitosamente"}
+    return {
+        "message": "Importación de preguntas de autoevaluación en curso",
+        "job_id": job_id,
+        "reanudada": reanudada,
+        "estado_url": f"/api/import_jobs/{job_id}",
+    }
 
 @router.get("/preguntas/activas")
-def get_preguntas_activas_autoevaluacion(db: Session = Depends(get_db)):
-    preguntas = db.query(PreguntaAutoevaluacion.id).filter(PreguntaAutoevaluacion.respondida == False).all()
-    ids = [p.id for p in preguntas]
-    return {"activas": ids}
+@en_hilo
+def get_preguntas_activas_autoevaluacion(
+    request: Request, response: Response, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)
+):
+    # Sin cambios en el banco desde la copia del cliente: 304 sin armar la lista
+    version = estadisticas.version(db, sala_id, "autoevaluacion")
+    no_modificado = etags.no_modificado(request, response, etags.etag("activas", "autoevaluacion", sala_id, version))
+    if no_modificado:
+        return no_modificado
+    # Desde el índice en memoria: sin recorrer el banco en la base. Si otro
+    # proceso cambió el banco (otra versión), se vuelve a cargar
+    clave = ("autoevaluacion", sala_id)
+    return {"activas": sorted(activas.obtener(clave, cargador(db, clave), version))}
 
 @router.get("/preguntas/respondidas")
-def get_preguntas_respondidas_autoevaluacion(db: Session = Depends(get_db)):
-    preguntas = db.query(PreguntaAutoevaluacion.frase, PreguntaAutoevaluacion.respuesta).filter(PreguntaAutoevaluacion.respondida == True).all()
-    return {"respondidas": [{"frase": p.frase, "respuesta": p.respuesta} for p in preguntas]}
+def get_preguntas_respondidas_autoevaluacion(
+    request: Request,
+    response: Response,
+    despues_de: Optional[int] = Query(None, description="Último id de la página anterior"),
+    limite: int = Query(historial.LIMITE_POR_DEFECTO, ge=1, le=historial.LIMITE_MAXIMO),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    version = estadisticas.version(db, sala_id, "autoevaluacion")
+    valor = etags.etag("respondidas", "autoevaluacion", sala_id, version, despues_de or 0, limite)
+    no_modificado = etags.no_modificado(request, response, valor)
+    if no_modificado:
+        return no_modificado
+    return historial.pagina_respondidas(db, "autoevaluacion", sala_id, despues_de, limite)
 
-@router.get("/preguntas/{pregunta_id}")
-def get_pregunta_autoevaluacion(pregunta_id: int, db: Session = Depends(get_db)):
-    pregunta = db.query(PreguntaAutoevaluacion).filter(PreguntaAutoevaluacion.id == pregunta_id).first()
-    if not pregunta:
-        raise HTTPException(status_code=404, detail="Pregunta no encontrada")
-    if pregunta.respondida:
-        raise HTTPException(status_code=400, detail="Pregunta ya respondida")
+@router.get("/preguntas/respondidas/exportar")
+@en_hilo
+def exportar_preguntas_respondidas_autoevaluacion(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    return StreamingResponse(
+        historial.iterar_respondidas_ndjson(db, "autoevaluacion", sala_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="autoevaluacion_respondidas_{sala_id}.ndjson"'},
+    )
+
+@router.post("/preguntas/girar")
+@en_hilo
+def girar_pregunta_autoevaluacion(muestra: int = Query(12, ge=1, le=100), sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    def obtener_pregunta(pregunta_id):
+        pregunta = db.query(PreguntaAutoevaluacion.id, PreguntaAutoevaluacion.frase, PreguntaAutoevaluacion.respuesta).filter(
+            PreguntaAutoevaluacion.id == pregunta_id, PreguntaAutoevaluacion.sala_id == sala_id,
+            rondas.activa(PreguntaAutoevaluacion.ronda_respondida, sala_id, "autoevaluacion")
+        ).first()
+        if not pregunta:
+            return None
+        return {"id": pregunta.id, "frase": pregunta.frase, "respuesta": pregunta.respuesta}
 
+    clave = ("autoevaluacion", sala_id)
+    version = estadisticas.version(db, sala_id, "autoevaluacion")
+    resultado = activas.girar(clave, cargador(db, clave), obtener_pregunta, muestra, version)
+    if resultado is None:
+        raise HTTPException(status_code=400, detail="No hay preguntas activas")
+    return resultado
+
+@router.get("/preguntas")
+def get_preguntas_autoevaluacion(
+    ids: str = Query(..., description="Ids separados por coma, p. ej. 3,8,15"),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Pedido en lote para que la ruleta precargue los próximos candidatos
+    try:
+        pedidos = list(dict.fromkeys(int(id_) for id_ in ids.split(",") if id_.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros separados por coma")
+    if len(pedidos) > cache_preguntas.MAX_IDS_POR_PEDIDO:
+        raise HTTPException(status_code=400, detail=f"Máximo {cache_preguntas.MAX_IDS_POR_PEDIDO} ids por pedido")
+
+    encontradas, respondidas, inexistentes = cache_preguntas.obtener_activas(db, "autoevaluacion", sala_id, pedidos)
     return {
-        "id": pregunta.id,
-        "frase": pregunta.frase,
-        "respuesta": pregunta.respuesta
+        "preguntas": [encontradas[id_] for id_ in pedidos if id_ in encontradas],
+        "no_disponibles": [id_ for id_ in pedidos if id_ in respondidas or id_ in inexistentes],
     }
 
+@router.get("/preguntas/buscar")
+def buscar_preguntas_autoevaluacion(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras a buscar en la frase o la respuesta"),
+    despues_de: Optional[int] = Query(None, description="Último id de la página anterior"),
+    limite: int = Query(historial.LIMITE_POR_DEFECTO, ge=1, le=historial.LIMITE_MAXIMO),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Índice de texto (FTS5 en SQLite, trigramas en PostgreSQL): sin recorrer el banco
+    version = estadisticas.version(db, sala_id, "autoevaluacion")
+    valor = etags.etag("buscar", "autoevaluacion", sala_id, version, busqueda.clave(q), despues_de or 0, limite)
+    no_modificado = etags.no_modificado(request, response, valor)
+    if no_modificado:
+        return no_modificado
+    return busqueda.buscar(db, "autoevaluacion", sala_id, q, despues_de, limite)
+
+@router.get("/preguntas/{pregunta_id}")
+def get_pregunta_autoevaluacion(pregunta_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    encontradas, respondidas, _ = cache_preguntas.obtener_activas(db, "autoevaluacion", sala_id, [pregunta_id])
+    if pregunta_id in respondidas:
+        raise HTTPException(status_code=400, detail="Pregunta ya respondida")
+    if pregunta_id not in encontradas:
+        raise HTTPException(status_code=404, detail="Pregunta no encontrada")
+    return encontradas[pregunta_id]
+
 @router.post("/preguntas/responder")
-def responder_pregunta_autoevaluacion(data: ResponderAutoevaluacionRequest, db: Session = Depends(get_db)):
+def responder_pregunta_autoevaluacion(data: ResponderAutoevaluacionRequest, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
     pregunta_id = data.id
     evaluacion = data.evaluacion.lower()
 
     if evaluacion not in ["bien", "mal"]:
         raise HTTPException(status_code=400, detail="Evaluación debe ser 'bien' o 'mal'")
 
-    pregunta = db.query(PreguntaAutoevaluacion).filter(PreguntaAutoevaluacion.id == pregunta_id).first()
+    # Solo marcar como respondida si evaluó como "bien", con un UPDATE condicional:
+    # de dos envíos simultáneos solo uno la marca y suma a las estadísticas
+    if evaluacion == "bien":
+        generacion = activas.generacion(("autoevaluacion", sala_id))
+        marcada = db.execute(
+            update(PreguntaAutoevaluacion)
+            .where(
+                PreguntaAutoevaluacion.id == pregunta_id,
+                PreguntaAutoevaluacion.sala_id == sala_id,
+                rondas.activa(PreguntaAutoevaluacion.ronda_respondida, sala_id, "autoevaluacion"),
+            )
+            .values(ronda_respondida=rondas.actual(sala_id, "autoevaluacion"))
+            .returning(
+                PreguntaAutoevaluacion.respuesta,
+                registro_respuestas.generacion(sala_id, "autoevaluacion").label("generacion"),
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+        if marcada:
+            version = estadisticas.sumar(db, sala_id, "autoevaluacion", respondidas=1)
+            db.commit()
+            activas.quitar(("autoevaluacion", sala_id), pregunta_id, generacion, version)
+            registro_respuestas.escritor.registrar(sala_id, "autoevaluacion", pregunta_id, True, generacion=marcada.generacion)
+            return {"evaluacion": evaluacion, "respondida": True, "respuesta_correcta": marcada.respuesta}
+
+    pregunta = db.query(
+        PreguntaAutoevaluacion.respuesta,
+        rondas.respondida(PreguntaAutoevaluacion.ronda_respondida, sala_id, "autoevaluacion").label("respondida"),
+        registro_respuestas.generacion(sala_id, "autoevaluacion").label("generacion"),
+    ).filter(
+        PreguntaAutoevaluacion.id == pregunta_id, PreguntaAutoevaluacion.sala_id == sala_id
+    ).first()
+    db.commit()
     if not pregunta:
         raise HTTPException(status_code=404, detail="Pregunta no encontrada")
     if pregunta.respondida:
+        # Reenvío de un "bien" ya registrado: misma respuesta, sin volver a contarlo
+        if evaluacion == "bien":
+            return {"evaluacion": evaluacion, "respondida": True, "respuesta_correcta": pregunta.respuesta, "ya_respondida": True}
         raise HTTPException(status_code=400, detail="Pregunta ya respondida")
 
-    # Solo marcar como respondida si evaluó como "bien"
-    if evaluacion == "bien":
-        pregunta.respondida = True
-        db.commit()
+    registro_respuestas.escritor.registrar(
+        sala_id, "autoevaluacion", pregunta_id, evaluacion == "bien", generacion=pregunta.generacion
+    )
+    return {"evaluacion": evaluacion, "respondida": False, "respuesta_correcta": pregunta.respuesta}
+
+@router.post("/preguntas/responder_lote")
+def responder_preguntas_lote_autoevaluacion(
+    data: ResponderLoteAutoevaluacionRequest, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)
+):
+    if len(data.respuestas) > respuestas_lote.MAX_RESPUESTAS_POR_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {respuestas_lote.MAX_RESPUESTAS_POR_LOTE} respuestas por lote")
+    return respuestas_lote.responder_autoevaluacion(db, sala_id, data.respuestas)
 
-    return {"evaluacion": evaluacion, "respondida": pregunta.respondida, "respuesta_correcta": pregunta.respuesta}
+@router.get("/estadisticas/preguntas")
+def estadisticas_preguntas_autoevaluacion(
+    orden: str = Query("dificiles", pattern="^(dificiles|intentos)$"),
+    limite: int = Query(50, ge=1, le=registro_respuestas.MAX_ESTADISTICAS),
+    min_intentos: int = Query(1, ge=1),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Intentos y aciertos por pregunta desde los acumulados, sin leer los eventos
+    return registro_respuestas.estadisticas_preguntas(db, sala_id, "autoevaluacion", orden, limite, min_intentos)
 
 @router.post("/reiniciar_preguntas")
-def reiniciar_preguntas_autoevaluacion(db: Session = Depends(get_db)):
-    db.query(PreguntaAutoevaluacion).update({"respondida": False})
+def reiniciar_preguntas_autoevaluacion(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    # Nueva ronda: una sola fila actualizada en vez de todo el banco
+    rondas.avanzar(db, sala_id, "autoevaluacion")
+    version = estadisticas.fijar(db, sala_id, "autoevaluacion", respondidas=0)
     db.commit()
+    # Las mismas preguntas vuelven a estar activas: O(1), sin recargar el índice
+    activas.reiniciar(("autoevaluacion", sala_id), version)
     return {"message": "Todas las preguntas de autoevaluación han sido reiniciadas"}
 
 @router.delete("/eliminar_todas_preguntas")
-def eliminar_todas_preguntas_autoevaluacion(db: Session = Depends(get_db)):
-    count = db.query(PreguntaAutoevaluacion).delete()
+def eliminar_todas_preguntas_autoevaluacion(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    count = vaciar_banco(db, sala_id, "autoevaluacion")
+    estadisticas.fijar(db, sala_id, "autoevaluacion", total=0, respondidas=0)
     db.commit()
+    activas.invalidar(("autoevaluacion", sala_id))
+    activas.invalidar_prefijo("jugador", sala_id)
+    cache_preguntas.cache.invalidar("autoevaluacion", sala_id)
     return {"message": f"Se eliminaron {count} preguntas de autoevaluación"}
 
 @router.get("/contar_preguntas")
-def contar_preguntas_autoevaluacion(db: Session = Depends(get_db)):
-    total = db.query(PreguntaAutoevaluacion).count()
-    activas = db.query(PreguntaAutoevaluacion).filter(PreguntaAutoevaluacion.respondida == False).count()
-    respondidas = db.query(PreguntaAutoevaluacion).filter(PreguntaAutoevaluacion.respondida == True).count()
-    return {"total": total, "activas": activas, "respondidas": respondidas}
\ No newline at end of file
+def contar_preguntas_autoevaluacion(
+    request: Request, response: Response, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)
+):
+    # Contadores mantenidos en cada escritura: lectura O(1), sin recorrer la tabla.
+    # Con la cache de estadísticas y la sala ya verificada (SALAS_CACHE_TTL), el
+    # 304 no consulta la base.
+    version, conteo = estadisticas.obtener_con_version(db, sala_id, "autoevaluacion")
+    no_modificado = etags.no_modificado(request, response, etags.etag("contar", "autoevaluacion", sala_id, version))
+    return no_modificado or conteo
\ No newline at end of file
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..asincrono import en_hilo
+from ..models import Importacion
+from ..importacion import iterar_reporte_errores, estado_importacion
+
+router = APIRouter()
+
+@router.get("/import_jobs/{job_id}")
+def obtener_import_job(job_id: int, db: Session = Depends(get_db)):
+    importacion = db.query(Importacion).filter(Importacion.id == job_id).first()
+    if not importacion:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+
+    return estado_importacion(importacion)
+
+@router.get("/importaciones/{importacion_id}/errores")
+@en_hilo
+def descargar_errores_importacion(importacion_id: int, db: Session = Depends(get_db)):
+    existe = db.query(Importacion.id).filter(Importacion.id == importacion_id).first()
+    if not existe:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+
+    return StreamingResponse(
+        iterar_reporte_errores(db, importacion_id),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="errores_importacion_{importacion_id}.csv"'},
+    )
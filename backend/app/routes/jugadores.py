@@ -1,10 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select, update, exists, func, literal
 from sqlalchemy.orm import Session
 from ..database import get_db
+from ..asincrono import en_hilo
+from ..salas import get_sala_id, sala_existe, SALA_POR_DEFECTO
 from ..models import Jugador, PreguntaJugador, PreguntaAutoevaluacion
-from pydantic import BaseModel
-from typing import List, Optional
-import random
+from ..indices import activas, cargador, version_banco
+from ..estado_juego import almacen
+from ..eventos import canal
+from .. import rondas, respuestas_lote, ranking, etags, registro_respuestas
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
 
 router = APIRouter()
 
@@ -14,47 +24,47 @@ class CrearJugadorRequest(BaseModel):
 class ResponderPreguntaRequest(BaseModel):
     evaluacion: str  # "bien" o "mal"
 
-class EstadoJuego(BaseModel):
-    jugadores: List[dict]
-    turno_actual: Optional[int] = None
-    cola_pendientes: List[int] = []
+class RespuestaLoteJugador(BaseModel):
+    id_cliente: str = Field(..., min_length=1, max_length=64)
+    pregunta_id: int
+    evaluacion: str  # "bien" o "mal"
+    respondida_en: Optional[datetime] = None
 
-# Estado del juego en memoria (para simplificar, en producción usar Redis o DB)
-estado_juego = EstadoJuego(jugadores=[], turno_actual=None, cola_pendientes=[])
+class ResponderLoteJugadorRequest(BaseModel):
+    respuestas: List[RespuestaLoteJugador]
 
 @router.post("/")
-def crear_jugador(data: CrearJugadorRequest, db: Session = Depends(get_db)):
+def crear_jugador(data: CrearJugadorRequest, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
     if not data.nombre.strip():
         raise HTTPException(status_code=400, detail="Nombre no puede estar vacío")
 
-    # Verificar si ya existe
-    existente = db.query(Jugador).filter(Jugador.nombre == data.nombre.strip()).first()
+    # Verificar si ya existe en la sala
+    existente = db.query(Jugador).filter(Jugador.sala_id == sala_id, Jugador.nombre == data.nombre.strip()).first()
     if existente:
         raise HTTPException(status_code=400, detail="Ya existe un jugador con ese nombre")
 
-    jugador = Jugador(nombre=data.nombre.strip())
+    jugador = Jugador(sala_id=sala_id, nombre=data.nombre.strip())
     db.add(jugador)
     db.commit()
     db.refresh(jugador)
 
-    # Actualizar estado en memoria
-    estado_juego.jugadores.append({
-        "id": jugador.id,
-        "nombre": jugador.nombre,
-        "puntaje": jugador.puntaje,
-        "consecutivas": jugador.consecutivas
-    })
-
-    return {
+    respuesta = {
         "id": jugador.id,
         "nombre": jugador.nombre,
         "puntaje": jugador.puntaje,
         "consecutivas": jugador.consecutivas
     }
 
+    # Actualizar estado del juego
+    ranking.clasificaciones.agregar(sala_id, jugador.id, jugador.nombre, jugador.version)
+    almacen.agregar_jugador(db, sala_id, respuesta)
+    canal.publicar(sala_id, "jugador_agregado", jugador=respuesta)
+
+    return respuesta
+
 @router.get("/")
-def listar_jugadores(db: Session = Depends(get_db)):
-    jugadores = db.query(Jugador).all()
+def listar_jugadores(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    jugadores = db.query(Jugador).filter(Jugador.sala_id == sala_id).all()
     return [{
         "id": j.id,
         "nombre": j.nombre,
@@ -63,28 +73,74 @@ def listar_jugadores(db: Session = Depends(get_db)):
     } for j in jugadores]
 
 @router.delete("/{jugador_id}")
-def eliminar_jugador(jugador_id: int, db: Session = Depends(get_db)):
-    jugador = db.query(Jugador).filter(Jugador.id == jugador_id).first()
+def eliminar_jugador(jugador_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    jugador = db.query(Jugador).filter(Jugador.id == jugador_id, Jugador.sala_id == sala_id).first()
     if not jugador:
         raise HTTPException(status_code=404, detail="Jugador no encontrado")
 
-    # Eliminar preguntas asignadas
+    # Eliminar preguntas asignadas y sus estadísticas
+    registro_respuestas.olvidar_jugador(db, sala_id, jugador_id)
     db.query(PreguntaJugador).filter(PreguntaJugador.jugador_id == jugador_id).delete()
 
     db.delete(jugador)
     db.commit()
+    activas.invalidar(("jugador", sala_id, jugador_id))
+    ranking.clasificaciones.quitar(sala_id, jugador_id)
 
-    # Actualizar estado en memoria
-    estado_juego.jugadores = [j for j in estado_juego.jugadores if j["id"] != jugador_id]
-    if estado_juego.turno_actual == jugador_id:
-        estado_juego.turno_actual = None
-    estado_juego.cola_pendientes = [id for id in estado_juego.cola_pendientes if id != jugador_id]
+    # Actualizar estado del juego
+    almacen.eliminar_jugador(db, sala_id, jugador_id)
+    canal.publicar(sala_id, "jugador_eliminado", jugador_id=jugador_id)
 
     return {"message": "Jugador eliminado"}
 
+@router.get("/ranking")
+@en_hilo
+def obtener_ranking(
+    top: int = Query(10, ge=1, le=ranking.MAX_TOP),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Desde la clasificación en memoria: sin ordenar a todos los jugadores en cada
+    # pedido. Los jugadores que cambiaron en otro proceso se vuelven a leer
+    versiones = ranking.versiones(db, sala_id)
+    total, primeros = ranking.clasificaciones.top(sala_id, ranking.cargador(db, sala_id), top, versiones)
+    return {"total": total, "ranking": primeros}
+
+@router.get("/{jugador_id}/ranking")
+@en_hilo
+def obtener_posicion_jugador(jugador_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    versiones = ranking.versiones(db, sala_id)
+    total, jugador = ranking.clasificaciones.jugador(sala_id, ranking.cargador(db, sala_id), jugador_id, versiones)
+    if jugador is None:
+        raise HTTPException(status_code=404, detail="Jugador no encontrado")
+    return {**jugador, "total": total}
+
+@router.get("/estadisticas/preguntas")
+def estadisticas_preguntas_jugadores(
+    orden: str = Query("dificiles", pattern="^(dificiles|intentos)$"),
+    limite: int = Query(50, ge=1, le=registro_respuestas.MAX_ESTADISTICAS),
+    min_intentos: int = Query(1, ge=1),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Intentos y aciertos por pregunta desde los acumulados, sin leer los eventos
+    return registro_respuestas.estadisticas_preguntas(db, sala_id, "jugador", orden, limite, min_intentos)
+
+@router.get("/estadisticas")
+def estadisticas_jugadores(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    # Intentos y aciertos de cada jugador desde los acumulados
+    return registro_respuestas.estadisticas_jugadores(db, sala_id)
+
+@router.get("/{jugador_id}/estadisticas")
+def estadisticas_jugador(jugador_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    estadisticas = registro_respuestas.estadisticas_jugador(db, sala_id, jugador_id)
+    if estadisticas is None:
+        raise HTTPException(status_code=404, detail="Jugador no encontrado")
+    return estadisticas
+
 @router.get("/{jugador_id}")
-def obtener_jugador(jugador_id: int, db: Session = Depends(get_db)):
-    jugador = db.query(Jugador).filter(Jugador.id == jugador_id).first()
+def obtener_jugador(jugador_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    jugador = db.query(Jugador).filter(Jugador.id == jugador_id, Jugador.sala_id == sala_id).first()
     if not jugador:
         raise HTTPException(status_code=404, detail="Jugador no encontrado")
 
@@ -96,160 +152,320 @@ def obtener_jugador(jugador_id: int, db: Session = Depends(get_db)):
     }
 
 @router.post("/juego/iniciar")
-def iniciar_juego(db: Session = Depends(get_db)):
-    jugadores = db.query(Jugador).all()
+def iniciar_juego(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    jugadores = db.query(Jugador.id, Jugador.nombre).filter(Jugador.sala_id == sala_id).order_by(Jugador.id).all()
     if len(jugadores) < 2:
         raise HTTPException(status_code=400, detail="Se necesitan al menos 2 jugadores")
 
-    preguntas_activas = db.query(PreguntaAutoevaluacion).filter(PreguntaAutoevaluacion.respondida == False).all()
-    if not preguntas_activas:
+    # Limpiar asignaciones anteriores de la sala
+    db.query(PreguntaJugador).filter(PreguntaJugador.sala_id == sala_id).delete(synchronize_session=False)
+
+    # Asignar preguntas aleatoriamente a jugadores en un solo INSERT ... SELECT:
+    # las preguntas activas se numeran en orden aleatorio y la pregunta n va al
+    # jugador en la posición n % cantidad de jugadores (los primeros reciben el resto)
+    asignadas = db.execute(
+        insert(PreguntaJugador).from_select(
+            ["sala_id", "jugador_id", "pregunta_id", "ronda_respondida"],
+            reparto_preguntas(sala_id, len(jugadores)),
+        )
+    ).rowcount
+    if not asignadas:
+        db.rollback()
         raise HTTPException(status_code=400, detail="No hay preguntas activas")
 
-    # Limpiar asignaciones anteriores
-    db.query(PreguntaJugador).delete()
-
-    # Asignar preguntas aleatoriamente a jugadores
-    num_jugadores = len(jugadores)
-    preguntas_por_jugador = len(preguntas_activas) // num_jugadores
-    resto = len(preguntas_activas) % num_jugadores
-
-    random.shuffle(preguntas_activas)
-
-    idx = 0
-    for i, jugador in enumerate(jugadores):
-        num_preguntas = preguntas_por_jugador + (1 if i < resto else 0)
-        for j in range(num_preguntas):
-            pregunta_jugador = PreguntaJugador(
-                jugador_id=jugador.id,
-                pregunta_id=preguntas_activas[idx].id
-            )
-            db.add(pregunta_jugador)
-            idx += 1
-
-    # Resetear puntajes y consecutivas
-    for jugador in jugadores:
-        jugador.puntaje = 0
-        jugador.consecutivas = 0
+    # Resetear puntajes y consecutivas; la versión nueva hace recargar los
+    # índices de los jugadores también en los otros procesos
+    db.query(Jugador).filter(Jugador.sala_id == sala_id).update(
+        {"puntaje": 0, "consecutivas": 0, "version": Jugador.version + 1}, synchronize_session=False
+    )
 
     db.commit()
+    activas.invalidar_prefijo("jugador", sala_id)
+    ranking.clasificaciones.invalidar(sala_id)
 
     # Inicializar estado del juego
-    estado_juego.jugadores = [{
+    estado_jugadores = [{
         "id": j.id,
         "nombre": j.nombre,
         "puntaje": 0,
         "consecutivas": 0
     } for j in jugadores]
-    estado_juego.cola_pendientes = [j.id for j in jugadores]
-    estado_juego.turno_actual = None
-
-    return {"message": "Juego iniciado", "jugadores": len(jugadores), "preguntas_asignadas": len(preguntas_activas)}
+    almacen.iniciar(db, sala_id, estado_jugadores)
+    canal.publicar(sala_id, "juego_iniciado", jugadores=estado_jugadores, preguntas_asignadas=asignadas)
+
+    return {"message": "Juego iniciado", "jugadores": len(jugadores), "preguntas_asignadas": asignadas}
+
+def reparto_preguntas(sala_id, num_jugadores):
+    # SELECT (sala_id, jugador_id, pregunta_id, ronda_respondida) con el reparto round-robin
+    preguntas = select(
+        PreguntaAutoevaluacion.id.label("pregunta_id"),
+        (func.row_number().over(order_by=func.random()) - 1).label("orden"),
+    ).where(
+        PreguntaAutoevaluacion.sala_id == sala_id,
+        rondas.activa(PreguntaAutoevaluacion.ronda_respondida, sala_id, "autoevaluacion")
+    ).subquery()
+    jugadores = select(
+        Jugador.id.label("jugador_id"),
+        (func.row_number().over(order_by=Jugador.id) - 1).label("posicion"),
+    ).where(Jugador.sala_id == sala_id).subquery()
+
+    return select(
+        literal(sala_id),
+        jugadores.c.jugador_id,
+        preguntas.c.pregunta_id,
+        literal(0),
+    ).join_from(preguntas, jugadores, preguntas.c.orden % num_jugadores == jugadores.c.posicion)
 
 @router.get("/juego/estado")
-def obtener_estado_juego():
-    return {
-        "jugadores": estado_juego.jugadores,
-        "turno_actual": estado_juego.turno_actual,
-        "cola_pendientes": estado_juego.cola_pendientes
-    }
+def obtener_estado_juego(
+    request: Request, response: Response, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)
+):
+    # La versión del almacén cambia con cada turno, alta, baja o puntaje
+    version = almacen.version(db, sala_id)
+    no_modificado = etags.no_modificado(request, response, etags.etag("juego", sala_id, version))
+    if no_modificado:
+        return no_modificado
+    return almacen.obtener(db, sala_id)
 
 @router.post("/juego/seleccionar_jugador")
-def seleccionar_jugador():
-    if not estado_juego.cola_pendientes:
+def seleccionar_jugador(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    # Selección al azar y baja de la cola de forma atómica en el almacén
+    jugador_id = almacen.seleccionar(db, sala_id)
+    if jugador_id is None:
         raise HTTPException(status_code=400, detail="No hay jugadores pendientes")
 
-    # Seleccionar aleatoriamente
-    jugador_id = random.choice(estado_juego.cola_pendientes)
-    estado_juego.cola_pendientes.remove(jugador_id)
-    estado_juego.turno_actual = jugador_id
-
-    # Si cola vacía, resetear con todos los jugadores
-    if not estado_juego.cola_pendientes:
-        estado_juego.cola_pendientes = [j["id"] for j in estado_juego.jugadores]
-
+    canal.publicar(sala_id, "jugador_seleccionado", jugador_id=jugador_id)
     return {"jugador_seleccionado": jugador_id}
 
 @router.post("/juego/reiniciar")
-def reiniciar_juego(db: Session = Depends(get_db)):
-    # Resetear preguntas de jugadores
-    db.query(PreguntaJugador).update({"respondida": False})
+def reiniciar_juego(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    # Resetear preguntas de jugadores: nueva ronda, sin tocar las asignaciones
+    rondas.avanzar(db, sala_id, "jugador")
 
     # Resetear puntajes
-    db.query(Jugador).update({"puntaje": 0, "consecutivas": 0})
+    versiones = db.execute(
+        update(Jugador).where(Jugador.sala_id == sala_id)
+        .values(puntaje=0, consecutivas=0, version=Jugador.version + 1)
+        .returning(Jugador.id, Jugador.version)
+        .execution_options(synchronize_session=False)
+    ).all()
     db.commit()
+    ranking.clasificaciones.invalidar(sala_id)
+    # Cada jugador conserva sus preguntas, todas activas de nuevo: O(1) por índice
+    for jugador_id, version in versiones:
+        activas.reiniciar(("jugador", sala_id, jugador_id), version)
 
     # Resetear estado
-    estado_juego.turno_actual = None
-    estado_juego.cola_pendientes = [j["id"] for j in estado_juego.jugadores]
-    for j in estado_juego.jugadores:
-        j["puntaje"] = 0
-        j["consecutivas"] = 0
+    almacen.reiniciar(db, sala_id)
+    canal.publicar(sala_id, "juego_reiniciado")
 
     return {"message": "Juego reiniciado"}
 
 @router.get("/{jugador_id}/preguntas/activas")
-def get_preguntas_activas_jugador(jugador_id: int, db: Session = Depends(get_db)):
-    preguntas = db.query(PreguntaAutoevaluacion.id).join(PreguntaJugador).filter(
-        PreguntaJugador.jugador_id == jugador_id,
-        PreguntaJugador.respondida == False
-    ).all()
-
-    ids = [p.id for p in preguntas]
-    return {"activas": ids}
+@en_hilo
+def get_preguntas_activas_jugador(jugador_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    clave = ("jugador", sala_id, jugador_id)
+    return {"activas": sorted(activas.obtener(clave, cargador(db, clave), version_banco(db, clave)))}
+
+@router.post("/{jugador_id}/preguntas/girar")
+@en_hilo
+def girar_pregunta_jugador(
+    jugador_id: int,
+    muestra: int = Query(12, ge=1, le=100),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    def obtener_pregunta(pregunta_id):
+        pregunta = db.query(PreguntaAutoevaluacion.id, PreguntaAutoevaluacion.frase, PreguntaAutoevaluacion.respuesta).join(PreguntaJugador).filter(
+            PreguntaJugador.sala_id == sala_id,
+            PreguntaJugador.jugador_id == jugador_id,
+            PreguntaJugador.pregunta_id == pregunta_id,
+            rondas.activa(PreguntaJugador.ronda_respondida, sala_id, "jugador")
+        ).first()
+        if not pregunta:
+            return None
+        return {"id": pregunta.id, "frase": pregunta.frase, "respuesta": pregunta.respuesta}
+
+    clave = ("jugador", sala_id, jugador_id)
+    resultado = activas.girar(clave, cargador(db, clave), obtener_pregunta, muestra, version_banco(db, clave))
+    if resultado is None:
+        raise HTTPException(status_code=400, detail="No hay preguntas activas")
+    return resultado
 
 @router.post("/{jugador_id}/preguntas/{pregunta_id}/responder")
-def responder_pregunta_jugador(jugador_id: int, pregunta_id: int, data: ResponderPreguntaRequest, db: Session = Depends(get_db)):
+def responder_pregunta_jugador(
+    jugador_id: int,
+    pregunta_id: int,
+    data: ResponderPreguntaRequest,
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
     evaluacion = data.evaluacion.lower()
     if evaluacion not in ["bien", "mal"]:
         raise HTTPException(status_code=400, detail="Evaluación debe ser 'bien' o 'mal'")
 
-    # Verificar que la pregunta pertenece al jugador
-    pregunta_jugador = db.query(PreguntaJugador).filter(
+    # La pregunta tiene que estar asignada al jugador y sin responder
+    pendiente = (
+        PreguntaJugador.sala_id == sala_id,
         PreguntaJugador.jugador_id == jugador_id,
-        PreguntaJugador.pregunta_id == pregunta_id
-    ).first()
-    if not pregunta_jugador:
-        raise HTTPException(status_code=404, detail="Pregunta no asignada a este jugador")
-    if pregunta_jugador.respondida:
-        raise HTTPException(status_code=400, detail="Pregunta ya respondida")
-
-    # Obtener pregunta completa
-    pregunta = db.query(PreguntaAutoevaluacion).filter(PreguntaAutoevaluacion.id == pregunta_id).first()
-    if not pregunta:
-        raise HTTPException(status_code=404, detail="Pregunta no encontrada")
-
-    # Obtener jugador
-    jugador = db.query(Jugador).filter(Jugador.id == jugador_id).first()
-    if not jugador:
-        raise HTTPException(status_code=404, detail="Jugador no encontrado")
-
-    # Calcular puntaje
-    puntos_ganados = 0
+        PreguntaJugador.pregunta_id == pregunta_id,
+        rondas.activa(PreguntaJugador.ronda_respondida, sala_id, "jugador"),
+    )
+    respuesta_correcta = select(PreguntaAutoevaluacion.respuesta).where(
+        PreguntaAutoevaluacion.id == pregunta_id
+    ).scalar_subquery()
+    del_jugador = (Jugador.id == jugador_id, Jugador.sala_id == sala_id)
+    # Lo que devuelven los UPDATE del jugador: su fila nueva, la respuesta y lo
+    # que necesita el registro de respuestas (generación del banco y alta del jugador)
+    devueltas = (
+        Jugador.puntaje, Jugador.consecutivas, Jugador.version, Jugador.created_at,
+        respuesta_correcta.label("respuesta"), registro_respuestas.generacion(sala_id, "jugador").label("generacion"),
+    )
+
+    # El jugador se bloquea antes que su pregunta, en el mismo orden que las
+    # respuestas en lote: una respuesta y un lote del mismo jugador no se traban
+    if db.execute(select(Jugador.id).where(*del_jugador).with_for_update()).first() is None:
+        db.rollback()
+        return _respuesta_sin_cambios(db, sala_id, jugador_id, pregunta_id, evaluacion, respuesta_correcta)
+
+    # Puntaje calculado en la base con UPDATE condicionales: dos envíos
+    # simultáneos no pueden puntuar dos veces la misma pregunta
+    jugador = None
     if evaluacion == "bien":
-        puntos_ganados = 1 + jugador.consecutivas  # Bono por consecutivas
-        jugador.puntaje += puntos_ganados
-        jugador.consecutivas += 1
-        pregunta_jugador.respondida = True
+        generacion = activas.generacion(("jugador", sala_id, jugador_id))
+        reclamada = db.execute(
+            update(PreguntaJugador).where(*pendiente).values(ronda_respondida=rondas.actual(sala_id, "jugador"))
+            .returning(PreguntaJugador.id).execution_options(synchronize_session=False)
+        ).first()
+        if reclamada:
+            jugador = db.execute(
+                update(Jugador).where(*del_jugador)
+                .values(
+                    puntaje=Jugador.puntaje + 1 + Jugador.consecutivas,  # Bono por consecutivas
+                    consecutivas=Jugador.consecutivas + 1,
+                    version=Jugador.version + 1,
+                )
+                .returning(*devueltas)
+                .execution_options(synchronize_session=False)
+            ).first()
     else:
-        if jugador.puntaje > 0:
-            jugador.puntaje -= 1
-        jugador.consecutivas = 0
-        # Pregunta permanece activa
+        # Pregunta permanece activa. RETURNING da el puntaje nuevo: para saber
+        # cuánto se restó se intenta primero con puntaje > 0 y, si no hay, solo
+        # se cortan las consecutivas
+        for resta, con_puntaje in ((1, [Jugador.puntaje > 0]), (0, [])):
+            jugador = db.execute(
+                update(Jugador).where(*del_jugador, exists().where(*pendiente), *con_puntaje)
+                .values(puntaje=func.coalesce(Jugador.puntaje, 0) - resta, consecutivas=0, version=Jugador.version + 1)
+                .returning(*devueltas)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if jugador is not None:
+                puntaje_previo = jugador.puntaje + resta
+                break
+
+    if jugador is None:
+        db.rollback()
+        return _respuesta_sin_cambios(db, sala_id, jugador_id, pregunta_id, evaluacion, respuesta_correcta)
 
     db.commit()
-
-    # Actualizar estado en memoria
-    for j in estado_juego.jugadores:
-        if j["id"] == jugador_id:
-            j["puntaje"] = jugador.puntaje
-            j["consecutivas"] = jugador.consecutivas
-            break
+    if evaluacion == "bien":
+        activas.quitar(("jugador", sala_id, jugador_id), pregunta_id, generacion, jugador.version)
+    else:
+        activas.seguir(("jugador", sala_id, jugador_id), jugador.version)
+    registro_respuestas.escritor.registrar(
+        sala_id, "jugador", pregunta_id, evaluacion == "bien", jugador_id,
+        generacion=jugador.generacion, alta=jugador.created_at,
+    )
+
+    # Actualizar estado del juego y la posición en el ranking
+    almacen.actualizar_jugador(db, sala_id, jugador_id, jugador.puntaje, jugador.consecutivas)
+    posicion = ranking.clasificaciones.actualizar(sala_id, jugador_id, jugador.puntaje, jugador.consecutivas, jugador.version)
+
+    # Con "bien" se gana 1 + consecutivas previas, que es el nuevo valor de consecutivas
+    puntos = jugador.consecutivas if evaluacion == "bien" else respuestas_lote.puntos_mal(puntaje_previo)
+    canal.publicar(sala_id, "respuesta_evaluada", jugador_id=jugador_id, pregunta_id=pregunta_id,
+                   evaluacion=evaluacion, puntos_ganados=puntos)
+    canal.publicar(sala_id, "puntaje_actualizado", jugador_id=jugador_id,
+                   puntaje=jugador.puntaje, consecutivas=jugador.consecutivas, **(posicion or {}))
+    if evaluacion == "bien":
+        canal.publicar(sala_id, "pregunta_quitada", jugador_id=jugador_id, pregunta_id=pregunta_id)
 
     return {
         "evaluacion": evaluacion,
-        "puntos_ganados": puntos_ganados if evaluacion == "bien" else -1 if jugador.puntaje > 0 else 0,
+        "puntos_ganados": puntos,
         "puntaje_total": jugador.puntaje,
         "consecutivas": jugador.consecutivas,
-        "respondida": pregunta_jugador.respondida,
-        "respuesta_correcta": pregunta.respuesta
-    }
\ No newline at end of file
+        "respondida": evaluacion == "bien",
+        "respuesta_correcta": jugador.respuesta
+    }
+
+@router.post("/{jugador_id}/preguntas/responder_lote")
+def responder_preguntas_lote_jugador(
+    jugador_id: int,
+    data: ResponderLoteJugadorRequest,
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    if len(data.respuestas) > respuestas_lote.MAX_RESPUESTAS_POR_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {respuestas_lote.MAX_RESPUESTAS_POR_LOTE} respuestas por lote")
+    return respuestas_lote.responder_jugador(db, sala_id, jugador_id, data.respuestas)
+
+def _respuesta_sin_cambios(db, sala_id, jugador_id, pregunta_id, evaluacion, respuesta_correcta):
+    # El UPDATE no afectó filas: pregunta no asignada, jugador inexistente o ya respondida
+    estado = db.query(
+        rondas.respondida(PreguntaJugador.ronda_respondida, sala_id, "jugador").label("respondida"),
+        Jugador.puntaje, Jugador.consecutivas, respuesta_correcta.label("respuesta")
+    ).join(
+        Jugador, Jugador.id == PreguntaJugador.jugador_id
+    ).filter(
+        PreguntaJugador.sala_id == sala_id,
+        PreguntaJugador.jugador_id == jugador_id,
+        PreguntaJugador.pregunta_id == pregunta_id
+    ).first()
+    db.commit()
+    if not estado:
+        raise HTTPException(status_code=404, detail="Pregunta no asignada a este jugador")
+    if estado.respondida and evaluacion == "bien":
+        # Reenvío del mismo "bien": se responde igual, sin volver a puntuar
+        return {
+            "evaluacion": evaluacion,
+            "puntos_ganados": 0,
+            "puntaje_total": estado.puntaje,
+            "consecutivas": estado.consecutivas,
+            "respondida": True,
+            "respuesta_correcta": estado.respuesta,
+            "ya_respondida": True
+        }
+    raise HTTPException(status_code=400, detail="Pregunta ya respondida")
+
+async def _esperar_cierre(websocket):
+    # El cliente no envía nada: solo interesa enterarse de que se desconectó
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+@router.websocket("/juego/eventos")
+async def eventos_juego(websocket: WebSocket, sala_id: int = Query(SALA_POR_DEFECTO, ge=1), db: Session = Depends(get_db)):
+    # Eventos del juego en tiempo real: evita que cada pantalla consulte el estado
+    if not await run_in_threadpool(sala_existe, db, sala_id):
+        await websocket.close(code=1008, reason="Sala no encontrada")
+        return
+    await websocket.accept()
+    suscripcion, seq = canal.suscribir(sala_id)
+    cierre = asyncio.create_task(_esperar_cierre(websocket))
+    try:
+        await websocket.send_json({"tipo": "conectado", "seq": seq})
+        while True:
+            siguiente = asyncio.create_task(suscripcion.cola.get())
+            hechas, _ = await asyncio.wait({siguiente, cierre}, return_when=asyncio.FIRST_COMPLETED)
+            if siguiente not in hechas:
+                siguiente.cancel()
+                break
+            await websocket.send_text(siguiente.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        cierre.cancel()
+        canal.desuscribir(sala_id, suscripcion)
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import update
+from sqlalchemy.orm import Session, sessionmaker
 from ..database import get_db
+from ..asincrono import en_hilo
+from ..salas import get_sala_id
 from ..models import Pregunta
-from pydantic import BaseModel
-import csv
-import io
+from ..trabajos import encolar_importacion
+from ..importacion import vaciar_banco
+from ..indices import activas, cargador
+from .. import estadisticas, historial, etags, busqueda, registro_respuestas, cache_preguntas, rondas, respuestas_lote
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
 
 router = APIRouter()
 
@@ -12,118 +20,241 @@ class ResponderPreguntaRequest(BaseModel):
     id: int
     respuesta: str
 
-@router.post("/importar_csv")
-def importar_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="El archivo debe ser un CSV")
+class RespuestaLote(BaseModel):
+    id_cliente: str = Field(..., min_length=1, max_length=64)  # Único por respuesta, lo genera el cliente
+    id: int
+    respuesta: str
+    respondida_en: Optional[datetime] = None  # Hora en que se respondió en el cliente
 
-    content = file.file.read()
-    text_content = content.decode('utf-8')
-    csv_reader = csv.reader(io.StringIO(text_content))
-    preguntas = []
-    chunk_size = 100  # Procesar en chunks de 100
+class ResponderLoteRequest(BaseModel):
+    respuestas: List[RespuestaLote]
 
-    for i, row in enumerate(csv_reader):
-        if i == 0:  # Saltar header si existe
-            continue
-        if not row or len(row) < 2:
-            continue
+@router.post("/importar_csv", status_code=202)
+@en_hilo
+def importar_csv(
+    file: UploadFile = File(...),
+    batch_size: Optional[int] = Query(None, ge=1, le=100000),
+    reemplazar: bool = Query(False),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="El archivo debe ser un CSV")
 
-        # Formato simple: pregunta,respuesta
-        pregunta_texto = row[0].strip()
-        respuesta_texto = row[1].strip()
+    # El parseo y la carga corren en segundo plano; el progreso se consulta en estado_url.
+    # Las filas inválidas no abortan la importación: quedan en el reporte de errores.
+    job_id, reanudada = encolar_importacion(
+        sessionmaker(bind=db.get_bind()), file.file, sala_id, "clasico", batch_size, reemplazar
+    )
 
-        if not pregunta_texto or not respuesta_texto:
-            continue
+    return {
+        "message": "Importación de preguntas en curso",
+        "job_id": job_id,
+        "reanudada": reanudada,
+        "estado_url": f"/api/import_jobs/{job_id}",
+    }
 
-        # Extraer frase y determinar si es verdadero/falso
-        primera_palabra = respuesta_texto.split()[0].upper().rstrip('.')
-        if primera_palabra not in ['VERDADERO', 'FALSO']:
-            raise HTTPException(status_code=400, detail=f"Respuesta inválida en línea {i+1}: debe empezar con VERDADERO o FALSO")
+@router.get("/preguntas/activas")
+@en_hilo
+def get_preguntas_activas(
+    request: Request, response: Response, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)
+):
+    # Sin cambios en el banco desde la copia del cliente: 304 sin armar la lista
+    version = estadisticas.version(db, sala_id, "clasico")
+    no_modificado = etags.no_modificado(request, response, etags.etag("activas", "clasico", sala_id, version))
+    if no_modificado:
+        return no_modificado
+    # Desde el índice en memoria: sin recorrer el banco en la base. Si otro
+    # proceso cambió el banco (otra versión), se vuelve a cargar
+    clave = ("clasico", sala_id)
+    return {"activas": sorted(activas.obtener(clave, cargador(db, clave), version))}
 
-        es_verdadero = primera_palabra == 'VERDADERO'
+@router.get("/preguntas/respondidas")
+def get_preguntas_respondidas(
+    request: Request,
+    response: Response,
+    despues_de: Optional[int] = Query(None, description="Último id de la página anterior"),
+    limite: int = Query(historial.LIMITE_POR_DEFECTO, ge=1, le=historial.LIMITE_MAXIMO),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    version = estadisticas.version(db, sala_id, "clasico")
+    valor = etags.etag("respondidas", "clasico", sala_id, version, despues_de or 0, limite)
+    no_modificado = etags.no_modificado(request, response, valor)
+    if no_modificado:
+        return no_modificado
+    return historial.pagina_respondidas(db, "clasico", sala_id, despues_de, limite)
 
-        pregunta = Pregunta(
-            frase=pregunta_texto,
-            respuesta=respuesta_texto,
-            verdadero=es_verdadero
-        )
-        preguntas.append(pregunta)
+@router.get("/preguntas/respondidas/exportar")
+@en_hilo
+def exportar_preguntas_respondidas(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    return StreamingResponse(
+        historial.iterar_respondidas_ndjson(db, "clasico", sala_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="preguntas_respondidas_{sala_id}.ndjson"'},
+    )
 
-        # Procesar en chunks
-        if len(preguntas) >= chunk_size:
-            db.add_all(preguntas)
-            db.commit()
-            preguntas = []  # Reset para siguiente chunk
+@router.post("/preguntas/girar")
+@en_hilo
+def girar_pregunta(muestra: int = Query(12, ge=1, le=100), sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    def obtener_pregunta(pregunta_id):
+        pregunta = db.query(Pregunta.id, Pregunta.frase).filter(
+            Pregunta.id == pregunta_id, Pregunta.sala_id == sala_id,
+            rondas.activa(Pregunta.ronda_respondida, sala_id, "clasico")
+        ).first()
+        if not pregunta:
+            return None
+        return {"id": pregunta.id, "frase": pregunta.frase, "opciones": ["VERDADERO", "FALSO"]}
 
-    # Procesar último chunk
-    if preguntas:
-        db.add_all(preguntas)
-        db.commit()
+    clave = ("clasico", sala_id)
+    version = estadisticas.version(db, sala_id, "clasico")
+    resultado = activas.girar(clave, cargador(db, clave), obtener_pregunta, muestra, version)
+    if resultado is None:
+        raise HTTPException(status_code=400, detail="No hay preguntas activas")
+    return resultado
 
-    return {"message": "Preguntas importadas exitosamente"}
+@router.get("/preguntas")
+def get_preguntas(
+    ids: str = Query(..., description="Ids separados por coma, p. ej. 3,8,15"),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Pedido en lote para que la ruleta precargue los próximos candidatos
+    try:
+        pedidos = list(dict.fromkeys(int(id_) for id_ in ids.split(",") if id_.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros separados por coma")
+    if len(pedidos) > cache_preguntas.MAX_IDS_POR_PEDIDO:
+        raise HTTPException(status_code=400, detail=f"Máximo {cache_preguntas.MAX_IDS_POR_PEDIDO} ids por pedido")
 
-@router.get("/preguntas/activas")
-def get_preguntas_activas(db: Session = Depends(get_db)):
-    preguntas = db.query(Pregunta.id).filter(Pregunta.respondida == False).all()
-    ids = [p.id for p in preguntas]
-    return {"activas": ids}
+    encontradas, respondidas, inexistentes = cache_preguntas.obtener_activas(db, "clasico", sala_id, pedidos)
+    return {
+        "preguntas": [encontradas[id_] for id_ in pedidos if id_ in encontradas],
+        "no_disponibles": [id_ for id_ in pedidos if id_ in respondidas or id_ in inexistentes],
+    }
 
-@router.get("/preguntas/respondidas")
-def get_preguntas_respondidas(db: Session = Depends(get_db)):
-    preguntas = db.query(Pregunta.frase, Pregunta.respuesta).filter(Pregunta.respondida == True).all()
-    return {"respondidas": [{"frase": p.frase, "respuesta": p.respuesta} for p in preguntas]}
+@router.get("/preguntas/buscar")
+def buscar_preguntas(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras a buscar en la frase o la respuesta"),
+    despues_de: Optional[int] = Query(None, description="Último id de la página anterior"),
+    limite: int = Query(historial.LIMITE_POR_DEFECTO, ge=1, le=historial.LIMITE_MAXIMO),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Índice de texto (FTS5 en SQLite, trigramas en PostgreSQL): sin recorrer el banco
+    version = estadisticas.version(db, sala_id, "clasico")
+    valor = etags.etag("buscar", "clasico", sala_id, version, busqueda.clave(q), despues_de or 0, limite)
+    no_modificado = etags.no_modificado(request, response, valor)
+    if no_modificado:
+        return no_modificado
+    return busqueda.buscar(db, "clasico", sala_id, q, despues_de, limite)
 
 @router.get("/preguntas/{pregunta_id}")
-def get_pregunta(pregunta_id: int, db: Session = Depends(get_db)):
-    pregunta = db.query(Pregunta).filter(Pregunta.id == pregunta_id).first()
-    if not pregunta:
-        raise HTTPException(status_code=404, detail="Pregunta no encontrada")
-    if pregunta.respondida:
+def get_pregunta(pregunta_id: int, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    encontradas, respondidas, _ = cache_preguntas.obtener_activas(db, "clasico", sala_id, [pregunta_id])
+    if pregunta_id in respondidas:
         raise HTTPException(status_code=400, detail="Pregunta ya respondida")
-
-    return {
-        "id": pregunta.id,
-        "frase": pregunta.frase,
-        "opciones": ["VERDADERO", "FALSO"]
-    }
+    if pregunta_id not in encontradas:
+        raise HTTPException(status_code=404, detail="Pregunta no encontrada")
+    return encontradas[pregunta_id]
 
 @router.post("/preguntas/responder")
-def responder_pregunta(data: ResponderPreguntaRequest, db: Session = Depends(get_db)):
+def responder_pregunta(data: ResponderPreguntaRequest, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
     pregunta_id = data.id
-    respuesta = data.respuesta
 
-    pregunta = db.query(Pregunta).filter(Pregunta.id == pregunta_id).first()
+    # Verificar usando el booleano
+    respuesta_usuario_limpia = data.respuesta.upper().rstrip('.')
+    respuesta_usuario_bool = respuesta_usuario_limpia == 'VERDADERO'
+
+    # Marcar como respondida solo si la respuesta es correcta y nadie la respondió
+    # antes: un único UPDATE condicional, sin carrera entre dos envíos
+    generacion = activas.generacion(("clasico", sala_id))
+    marcada = db.execute(
+        update(Pregunta)
+        .where(
+            Pregunta.id == pregunta_id,
+            Pregunta.sala_id == sala_id,
+            rondas.activa(Pregunta.ronda_respondida, sala_id, "clasico"),
+            Pregunta.verdadero == respuesta_usuario_bool,
+        )
+        .values(ronda_respondida=rondas.actual(sala_id, "clasico"))
+        .returning(Pregunta.respuesta, registro_respuestas.generacion(sala_id, "clasico").label("generacion"))
+        .execution_options(synchronize_session=False)
+    ).first()
+    if marcada:
+        version = estadisticas.sumar(db, sala_id, "clasico", respondidas=1)
+        db.commit()
+        activas.quitar(("clasico", sala_id), pregunta_id, generacion, version)
+        registro_respuestas.escritor.registrar(sala_id, "clasico", pregunta_id, True, generacion=marcada.generacion)
+        return {"correcto": True, "respuesta_correcta": marcada.respuesta}
+
+    pregunta = db.query(
+        Pregunta.respuesta,
+        rondas.respondida(Pregunta.ronda_respondida, sala_id, "clasico").label("respondida"),
+        Pregunta.verdadero,
+        registro_respuestas.generacion(sala_id, "clasico").label("generacion"),
+    ).filter(
+        Pregunta.id == pregunta_id, Pregunta.sala_id == sala_id
+    ).first()
+    db.commit()
     if not pregunta:
         raise HTTPException(status_code=404, detail="Pregunta no encontrada")
     if pregunta.respondida:
+        # Reenvío de una respuesta correcta ya registrada: misma respuesta, sin volver a contarla
+        if pregunta.verdadero == respuesta_usuario_bool:
+            return {"correcto": True, "respuesta_correcta": pregunta.respuesta, "ya_respondida": True}
         raise HTTPException(status_code=400, detail="Pregunta ya respondida")
 
-    # Verificar usando el booleano
-    respuesta_usuario_limpia = respuesta.upper().rstrip('.')
-    respuesta_usuario_bool = respuesta_usuario_limpia == 'VERDADERO'
-    correcto = respuesta_usuario_bool == pregunta.verdadero
-    if correcto:
-        pregunta.respondida = True
-    db.commit()  # Commit siempre para actualizar respondida si cambió
+    registro_respuestas.escritor.registrar(sala_id, "clasico", pregunta_id, False, generacion=pregunta.generacion)
+    return {"correcto": False, "respuesta_correcta": pregunta.respuesta}
+
+@router.post("/preguntas/responder_lote")
+def responder_preguntas_lote(data: ResponderLoteRequest, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    # Respuestas encoladas en el cliente (sin conexión o con mala red), aplicadas
+    # en una transacción; reenviar el lote no aplica dos veces el mismo id_cliente
+    if len(data.respuestas) > respuestas_lote.MAX_RESPUESTAS_POR_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {respuestas_lote.MAX_RESPUESTAS_POR_LOTE} respuestas por lote")
+    return respuestas_lote.responder_clasico(db, sala_id, data.respuestas)
 
-    return {"correcto": correcto, "respuesta_correcta": pregunta.respuesta}
+@router.get("/estadisticas/preguntas")
+def estadisticas_preguntas(
+    orden: str = Query("dificiles", pattern="^(dificiles|intentos)$"),
+    limite: int = Query(50, ge=1, le=registro_respuestas.MAX_ESTADISTICAS),
+    min_intentos: int = Query(1, ge=1),
+    sala_id: int = Depends(get_sala_id),
+    db: Session = Depends(get_db),
+):
+    # Intentos y aciertos por pregunta desde los acumulados, sin leer los eventos
+    return registro_respuestas.estadisticas_preguntas(db, sala_id, "clasico", orden, limite, min_intentos)
 
 @router.post("/reiniciar_preguntas")
-def reiniciar_preguntas(db: Session = Depends(get_db)):
-    db.query(Pregunta).update({"respondida": False})
+def reiniciar_preguntas(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    # Nueva ronda: una sola fila actualizada en vez de todo el banco
+    rondas.avanzar(db, sala_id, "clasico")
+    version = estadisticas.fijar(db, sala_id, "clasico", respondidas=0)
     db.commit()
+    # Las mismas preguntas vuelven a estar activas: O(1), sin recargar el índice
+    activas.reiniciar(("clasico", sala_id), version)
     return {"message": "Todas las preguntas han sido reiniciadas"}
 
 @router.delete("/eliminar_todas_preguntas")
-def eliminar_todas_preguntas(db: Session = Depends(get_db)):
-    count = db.query(Pregunta).delete()
+def eliminar_todas_preguntas(sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)):
+    count = vaciar_banco(db, sala_id, "clasico")
+    estadisticas.fijar(db, sala_id, "clasico", total=0, respondidas=0)
     db.commit()
+    activas.invalidar(("clasico", sala_id))
+    cache_preguntas.cache.invalidar("clasico", sala_id)
     return {"message": f"Se eliminaron {count} preguntas"}
 
 @router.get("/contar_preguntas")
-def contar_preguntas(db: Session = Depends(get_db)):
-    total = db.query(Pregunta).count()
-    activas = db.query(Pregunta).filter(Pregunta.respondida == False).count()
-    respondidas = db.query(Pregunta).filter(Pregunta.respondida == True).count()
-    return {"total": total, "activas": activas, "respondidas": respondidas}
\ No newline at end of file
+def contar_preguntas(
+    request: Request, response: Response, sala_id: int = Depends(get_sala_id), db: Session = Depends(get_db)
+):
+    # Contadores mantenidos en cada escritura: lectura O(1), sin recorrer la tabla.
+    # Con la cache de estadísticas y la sala ya verificada (SALAS_CACHE_TTL), el
+    # 304 no consulta la base.
+    version, conteo = estadisticas.obtener_con_version(db, sala_id, "clasico")
+    no_modificado = etags.no_modificado(request, response, etags.etag("contar", "clasico", sala_id, version))
+    return no_modificado or conteo
\ No newline at end of file
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import (
+    Sala, Pregunta, PreguntaAutoevaluacion, Jugador, PreguntaJugador,
+    Importacion, FilaStaging, ErrorImportacion, ContadorPreguntas, RespuestaCliente,
+    EventoRespuesta, EstadisticaPregunta, EstadisticaJugador,
+)
+from ..indices import activas
+from ..estado_juego import almacen
+from .. import estadisticas, cache_preguntas, ranking
+from ..salas import olvidar_sala
+from pydantic import BaseModel
+
+router = APIRouter()
+
+class CrearSalaRequest(BaseModel):
+    nombre: str
+
+@router.post("/")
+def crear_sala(data: CrearSalaRequest, db: Session = Depends(get_db)):
+    if not data.nombre.strip():
+        raise HTTPException(status_code=400, detail="Nombre no puede estar vacío")
+
+    sala = Sala(nombre=data.nombre.strip())
+    db.add(sala)
+    db.commit()
+    db.refresh(sala)
+    return {"id": sala.id, "nombre": sala.nombre}
+
+@router.get("/")
+def listar_salas(db: Session = Depends(get_db)):
+    return [{"id": s.id, "nombre": s.nombre} for s in db.query(Sala).order_by(Sala.id)]
+
+@router.delete("/{sala_id}")
+def eliminar_sala(sala_id: int, db: Session = Depends(get_db)):
+    sala = db.query(Sala).filter(Sala.id == sala_id).first()
+    if not sala:
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
+
+    # Borrar los datos de la sala respetando las claves foráneas
+    importaciones = db.query(Importacion.id).filter(Importacion.sala_id == sala_id)
+    db.query(FilaStaging).filter(FilaStaging.importacion_id.in_(importaciones)).delete(synchronize_session=False)
+    db.query(ErrorImportacion).filter(ErrorImportacion.importacion_id.in_(importaciones)).delete(synchronize_session=False)
+    for modelo in (
+        Importacion, PreguntaJugador, Jugador, Pregunta, PreguntaAutoevaluacion, ContadorPreguntas, RespuestaCliente,
+        EventoRespuesta, EstadisticaPregunta, EstadisticaJugador,
+    ):
+        db.query(modelo).filter(modelo.sala_id == sala_id).delete(synchronize_session=False)
+    # Todo en una transacción: si falla, la sala queda completa (con su estado de juego)
+    almacen.eliminar_sala(db, sala_id, commit=False)
+    db.delete(sala)
+    db.commit()
+
+    olvidar_sala(sala_id)
+    estadisticas.invalidar(sala_id)
+    cache_preguntas.cache.invalidar(sala_id=sala_id)
+    ranking.clasificaciones.invalidar(sala_id)
+    for tipo in ("clasico", "autoevaluacion", "jugador"):
+        activas.invalidar_prefijo(tipo, sala_id)
+
+    return {"message": "Sala eliminada"}
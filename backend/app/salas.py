@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .database import get_db, get_async_db
+from .models import Sala
+
+# Sala usada cuando la request no indica ninguna (compatibilidad con el frontend)
+SALA_POR_DEFECTO = 1
+
+# Segundos que se recuerda que una sala existe sin volver a la base (0 = en cada
+# pedido). Al eliminarla este proceso la olvida enseguida; los demás dejan de
+# aceptarla a lo sumo ese tiempo después
+SALAS_CACHE_TTL = float(os.getenv("SALAS_CACHE_TTL", "5"))
+
+_verificadas = {}  # sala_id -> time.monotonic() de la última lectura que la encontró
+_lock = threading.Lock()
+
+
+def _crear_sala_por_defecto(db):
+    try:
+        with db.begin_nested():
+            db.add(Sala(id=SALA_POR_DEFECTO, nombre="Sala principal"))
+    except IntegrityError:
+        pass  # Otra request la creó al mismo tiempo
+    db.commit()
+
+
+def olvidar_sala(sala_id=None):
+    with _lock:
+        if sala_id is None:
+            _verificadas.clear()
+        else:
+            _verificadas.pop(sala_id, None)
+
+
+def sala_existe(db, sala_id):
+    # Lectura por clave primaria, salvo que la sala se haya encontrado hace
+    # menos de SALAS_CACHE_TTL: un pedido sobre una sala conocida no va a la base
+    with _lock:
+        verificada = _verificadas.get(sala_id)
+    if verificada is not None and time.monotonic() - verificada < SALAS_CACHE_TTL:
+        return True
+    existe = db.query(Sala.id).filter(Sala.id == sala_id).first()
+    # Terminar la transacción de lectura para liberar la conexión
+    # (un websocket mantiene la sesión abierta mientras dura)
+    db.commit()
+    if not existe:
+        if sala_id != SALA_POR_DEFECTO:
+            return False
+        _crear_sala_por_defecto(db)
+    with _lock:
+        _verificadas[sala_id] = time.monotonic()
+    return True
+
+
+def get_sala_id(
+    sala_id: int = Query(SALA_POR_DEFECTO, ge=1, description="Sala (partida) sobre la que se opera"),
+    db: Session = Depends(get_db),
+):
+    if not sala_existe(db, sala_id):
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
+    return sala_id
+
+
+async def get_sala_id_async(
+    sala_id: int = Query(SALA_POR_DEFECTO, ge=1, description="Sala (partida) sobre la que se opera"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if not await db.run_sync(sala_existe, sala_id):
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
+    return sala_id
+
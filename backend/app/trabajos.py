@@ -0,0 +1,81 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .importacion import procesar_importacion, preparar_importacion, cerrar_pool, TAMANO_BLOQUE_LECTURA
+from .models import Importacion
+
+# Importaciones que pueden correr a la vez en este proceso
+IMPORT_MAX_JOBS = int(os.getenv("IMPORT_MAX_JOBS", "2"))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def guardar_upload(upload):
+    # Copia el upload a un archivo propio (el de la request se cierra al responder)
+    # calculando el hash del contenido en la misma pasada
+    h = hashlib.sha256()
+    destino = tempfile.NamedTemporaryFile(prefix="importacion_", suffix=".csv", delete=False)
+    with destino:
+        for bloque in iter(lambda: upload.read(TAMANO_BLOQUE_LECTURA), b""):
+            h.update(bloque)
+            destino.write(bloque)
+    return destino.name, h.hexdigest(), os.path.getsize(destino.name)
+
+
+def _ejecutar(session_factory, importacion_id, ruta, batch_size, reemplazar):
+    db = session_factory()
+    try:
+        importacion = db.query(Importacion).filter(Importacion.id == importacion_id).one()
+        with open(ruta, "rb") as stream:
+            # Si otro trabajo la tomó antes (el mismo archivo enviado a otro
+            # proceso) este termina sin hacer nada
+            procesar_importacion(db, importacion, stream, batch_size, reemplazar)
+    except Exception as e:
+        # Lo ya cargado en staging queda para retomar con un reintento del mismo archivo
+        db.rollback()
+        db.query(Importacion).filter(Importacion.id == importacion_id).update({
+            "estado": "fallida",
+            "error": str(e)[:500],
+            "finalizada_at": datetime.utcnow(),
+        })
+        db.commit()
+    finally:
+        db.close()
+        os.unlink(ruta)
+
+
+def encolar_importacion(session_factory, upload, sala_id, modo, batch_size=None, reemplazar=False):
+    global _executor
+    ruta, hash_, tamano = guardar_upload(upload)
+    db = session_factory()
+    try:
+        importacion, reanudada = preparar_importacion(db, sala_id, modo, hash_, tamano, reemplazar)
+        importacion_id, estado = importacion.id, importacion.estado
+    finally:
+        db.close()
+    # Archivo ya importado (queda registrado como completado) o el mismo archivo
+    # ya se está importando en algún proceso: se devuelve ese trabajo
+    if estado in ("completada", "en_progreso"):
+        os.unlink(ruta)
+        return importacion_id, reanudada
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMPORT_MAX_JOBS, thread_name_prefix="importacion")
+        _executor.submit(_ejecutar, session_factory, importacion_id, ruta, batch_size, reemplazar)
+    return importacion_id, reanudada
+
+
+def cerrar():
+    # Espera las importaciones en curso; el pool se vuelve a crear si hace falta
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    cerrar_pool()
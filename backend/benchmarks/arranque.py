@@ -0,0 +1,123 @@
+"""Arranque en frío: importar la app y llegar al primer request.
+
+Mide en procesos nuevos (sin caches de módulos del intérprete padre):
+
+- importación: cuánto tarda `import app.main`, que no debe abrir conexiones;
+- primer request: desde lanzar uvicorn hasta responder `/` y hasta responder
+  el primer endpoint que usa la base.
+
+Uso (desde backend/):
+
+    python -m benchmarks.arranque --repeticiones 5 --salida arranque.json
+
+Sin --database-url usa un SQLite temporal. El esquema se migra una vez antes
+de medir, como en el despliegue.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+
+from .comun import recrear_esquema, sembrar_preguntas
+
+CODIGO_IMPORTACION = (
+    "import time; inicio = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - inicio)"
+)
+
+
+def medir_importacion(entorno):
+    salida = subprocess.run(
+        [sys.executable, "-c", CODIGO_IMPORTACION], env=entorno, capture_output=True, text=True, check=True
+    )
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def _esperar(cliente, ruta, limite):
+    while time.perf_counter() < limite:
+        try:
+            if cliente.get(ruta).status_code < 500:
+                return time.perf_counter()
+        except httpx.TransportError:
+            time.sleep(0.01)
+    raise RuntimeError(f"{ruta} no respondió a tiempo")
+
+
+def medir_primer_request(entorno, puerto, espera):
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{puerto}", timeout=5) as cliente:
+            limite = inicio + espera
+            raiz = _esperar(cliente, "/", limite)
+            base = _esperar(cliente, "/api/contar_preguntas", limite)
+    finally:
+        proceso.terminate()
+        proceso.wait()
+    return raiz - inicio, base - inicio
+
+
+def resumen(valores):
+    return {
+        "min_ms": min(valores) * 1000,
+        "p50_ms": statistics.median(valores) * 1000,
+        "max_ms": max(valores) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--preguntas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--puerto", type=int, default=8766)
+    parser.add_argument("--espera", type=float, default=30, help="Segundos máximos hasta el primer request")
+    parser.add_argument("--salida", default=None, help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    ruta = None
+    url = args.database_url
+    if url is None:
+        ruta = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        url = f"sqlite:///{ruta}"
+
+    try:
+        engine = create_engine(url)
+        recrear_esquema(engine)
+        sembrar_preguntas(engine, args.preguntas)
+        engine.dispose()
+
+        entorno = {**os.environ, "DATABASE_URL": url}
+        importacion = [medir_importacion(entorno) for _ in range(args.repeticiones)]
+        raiz, base = zip(*[medir_primer_request(entorno, args.puerto, args.espera) for _ in range(args.repeticiones)])
+    finally:
+        if ruta:
+            os.unlink(ruta)
+
+    resultados = {
+        "preguntas": args.preguntas,
+        "importacion": resumen(importacion),
+        "primer_request": resumen(raiz),
+        "primer_request_base": resumen(base),
+    }
+    print(f"{'medición':<22} {'min ms':>9} {'p50 ms':>9} {'max ms':>9}")
+    for nombre in ("importacion", "primer_request", "primer_request_base"):
+        r = resultados[nombre]
+        print(f"{nombre:<22} {r['min_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['max_ms']:>9.1f}")
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
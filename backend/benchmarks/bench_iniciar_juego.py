@@ -0,0 +1,52 @@
+"""Benchmark de POST /api/jugadores/juego/iniciar.
+
+Carga N preguntas de autoevaluación y J jugadores en una base aparte y mide
+cuánto tarda iniciar el juego para cada N. Uso (desde backend/):
+
+    python -m benchmarks.bench_iniciar_juego --preguntas 1000 10000 100000 --jugadores 40
+"""
+import argparse
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app.routes.jugadores import iniciar_juego
+from .comun import base_de_prueba, recrear_esquema, sembrar_preguntas, sembrar_jugadores, resumir
+
+
+def medir(session_factory, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        db = session_factory()
+        try:
+            inicio = time.perf_counter()
+            iniciar_juego(sala_id=1, db=db)
+            tiempos.append(time.perf_counter() - inicio)
+        finally:
+            db.close()
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preguntas", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--jugadores", type=int, default=40)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--database-url", default=None, help="Por defecto, un SQLite temporal")
+    args = parser.parse_args()
+
+    with base_de_prueba(args.database_url) as engine:
+        session_factory = sessionmaker(bind=engine)
+        print(f"{'preguntas':>10} {'mediana ms':>11} {'máx ms':>9} {'µs/pregunta':>12}")
+        for num_preguntas in args.preguntas:
+            recrear_esquema(engine)
+            sembrar_preguntas(engine, num_preguntas)
+            sembrar_jugadores(engine, args.jugadores)
+            tiempos = medir(session_factory, args.repeticiones)
+            metricas = resumir(tiempos)
+            print(f"{num_preguntas:>10} {metricas['p50_ms']:>11.1f} {metricas['max_ms']:>9.1f} "
+                  f"{metricas['p50_ms'] / num_preguntas * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
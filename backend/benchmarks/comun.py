@@ -0,0 +1,76 @@
+"""Utilidades compartidas por los benchmarks: base temporal, siembra y percentiles."""
+import os
+import statistics
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, insert, update
+
+from app.database import Base
+from app.migraciones import migrar
+from app.models import Sala, Pregunta, PreguntaAutoevaluacion, Jugador
+
+LOTE_SIEMBRA = 50000
+
+
+@contextmanager
+def base_de_prueba(url=None):
+    # Engine sobre la URL dada o sobre un SQLite temporal que se borra al salir
+    ruta = None
+    if url is None:
+        ruta = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        url = f"sqlite:///{ruta}"
+    engine = create_engine(url)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        if ruta:
+            os.unlink(ruta)
+
+
+def recrear_esquema(engine):
+    # Mismo camino que en producción: las migraciones crean el esquema y la sala 1
+    Base.metadata.drop_all(bind=engine)
+    migrar(engine)
+    with engine.begin() as conn:
+        conn.execute(update(Sala).where(Sala.id == 1).values(nombre="bench"))
+
+
+def sembrar_preguntas(engine, num_preguntas, sala_id=1):
+    # Mismo número de preguntas clásicas y de autoevaluación, en lotes
+    for inicio in range(0, num_preguntas, LOTE_SIEMBRA):
+        rango = range(inicio, min(inicio + LOTE_SIEMBRA, num_preguntas))
+        with engine.begin() as conn:
+            conn.execute(insert(Pregunta), [
+                {"sala_id": sala_id, "frase": f"¿Pregunta {n}?", "respuesta": f"VERDADERO. r{n}",
+                 "verdadero": True, "ronda_respondida": 0}
+                for n in rango
+            ])
+            conn.execute(insert(PreguntaAutoevaluacion), [
+                {"sala_id": sala_id, "frase": f"¿Pregunta {n}?", "respuesta": f"R{n}", "ronda_respondida": 0}
+                for n in rango
+            ])
+
+
+def sembrar_jugadores(engine, num_jugadores, sala_id=1):
+    with engine.begin() as conn:
+        conn.execute(insert(Jugador), [
+            {"sala_id": sala_id, "nombre": f"Jugador {n}", "puntaje": 0, "consecutivas": 0}
+            for n in range(num_jugadores)
+        ])
+
+
+def resumir(tiempos, segundos_totales=None):
+    # Percentiles en milisegundos y operaciones por segundo
+    ordenados = sorted(tiempos)
+    cuantiles = statistics.quantiles(ordenados, n=100) if len(ordenados) > 1 else ordenados * 99
+    total = segundos_totales if segundos_totales is not None else sum(ordenados)
+    return {
+        "n": len(ordenados),
+        "p50_ms": round(cuantiles[49] * 1000, 3),
+        "p95_ms": round(cuantiles[94] * 1000, 3),
+        "p99_ms": round(cuantiles[98] * 1000, 3),
+        "max_ms": round(ordenados[-1] * 1000, 3),
+        "ops_por_segundo": round(len(ordenados) / total, 1) if total > 0 else None,
+    }
@@ -0,0 +1,99 @@
+"""Parseo y validación del CSV de importación: en el proceso vs. en el pool.
+
+Genera un CSV sintético (con algunas frases multilínea y filas inválidas) y
+mide cuánto tarda recorrer todos sus registros con cada cantidad de workers
+(1 = en el proceso, el camino de siempre). Verifica además que todos los
+caminos devuelvan los mismos registros con los mismos números de línea. Con
+--importar también mide la importación completa a un SQLite temporal, donde
+la escritura en la base pasa a ser el cuello de botella. Uso (desde backend/):
+
+    python -m benchmarks.importacion_paralela --filas 1000000 --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app import importacion
+from app.importacion import leer_registros, importar_csv_stream
+from .comun import base_de_prueba, recrear_esquema
+
+
+def generar_csv(ruta, filas):
+    with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+        archivo.write("pregunta,respuesta\n")
+        for i in range(filas):
+            if i % 50 == 0:
+                archivo.write(f'"¿Pregunta {i}, en\ndos líneas?",VERDADERO. Explicación {i}\n')
+            elif i % 97 == 0:
+                archivo.write(f"Pregunta {i},QUIZÁS. inválida\n")
+            else:
+                archivo.write(f"¿Es cierta la afirmación número {i}?,FALSO. Explicación de la respuesta {i}\n")
+
+
+def medir_parseo(ruta, workers):
+    # Devuelve segundos y una huella de los registros para comparar caminos
+    registros = 0
+    huella = 0
+    inicio = time.perf_counter()
+    with open(ruta, "rb") as stream:
+        for linea, resultado, _ in leer_registros(stream, "clasico", workers):
+            registros += 1
+            huella = (huella * 31 + linea + (resultado is not None and resultado[0] is None)) % (1 << 61)
+    return time.perf_counter() - inicio, registros, huella
+
+
+def medir_importacion(ruta, workers, database_url):
+    with base_de_prueba(database_url) as engine:
+        recrear_esquema(engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            original = importacion.IMPORT_WORKERS
+            importacion.IMPORT_WORKERS = workers
+            with open(ruta, "rb") as stream:
+                return importar_csv_stream(db, stream, sala_id=1, modo="clasico")["segundos"]
+        finally:
+            importacion.IMPORT_WORKERS = original
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--importar", action="store_true", help="Medir también la importación completa")
+    parser.add_argument("--database-url", default=None, help="Por defecto, un SQLite temporal")
+    args = parser.parse_args()
+
+    # Se mide el pool aunque el archivo sea chico
+    importacion.IMPORT_PARALELO_MIN_BYTES = 0
+    ruta = tempfile.NamedTemporaryFile(suffix=".csv", delete=False).name
+    try:
+        generar_csv(ruta, args.filas)
+        # Sin CPUs libres para los workers el pool no puede mostrar speedup
+        print(f"{args.filas} filas, {os.path.getsize(ruta) / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'parseo s':>9} {'filas/s':>11} {'speedup':>8}" + (f" {'importación s':>14}" if args.importar else ""))
+        base = None
+        referencia = None
+        for workers in args.workers:
+            # Una pasada previa arranca los procesos del pool fuera de la medición
+            medir_parseo(ruta, workers)
+            segundos, registros, huella = medir_parseo(ruta, workers)
+            if referencia is None:
+                referencia = (registros, huella)
+            elif (registros, huella) != referencia:
+                raise SystemExit(f"workers={workers}: los registros no coinciden con workers={args.workers[0]}")
+            base = base or segundos
+            fila = f"{workers:>8} {segundos:>9.2f} {registros / segundos:>11.0f} {base / segundos:>7.2f}x"
+            if args.importar:
+                fila += f" {medir_importacion(ruta, workers, args.database_url):>14.2f}"
+            print(fila)
+    finally:
+        importacion.cerrar_pool()
+        os.unlink(ruta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from app.main import app
+from app.database import get_db, Base
+from app.indices import activas
+from app import estadisticas, cache_preguntas, migraciones, ranking, registro_respuestas, salas
+from utils import test_engine, TestingSessionLocal, override_get_db
+import pytest
+
+app.dependency_overrides[get_db] = override_get_db
+# Los eventos de respuesta se escriben en la base de prueba
+registro_respuestas.escritor.fabrica = TestingSessionLocal
+
+@pytest.fixture(scope="module")
+def setup_database():
+    migraciones.migrar(test_engine)
+    yield
+    registro_respuestas.escritor.vaciar()
+    Base.metadata.drop_all(bind=test_engine)
+    # Los índices y caches del proceso apuntan a filas que ya no existen
+    activas.limpiar()
+    estadisticas.invalidar()
+    cache_preguntas.cache.invalidar()
+    ranking.clasificaciones.limpiar()
+    salas.olvidar_sala()
+
+@pytest.fixture
+def db_session():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
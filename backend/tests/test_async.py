@@ -0,0 +1,90 @@
+from fastapi.testclient import TestClient
+from app.main import crear_app
+from app.database import get_db, get_async_db
+from utils import override_get_db, override_get_async_db, importar_y_esperar, TestingSessionLocal
+import threading
+
+app_async = crear_app("async")
+app_async.dependency_overrides[get_db] = override_get_db
+app_async.dependency_overrides[get_async_db] = override_get_async_db
+client = TestClient(app_async)
+
+def test_rutas_async_son_corrutinas():
+    import inspect
+    rutas = {r.path: r.endpoint for r in app_async.routes if hasattr(r, "endpoint")}
+    assert inspect.iscoroutinefunction(rutas["/api/contar_preguntas"])
+    assert inspect.iscoroutinefunction(rutas["/api/jugadores/juego/iniciar"])
+    # La importación sigue en el threadpool (copia del archivo y trabajo en segundo plano)
+    assert not inspect.iscoroutinefunction(rutas["/api/importar_csv"])
+
+def test_flujo_preguntas_async(setup_database):
+    csv_content = "pregunta,respuesta\n¿Es 2+2=4?,VERDADERO. sí\n¿Es 2+2=5?,FALSO. no\n"
+    assert importar_y_esperar(client, "/api/importar_csv", csv_content, "async.csv")["importadas"] == 2
+
+    assert len(client.get("/api/preguntas/activas").json()["activas"]) == 2
+    pregunta = client.post("/api/preguntas/girar").json()["pregunta"]
+    respuestas = [client.post("/api/preguntas/responder", json={"id": pregunta["id"], "respuesta": r}).json() for r in ("VERDADERO", "FALSO")]
+    assert any(r.get("correcto") for r in respuestas)
+    assert client.get("/api/contar_preguntas").json() == {"total": 2, "activas": 1, "respondidas": 1}
+    assert client.get("/api/preguntas/9999").status_code == 404
+    assert client.get("/api/contar_preguntas?sala_id=999").status_code == 404
+
+def test_juego_async(setup_database):
+    importar_y_esperar(client, "/api/autoevaluacion/importar_csv", "pregunta,respuesta\n¿A?,a\n¿B?,b\n¿C?,c\n¿D?,d\n", "juego.csv")
+    for nombre in ("Ana", "Beto"):
+        assert client.post("/api/jugadores/", json={"nombre": nombre}).status_code == 200
+    assert client.post("/api/jugadores/juego/iniciar").json()["preguntas_asignadas"] == 4
+    jugador_id = client.post("/api/jugadores/juego/seleccionar_jugador").json()["jugador_seleccionado"]
+    assert client.get("/api/jugadores/juego/estado").json()["turno_actual"] == jugador_id
+
+def _en_paralelo(funcion):
+    hilo = threading.Thread(target=funcion, daemon=True)
+    hilo.start()
+    return hilo
+
+def test_carga_de_un_indice_no_bloquea_el_event_loop(setup_database, monkeypatch):
+    from app import indices
+    from app.indices import activas
+    from app.routes import preguntas
+    empezo, liberar = threading.Event(), threading.Event()
+    def cargador_lento(db, clave):
+        def cargar():
+            empezo.set()
+            liberar.wait(5)  # Un banco grande: segundos de CPU sin ceder el control
+            return []
+        return cargar
+    monkeypatch.setattr(preguntas, "cargador", cargador_lento)
+    # Sin los índices del arranque (usan la base de los tests): el pedido carga el suyo
+    monkeypatch.setattr(indices, "reconstruir", lambda db: None)
+    activas.invalidar(("clasico", 1))
+
+    with TestClient(app_async) as compartido:  # Un único event loop para todos los pedidos
+        lento = _en_paralelo(lambda: compartido.get("/api/preguntas/activas"))
+        assert empezo.wait(5)
+        otro = _en_paralelo(lambda: compartido.get("/api/contar_preguntas"))
+        otro.join(2)
+        atendido = not otro.is_alive()
+        liberar.set()
+        lento.join(5)
+    assert atendido
+
+def test_vaciar_el_banco_con_eventos_sin_escribir(setup_database, monkeypatch):
+    from app import registro_respuestas
+    liberar = threading.Event()
+    def fabrica_lenta():
+        liberar.wait(10)  # El escritor de eventos no puede escribir
+        return TestingSessionLocal()
+    monkeypatch.setattr(registro_respuestas.escritor, "fabrica", fabrica_lenta)
+    registro_respuestas.escritor.registrar(1, "clasico", 1, True)
+
+    with TestClient(app_async) as compartido:
+        respuestas = {}
+        borrado = _en_paralelo(lambda: respuestas.update(borrar=compartido.delete("/api/eliminar_todas_preguntas")))
+        otro = _en_paralelo(lambda: respuestas.update(contar=compartido.get("/api/contar_preguntas")))
+        borrado.join(2)
+        otro.join(2)
+        terminados = not borrado.is_alive() and not otro.is_alive()
+        liberar.set()
+    assert terminados
+    assert respuestas["borrar"].status_code == 200 and respuestas["contar"].status_code == 200
+    assert registro_respuestas.escritor.vaciar(timeout=5)
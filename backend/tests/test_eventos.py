@@ -0,0 +1,49 @@
+import asyncio
+import json
+from app.eventos import CanalEventos
+
+def test_difusion_a_varios_suscriptores():
+    async def escenario():
+        canal = CanalEventos()
+        suscripciones = [canal.suscribir(1)[0] for _ in range(3)]
+        otra_sala, _ = canal.suscribir(2)
+        canal.publicar(1, "jugador_seleccionado", jugador_id=7)
+        await asyncio.sleep(0)
+        for s in suscripciones:
+            assert json.loads(s.cola.get_nowait()) == {"tipo": "jugador_seleccionado", "seq": 1, "jugador_id": 7}
+        assert otra_sala.cola.empty()
+
+        canal.desuscribir(1, suscripciones[0])
+        assert canal.suscriptores(1) == 2
+    asyncio.run(escenario())
+
+def test_cliente_lento_recibe_resincronizar():
+    async def escenario():
+        canal = CanalEventos(maximo_pendientes=3)
+        suscripcion, _ = canal.suscribir(1)
+        for n in range(5):
+            canal.publicar(1, "puntaje_actualizado", jugador_id=1, puntaje=n)
+        await asyncio.sleep(0)
+        # Se descartó lo pendiente: el cliente debe volver a leer el estado
+        mensajes = [json.loads(suscripcion.cola.get_nowait()) for _ in range(suscripcion.cola.qsize())]
+        assert mensajes[0] == {"tipo": "resincronizar", "seq": 4}
+        assert mensajes[-1]["seq"] == 5
+    asyncio.run(escenario())
+
+def test_eventos_de_otro_proceso_con_notify():
+    from app.eventos import CanalEventosPostgres
+    class Proceso(CanalEventosPostgres):
+        # Sin PostgreSQL: el NOTIFY llega a los listeners de todos los procesos, también al que lo envió
+        def _notificar(self, payload):
+            for proceso in procesos:
+                proceso._recibir(payload)
+    async def escenario():
+        suscripciones = [p.suscribir(1)[0] for p in procesos]
+        procesos[0].publicar(1, "jugador_agregado", jugador={"id": 3})
+        procesos[1].publicar(1, "jugador_eliminado", jugador_id=3)
+        await asyncio.sleep(0)
+        for s in suscripciones:
+            mensajes = [json.loads(s.cola.get_nowait()) for _ in range(s.cola.qsize())]
+            assert [(m["tipo"], m["seq"]) for m in mensajes] == [("jugador_agregado", 1), ("jugador_eliminado", 2)]
+    procesos = [Proceso(engine=None), Proceso(engine=None)]
+    asyncio.run(escenario())
@@ -0,0 +1,106 @@
+import csv
+import io
+
+from app import importacion
+from app.importacion import leer_lineas, parsear_clasico
+from app.parseo_csv import cortar_registros, FilaInvalida
+import pytest
+
+def test_leer_lineas_bloques_pequenos_multibyte():
+    texto = "pregunta,respuesta\n¿Qué año?,\"VERDADERO. en\ndos líneas\"\nñandú,FALSO. ave\n"
+    stream = io.BytesIO(texto.encode("utf-8"))
+    # Bloques de 3 bytes cortan caracteres multibyte y comillas
+    filas = list(csv.reader(leer_lineas(stream, tamano_bloque=3)))
+    assert filas == list(csv.reader(io.StringIO(texto)))
+    assert filas[1][1] == "VERDADERO. en\ndos líneas"
+
+def test_leer_lineas_sin_salto_final():
+    stream = io.BytesIO("a,b\nc,d".encode("utf-8"))
+    assert list(leer_lineas(stream, tamano_bloque=2)) == ["a,b\n", "c,d"]
+
+def test_parsear_clasico_invalida():
+    assert parsear_clasico("x", "FALSO. no")["verdadero"] is False
+    with pytest.raises(FilaInvalida):
+        parsear_clasico("x", "QUIZAS. no")
+
+def test_cortar_registros_respeta_comillas():
+    datos = b'a,b\nc,"d\ne""\nf"\ng,"h\n'
+    # El ultimo "\n" esta dentro de un campo abierto; el anterior cierra el registro "c"
+    assert cortar_registros(datos) == datos.index(b"g,")
+    assert cortar_registros(b'a,"b\nc') == -1
+    assert cortar_registros(b"sin salto") == -1
+
+def _csv_grande(cantidad=300):
+    filas = ["pregunta,respuesta"]
+    for i in range(cantidad):
+        if i % 7 == 0:
+            filas.append(f'"frase {i} en\ndos lineas",VERDADERO. si')
+        elif i % 11 == 0:
+            filas.append(f"frase {i},QUIZAS. no")
+        elif i % 13 == 0:
+            filas.append("")
+        else:
+            filas.append(f"frase {i},FALSO. no")
+    return ("\n".join(filas) + "\n").encode("utf-8")
+
+def _registros(generador):
+    return [(linea, resultado) for linea, resultado, _ in generador]
+
+@pytest.mark.parametrize("datos", [
+    _csv_grande(),
+    # Una comilla suelta dentro de un campo sin comillas desalinea el corte por paridad
+    _csv_grande().replace(b"frase 150,", b'frase 1"50,'),
+], ids=["comillas", "comilla_suelta"])
+def test_parseo_paralelo_igual_al_secuencial(datos):
+    secuencial = _registros(importacion._registros_secuenciales(io.BytesIO(datos), parsear_clasico))
+    stream = io.BytesIO(datos)
+    paralelo = _registros(importacion._registros_paralelos(stream, "clasico", 2, tamano_bloque=256))
+    try:
+        assert paralelo == secuencial
+    finally:
+        importacion.cerrar_pool()
+    # Las líneas son las del archivo aunque haya saltos dentro de comillas
+    rechazados = [linea for linea, resultado in secuencial[1:] if resultado and resultado[1]]
+    assert rechazados[0] == 15
+
+def test_comilla_suelta_al_principio_vuelve_al_pool(monkeypatch):
+    # Una comilla suelta en la tercera fila: solo ese tramo se parsea en el proceso
+    datos = _csv_grande(3000).replace(b"frase 2,", b'frase "2,', 1)
+    secuencial = _registros(importacion._registros_secuenciales(io.BytesIO(datos), parsear_clasico))
+    tramos = []
+    original = importacion._registros_hasta
+    def registrar_tramo(stream, parsear, desde_byte, primera_linea, hasta_byte):
+        limite = yield from original(stream, parsear, desde_byte, primera_linea, hasta_byte)
+        tramos.append((desde_byte, len(datos) if limite is None else limite[0]))
+        return limite
+    monkeypatch.setattr(importacion, "_registros_hasta", registrar_tramo)
+
+    try:
+        paralelo = _registros(importacion._registros_paralelos(io.BytesIO(datos), "clasico", 2, tamano_bloque=1024))
+    finally:
+        importacion.cerrar_pool()
+    assert paralelo == secuencial
+    assert tramos and tramos[0][0] < 1024
+    assert sum(hasta - desde for desde, hasta in tramos) <= 3 * 1024 < len(datos) // 10
+
+def test_retomar_desde_el_inicio_de_un_registro():
+    datos = _csv_grande()
+    todos = list(importacion._registros_secuenciales(io.BytesIO(datos), parsear_clasico))
+    # Un registro después de varios con saltos de línea entre comillas
+    k = 100
+    byte, linea = todos[k][2]
+    assert linea == todos[k][0]
+    stream = io.BytesIO(datos)
+    stream.seek(byte)
+    paralelo = importacion._registros_paralelos(stream, "clasico", 2, tamano_bloque=256, desde=(byte, linea))
+    try:
+        retomados = list(paralelo)
+    finally:
+        importacion.cerrar_pool()
+    assert [r[:2] for r in retomados] == [r[:2] for r in todos[k:]]
+    # El inicio de un registro del pool es el de su bloque, también un límite de registro
+    byte, linea = retomados[50][2]
+    desde = next(i for i, r in enumerate(todos) if r[2][0] >= byte)
+    stream.seek(byte)
+    siguientes = list(importacion._registros_secuenciales(stream, parsear_clasico, (byte, linea)))
+    assert [r[:2] for r in siguientes] == [r[:2] for r in todos[desde:]]
@@ -0,0 +1,94 @@
+from app.indices import ConjuntoAleatorio, ConjuntoActivo, RegistroIndices
+
+def test_conjunto_aleatorio_quitar_y_elegir():
+    conjunto = ConjuntoAleatorio([1, 2, 3, 4])
+    assert conjunto.quitar(2) == True
+    assert conjunto.quitar(2) == False
+    assert len(conjunto) == 3
+    assert 2 not in conjunto
+    assert sorted(conjunto) == [1, 3, 4]
+    assert conjunto.elegir() in (1, 3, 4)
+    assert sorted(conjunto.muestra(10)) == [1, 3, 4]
+
+def test_girar_descarta_ids_obsoletos():
+    registro = RegistroIndices()
+    respondidas = {1, 2}
+    def obtener(pregunta_id):
+        return None if pregunta_id in respondidas else {"id": pregunta_id}
+
+    resultado = registro.girar("clasico", lambda: [(1, False), (2, False), (3, False)], obtener, 5)
+    assert resultado["pregunta"] == {"id": 3}
+    assert resultado["muestra"][resultado["indice"]] == 3
+
+def test_girar_sin_activas():
+    registro = RegistroIndices()
+    assert registro.girar("clasico", lambda: [], lambda i: {"id": i}, 5) is None
+
+def test_conjunto_activo_reinicio_en_o1():
+    conjunto = ConjuntoActivo([(5, False), (1, True), (3, False), (9, False)])
+    assert len(conjunto) == 3 and conjunto.total == 4
+    assert 1 not in conjunto and 3 in conjunto
+    assert conjunto.quitar(3) == True
+    assert conjunto.quitar(3) == False
+    assert sorted(conjunto) == [5, 9]
+    assert conjunto.elegir() in (5, 9)
+
+    conjunto.reiniciar()
+    assert sorted(conjunto) == [1, 3, 5, 9]
+    assert conjunto.generacion == 1
+
+    conjunto.agregar(12)  # Id nuevo al final del universo
+    conjunto.agregar(4)  # Id intermedio: se rearma
+    assert sorted(conjunto) == [1, 3, 4, 5, 9, 12]
+    assert conjunto.generacion == 1
+
+def test_quitar_ignora_respuestas_de_una_generacion_anterior():
+    registro = RegistroIndices()
+    registro.obtener("clasico", lambda: [(1, False), (2, False)])
+    generacion = registro.generacion("clasico")
+    registro.reiniciar("clasico")
+    registro.quitar("clasico", 1, generacion)
+    assert registro.contiene("clasico", 1) == True
+    registro.quitar("clasico", 1, registro.generacion("clasico"))
+    assert registro.contiene("clasico", 1) == False
+
+def test_reconstruccion_no_pisa_cambios_durante_la_lectura():
+    registro = RegistroIndices()
+    registro.iniciar_reconstruccion()
+    # Mientras se lee la base: una respuesta y un índice cargado al usarse
+    registro.quitar(("clasico", 1), 7)
+    registro.obtener(("clasico", 2), lambda: [(4, False)])
+    registro.completar({
+        ("clasico", 1): ConjuntoActivo([(7, False)]),
+        ("clasico", 2): ConjuntoActivo([(4, False), (5, False)]),
+        ("clasico", 3): ConjuntoActivo([(6, False)]),
+    })
+    assert registro.contiene(("clasico", 1), 7) is None  # Se vuelve a cargar al usarse
+    assert sorted(registro.obtener(("clasico", 2), lambda: [])) == [4]
+    assert registro.contiene(("clasico", 3), 6) == True
+
+def test_recarga_si_otro_proceso_cambio_la_version():
+    registro = RegistroIndices()
+    base = {"filas": [(1, False), (2, False)]}
+    registro.obtener("clasico", lambda: base["filas"], version=3)
+    # Escritura de este proceso: la versión avanza con el índice, sin recargar
+    registro.quitar("clasico", 1, registro.generacion("clasico"), version=4)
+    assert registro.contiene("clasico", 1, version=4) == False
+
+    # Otro proceso reinició el banco (versión 5): el índice quedó atrás
+    base["filas"] = [(1, False), (2, False)]
+    assert registro.contiene("clasico", 1, version=5) is None
+    assert sorted(registro.obtener("clasico", lambda: base["filas"], version=5)) == [1, 2]
+    assert registro.contiene("clasico", 1, version=5) == True
+
+    # Si la escritura propia no es la siguiente versión, hubo otras en el medio
+    registro.quitar("clasico", 2, registro.generacion("clasico"), version=7)
+    assert registro.contiene("clasico", 2, version=7) is None
+
+def test_girar_recarga_un_indice_vacio():
+    registro = RegistroIndices()
+    base = {"filas": [(1, True)]}
+    assert registro.girar("clasico", lambda: base["filas"], lambda i: {"id": i}, 5) is None
+    # Otro proceso reinició el banco: sin versión, un índice vacío se recarga antes de rendirse
+    base["filas"] = [(1, False)]
+    assert registro.girar("clasico", lambda: base["filas"], lambda i: {"id": i}, 5)["pregunta"] == {"id": 1}
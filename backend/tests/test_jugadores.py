@@ -0,0 +1,244 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import PreguntaAutoevaluacion
+from app.estado_juego import AlmacenEstadoMemoria, AlmacenEstadoDB
+from app.routes import jugadores
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+import pytest
+from utils import TestingSessionLocal
+
+client = TestClient(app)
+
+@pytest.fixture(params=["memoria", "db"])
+def almacen(request, monkeypatch):
+    almacen = AlmacenEstadoMemoria() if request.param == "memoria" else AlmacenEstadoDB()
+    monkeypatch.setattr(jugadores, "almacen", almacen)
+    return almacen
+
+@pytest.fixture(scope="module")
+def juego(setup_database):
+    # Los jugadores se crean primero: la primera request crea la sala por defecto
+    ids = [client.post("/api/jugadores/", json={"nombre": nombre}).json()["id"] for nombre in ("Ana", "Beto", "Caro")]
+    db = TestingSessionLocal()
+    db.add_all([PreguntaAutoevaluacion(sala_id=1, frase=f"¿Pregunta {n}?", respuesta=f"R{n}") for n in range(9)])
+    db.commit()
+    db.close()
+    return ids
+
+def test_iniciar_y_seleccionar_jugadores(juego, almacen):
+    response = client.post("/api/jugadores/juego/iniciar")
+    assert response.status_code == 200
+    assert response.json()["preguntas_asignadas"] == 9
+
+    # Una vuelta completa selecciona a cada jugador una sola vez
+    seleccionados = [client.post("/api/jugadores/juego/seleccionar_jugador").json()["jugador_seleccionado"] for _ in juego]
+    assert sorted(seleccionados) == sorted(juego)
+
+    estado = client.get("/api/jugadores/juego/estado").json()
+    assert estado["turno_actual"] == seleccionados[-1]
+    assert sorted(estado["cola_pendientes"]) == sorted(juego)
+    assert [j["id"] for j in estado["jugadores"]] == juego
+
+def test_seleccion_concurrente_sin_repetidos(juego, almacen):
+    client.post("/api/jugadores/juego/iniciar")
+    with ThreadPoolExecutor(max_workers=len(juego)) as pool:
+        seleccionados = list(pool.map(
+            lambda _: client.post("/api/jugadores/juego/seleccionar_jugador").json()["jugador_seleccionado"],
+            juego,
+        ))
+    assert sorted(seleccionados) == sorted(juego)
+
+def test_responder_actualiza_estado(juego, almacen):
+    client.post("/api/jugadores/juego/iniciar")
+    jugador_id = juego[0]
+    pregunta = client.post(f"/api/jugadores/{jugador_id}/preguntas/girar").json()["pregunta"]
+    response = client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta['id']}/responder", json={"evaluacion": "bien"})
+    assert response.json()["puntaje_total"] == 1
+
+    estado = client.get("/api/jugadores/juego/estado").json()
+    assert next(j for j in estado["jugadores"] if j["id"] == jugador_id)["puntaje"] == 1
+    activas = client.get(f"/api/jugadores/{jugador_id}/preguntas/activas").json()["activas"]
+    assert pregunta["id"] not in activas
+
+def test_estado_del_juego_con_etag(juego, almacen):
+    client.post("/api/jugadores/juego/iniciar")
+    etag = client.get("/api/jugadores/juego/estado").headers["etag"]
+    assert client.get("/api/jugadores/juego/estado", headers={"If-None-Match": etag}).status_code == 304
+
+    # Un cambio de puntaje (sin tocar turno ni cola) también cambia el ETag
+    jugador_id = juego[1]
+    pregunta = client.post(f"/api/jugadores/{jugador_id}/preguntas/girar").json()["pregunta"]
+    client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta['id']}/responder", json={"evaluacion": "bien"})
+    response = client.get("/api/jugadores/juego/estado", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert next(j for j in response.json()["jugadores"] if j["id"] == jugador_id)["puntaje"] == 1
+
+def test_estadisticas_por_jugador(juego, almacen):
+    from app import registro_respuestas
+    client.post("/api/jugadores/juego/iniciar")
+    jugador_id = juego[2]
+    antes = client.get(f"/api/jugadores/{jugador_id}/estadisticas").json()
+    pregunta = client.post(f"/api/jugadores/{jugador_id}/preguntas/girar").json()["pregunta"]
+    client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta['id']}/responder", json={"evaluacion": "mal"})
+    client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta['id']}/responder", json={"evaluacion": "bien"})
+    assert registro_respuestas.escritor.vaciar(timeout=5)
+
+    despues = client.get(f"/api/jugadores/{jugador_id}/estadisticas").json()
+    assert (despues["intentos"] - antes["intentos"], despues["correctas"] - antes["correctas"]) == (2, 1)
+    jugadores = client.get("/api/jugadores/estadisticas").json()["jugadores"]
+    assert sorted(j["id"] for j in jugadores) == sorted(juego)
+    preguntas = client.get("/api/jugadores/estadisticas/preguntas").json()["preguntas"]
+    assert pregunta["id"] in {p["id"] for p in preguntas}
+    assert client.get("/api/jugadores/999999/estadisticas").status_code == 404
+
+def test_iniciar_reparte_todas_las_preguntas(juego, almacen):
+    client.post("/api/jugadores/juego/reiniciar")
+    client.post("/api/jugadores/juego/iniciar")
+    asignadas = [client.get(f"/api/jugadores/{j}/preguntas/activas").json()["activas"] for j in juego]
+    # Reparto parejo y sin repetidos: cada pregunta activa a un solo jugador
+    assert [len(a) for a in asignadas] == [3, 3, 3]
+    assert len({p for a in asignadas for p in a}) == 9
+    assert all(j["puntaje"] == 0 for j in client.get("/api/jugadores/").json())
+
+def test_eventos_del_juego_por_websocket(juego, almacen):
+    with client.websocket_connect("/api/jugadores/juego/eventos") as ws:
+        assert ws.receive_json()["tipo"] == "conectado"
+
+        client.post("/api/jugadores/juego/iniciar")
+        evento = ws.receive_json()
+        assert evento["tipo"] == "juego_iniciado"
+        assert [j["id"] for j in evento["jugadores"]] == juego
+
+        jugador_id = client.post("/api/jugadores/juego/seleccionar_jugador").json()["jugador_seleccionado"]
+        seleccionado = ws.receive_json()
+        assert seleccionado == {"tipo": "jugador_seleccionado", "seq": evento["seq"] + 1, "jugador_id": jugador_id}
+
+        pregunta = client.post(f"/api/jugadores/{jugador_id}/preguntas/girar").json()["pregunta"]
+        client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta['id']}/responder", json={"evaluacion": "bien"})
+        tipos = [ws.receive_json() for _ in range(3)]
+        assert [e["tipo"] for e in tipos] == ["respuesta_evaluada", "puntaje_actualizado", "pregunta_quitada"]
+        assert tipos[1]["puntaje"] == 1
+
+def test_responder_concurrente_puntua_una_vez(juego, almacen):
+    client.post("/api/jugadores/juego/reiniciar")
+    client.post("/api/jugadores/juego/iniciar")
+    jugador_id = juego[1]
+    pregunta = client.post(f"/api/jugadores/{jugador_id}/preguntas/girar").json()["pregunta"]
+    url = f"/api/jugadores/{jugador_id}/preguntas/{pregunta['id']}/responder"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        respuestas = list(pool.map(lambda _: client.post(url, json={"evaluacion": "bien"}), range(4)))
+    assert all(r.status_code == 200 for r in respuestas)
+    assert sorted(r.json()["puntos_ganados"] for r in respuestas) == [0, 0, 0, 1]
+    assert all(r.json()["puntaje_total"] == 1 for r in respuestas)
+
+    # Con la pregunta ya respondida, "mal" no resta puntos
+    assert client.post(url, json={"evaluacion": "mal"}).status_code == 400
+    assert client.post(f"/api/jugadores/{jugador_id}/preguntas/0/responder", json={"evaluacion": "bien"}).status_code == 404
+
+def test_responder_en_lote_en_orden_del_cliente(juego, almacen):
+    client.post("/api/jugadores/juego/reiniciar")
+    client.post("/api/jugadores/juego/iniciar")
+    jugador_id = juego[2]
+    p1, p2, p3 = client.get(f"/api/jugadores/{jugador_id}/preguntas/activas").json()["activas"][:3]
+    envio = uuid.uuid4().hex[:8]  # Los id_cliente son únicos por respuesta
+    lote = {"respuestas": [
+        # Llegan desordenadas: se aplican por respondida_en
+        {"id_cliente": f"{envio}-c", "pregunta_id": p3, "evaluacion": "bien", "respondida_en": "2024-05-01T10:02:00Z"},
+        {"id_cliente": f"{envio}-a", "pregunta_id": p1, "evaluacion": "bien", "respondida_en": "2024-05-01T10:00:00Z"},
+        {"id_cliente": f"{envio}-b", "pregunta_id": p2, "evaluacion": "mal", "respondida_en": "2024-05-01T10:01:00Z"},
+        {"id_cliente": f"{envio}-d", "pregunta_id": p1, "evaluacion": "mal", "respondida_en": "2024-05-01T10:03:00Z"},
+        {"id_cliente": f"{envio}-e", "pregunta_id": 0, "evaluacion": "bien"},
+    ]}
+    url = f"/api/jugadores/{jugador_id}/preguntas/responder_lote"
+    data = client.post(url, json=lote).json()
+    resultados = {r["id_cliente"].split("-")[1]: r for r in data["resultados"]}
+    assert [r["id_cliente"].split("-")[1] for r in data["resultados"]] == ["c", "a", "b", "d", "e"]
+    assert (resultados["a"]["puntos_ganados"], resultados["a"]["puntaje_total"]) == (1, 1)
+    assert (resultados["b"]["puntos_ganados"], resultados["b"]["puntaje_total"]) == (-1, 0)
+    assert (resultados["c"]["puntos_ganados"], resultados["c"]["puntaje_total"]) == (1, 1)
+    assert resultados["d"]["error"]["status"] == 400
+    assert resultados["e"]["error"]["status"] == 404
+    assert client.get(f"/api/jugadores/{jugador_id}").json()["puntaje"] == 1
+
+    # Reenviar el lote (p. ej. tras un timeout) no vuelve a restar ni a sumar
+    data = client.post(url, json=lote).json()
+    assert data["aplicadas"] == 0 and all(r["repetida"] for r in data["resultados"])
+    assert data["resultados"][2]["puntaje_total"] == 0
+    assert client.get(f"/api/jugadores/{jugador_id}").json()["puntaje"] == 1
+    activas = client.get(f"/api/jugadores/{jugador_id}/preguntas/activas").json()["activas"]
+    assert p1 not in activas and p3 not in activas and p2 in activas
+
+    assert client.post("/api/jugadores/0/preguntas/responder_lote", json={"respuestas": []}).status_code == 404
+
+def test_ranking_sigue_los_puntajes(juego, almacen):
+    client.post("/api/jugadores/juego/reiniciar")
+    client.post("/api/jugadores/juego/iniciar")
+    ranking = client.get("/api/jugadores/ranking?top=2").json()
+    assert ranking["total"] == 3
+    assert [j["id"] for j in ranking["ranking"]] == sorted(juego)[:2]
+
+    jugador_id = max(juego)
+    pregunta_id = client.get(f"/api/jugadores/{jugador_id}/preguntas/activas").json()["activas"][0]
+    with client.websocket_connect("/api/jugadores/juego/eventos") as ws:
+        ws.receive_json()  # conectado
+        client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta_id}/responder", json={"evaluacion": "bien"})
+        eventos = [ws.receive_json() for _ in range(3)]
+    delta = next(e for e in eventos if e["tipo"] == "puntaje_actualizado")
+    assert (delta["posicion_anterior"], delta["posicion"]) == (3, 1)
+
+    assert client.get("/api/jugadores/ranking?top=1").json()["ranking"][0]["id"] == jugador_id
+    assert client.get(f"/api/jugadores/{jugador_id}/ranking").json()["posicion"] == 1
+    assert client.get(f"/api/jugadores/{min(juego)}/ranking").json()["posicion"] == 2
+    assert client.get("/api/jugadores/0/ranking").status_code == 404
+
+def test_ranking_sigue_los_cambios_de_otro_proceso(juego, almacen):
+    from sqlalchemy import update
+    from app import ranking
+    from app.models import Jugador
+    client.post("/api/jugadores/juego/reiniciar")
+    primero = client.get("/api/jugadores/ranking?top=1").json()["ranking"][0]["id"]
+
+    # Otro worker suma puntos: escribe en la base sin tocar la clasificación de este proceso
+    otro = max(juego)
+    db = TestingSessionLocal()
+    db.execute(update(Jugador).where(Jugador.id == otro).values(puntaje=10, version=Jugador.version + 1))
+    db.commit()
+    db.close()
+
+    assert primero != otro
+    data = client.get("/api/jugadores/ranking?top=1").json()["ranking"][0]
+    assert (data["id"], data["puntaje"]) == (otro, 10)
+    assert client.get(f"/api/jugadores/{primero}/ranking").json()["posicion"] == 2
+
+    # Una respuesta de este proceso con la clasificación al día se aplica en memoria
+    jugador_id = min(juego)
+    client.post("/api/jugadores/juego/iniciar")
+    client.get("/api/jugadores/ranking")
+    pregunta_id = client.get(f"/api/jugadores/{jugador_id}/preguntas/activas").json()["activas"][0]
+    client.post(f"/api/jugadores/{jugador_id}/preguntas/{pregunta_id}/responder", json={"evaluacion": "bien"})
+    cargar = lambda ids=None: pytest.fail("la clasificación debía estar al día")
+    db = TestingSessionLocal()
+    total, jugador = ranking.clasificaciones.jugador(1, cargar, jugador_id, ranking.versiones(db, 1))
+    db.close()
+    assert (total, jugador["puntaje"], jugador["posicion"]) == (3, 1, 1)
+
+def test_mal_con_un_punto_igual_en_la_ruta_y_en_el_lote(juego, almacen):
+    client.post("/api/jugadores/juego/reiniciar")
+    client.post("/api/jugadores/juego/iniciar")
+    resultados = []
+    for jugador_id, en_lote in ((juego[0], False), (juego[1], True)):
+        p1, p2 = client.get(f"/api/jugadores/{jugador_id}/preguntas/activas").json()["activas"][:2]
+        client.post(f"/api/jugadores/{jugador_id}/preguntas/{p1}/responder", json={"evaluacion": "bien"})
+        assert client.get(f"/api/jugadores/{jugador_id}").json()["puntaje"] == 1
+        if en_lote:
+            lote = {"respuestas": [{"id_cliente": uuid.uuid4().hex, "pregunta_id": p2, "evaluacion": "mal"}]}
+            data = client.post(f"/api/jugadores/{jugador_id}/preguntas/responder_lote", json=lote).json()["resultados"][0]
+        else:
+            data = client.post(f"/api/jugadores/{jugador_id}/preguntas/{p2}/responder", json={"evaluacion": "mal"}).json()
+        resultados.append((data["puntos_ganados"], data["puntaje_total"]))
+        # Ya en 0: otro "mal" no resta
+        data = client.post(f"/api/jugadores/{jugador_id}/preguntas/{p2}/responder", json={"evaluacion": "mal"}).json()
+        assert (data["puntos_ganados"], data["puntaje_total"]) == (0, 0)
+    assert resultados == [(-1, 0), (-1, 0)]
@@ -0,0 +1,41 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.main import app
+from app import metricas
+from utils import test_engine
+
+client = TestClient(app)
+metricas.instrumentar_engine(test_engine, "pruebas")
+
+def test_metrics_por_ruta_y_consultas(setup_database):
+    antes = metricas.consultas_por_request.cantidad("/api/preguntas/{pregunta_id}")
+    client.get("/api/preguntas/12345")
+    assert metricas.consultas_por_request.cantidad("/api/preguntas/{pregunta_id}") == antes + 1
+
+    texto = client.get("/metrics").text
+    assert 'ruleta_http_requests_total{ruta="/api/preguntas/{pregunta_id}",metodo="GET",estado="404"}' in texto
+    assert "# TYPE ruleta_http_duracion_segundos histogram" in texto
+    assert 'ruleta_db_pool_en_uso{engine="pruebas"}' in texto
+    # Las sentencias del endpoint (en el threadpool) se atribuyen al request
+    sumas = [l for l in texto.splitlines() if l.startswith('ruleta_db_consultas_por_request_sum{ruta="/api/preguntas/{pregunta_id}"}')]
+    assert float(sumas[0].split()[-1]) >= 1
+
+def test_detecta_consultas_repetidas(caplog):
+    mini = FastAPI()
+    mini.add_middleware(metricas.MiddlewareMetricas, lento_ms=0.001)
+
+    @mini.get("/jugadores")
+    def listar():
+        # Una consulta por fila: el patrón N+1
+        with test_engine.connect() as conn:
+            for i in range(metricas.METRICAS_REPETICIONES_NMAS1):
+                conn.execute(text("SELECT :i"), {"i": i})
+        return []
+
+    antes = metricas.consultas_repetidas.valor("/jugadores")
+    with caplog.at_level("WARNING", logger="app.metricas"):
+        TestClient(mini).get("/jugadores")
+    assert metricas.consultas_repetidas.valor("/jugadores") == antes + 1
+    assert any("Posible N+1" in r.message for r in caplog.records)
+    assert any("Request lento" in r.message and "SELECT ?" in r.message for r in caplog.records)
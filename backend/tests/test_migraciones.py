@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, inspect, text
+from app import migraciones
+from app.database import Base
+
+def _esquema_original(engine):
+    # Tablas como las creaba la app antes de las salas y las rondas
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE preguntas (id INTEGER PRIMARY KEY, frase VARCHAR, respuesta VARCHAR, respondida BOOLEAN)"))
+        conn.execute(text("CREATE INDEX ix_preguntas_respondida ON preguntas (respondida)"))
+        conn.execute(text("CREATE TABLE preguntas_autoevaluacion (id INTEGER PRIMARY KEY, frase VARCHAR, respuesta VARCHAR, respondida BOOLEAN)"))
+        conn.execute(text("CREATE TABLE jugadores (id INTEGER PRIMARY KEY, nombre VARCHAR, puntaje INTEGER)"))
+        conn.execute(text(
+            "CREATE TABLE preguntas_jugadores (id INTEGER PRIMARY KEY, jugador_id INTEGER REFERENCES jugadores(id), "
+            "pregunta_id INTEGER, frase VARCHAR, respuesta VARCHAR, respondida BOOLEAN)"
+        ))
+        conn.execute(text(
+            "INSERT INTO preguntas (id, frase, respuesta, respondida) "
+            "VALUES (1, 'a', 'VERDADERO', 1), (2, 'b', 'FALSO', 0), (3, ' A', 'VERDADERO', 0)"
+        ))
+
+def test_migrar_base_anterior(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'anterior.db'}")
+    _esquema_original(engine)
+
+    assert migraciones.migrar(engine) == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17]
+
+    columnas = {c["name"] for c in inspect(engine).get_columns("preguntas")}
+    assert {"sala_id", "ronda_respondida"} <= columnas and "respondida" not in columnas
+    with engine.connect() as conn:
+        filas = conn.execute(text("SELECT id, sala_id, ronda_respondida FROM preguntas ORDER BY id")).all()
+        # La frase repetida (misma forma normalizada) se descarta
+        assert [tuple(f) for f in filas] == [(1, 1, 1), (2, 1, 0)]
+        assert conn.execute(text("SELECT count(*) FROM preguntas WHERE hash_frase IS NULL")).scalar_one() == 0
+        assert conn.execute(text("SELECT ronda_clasico FROM salas WHERE id = 1")).scalar_one() == 1
+        assert migraciones.version(conn) == migraciones.VERSION_ACTUAL
+    # Con la base al día no hay nada que aplicar
+    assert migraciones.migrar(engine) == []
+    engine.dispose()
+
+def test_migrar_base_nueva(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'nueva.db'}")
+    assert migraciones.migrar(engine) == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17]
+    assert "ix_preguntas_sala_ronda_id" in {i["name"] for i in inspect(engine).get_indexes("preguntas")}
+    # El esquema fijo de la versión 1 más las migraciones llegan a los modelos actuales
+    inspector = inspect(engine)
+    for tabla in Base.metadata.sorted_tables:
+        assert {c["name"] for c in inspector.get_columns(tabla.name)} == {c.name for c in tabla.columns}, tabla.name
+        assert {i.name for i in tabla.indexes} <= {i["name"] for i in inspector.get_indexes(tabla.name)}, tabla.name
+    engine.dispose()
+
+def test_completar_hashes_por_lotes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'hashes.db'}")
+    migraciones.migrar(engine)
+    tabla = Base.metadata.tables["preguntas"]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO preguntas (id, sala_id, frase, respuesta, verdadero) "
+            "VALUES (4, 1, 'd', 'FALSO', 0), (7, 1, 'e', 'FALSO', 0), (9, 1, 'f', 'FALSO', 0)"
+        ))
+        migraciones._completar_hashes(conn, tabla, lote=2)
+        assert conn.execute(text("SELECT count(*) FROM preguntas WHERE hash_frase IS NULL")).scalar_one() == 0
+    engine.dispose()
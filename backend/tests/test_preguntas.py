@@ -1,37 +1,18 @@
 from fastapi.testclient import TestClient
 from app.main import app
-from app.database import get_db, Base, engine
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 import pytest
-
-# Configuración de base de datos de prueba
-TEST_DATABASE_URL = "sqlite:///./test.db"
-test_engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
-
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
+import json
+import time
+from utils import TestingSessionLocal, importar_y_esperar
 
 client = TestClient(app)
 
-@pytest.fixture(scope="module")
-def setup_database():
-    Base.metadata.create_all(bind=test_engine)
-    yield
-    Base.metadata.drop_all(bind=test_engine)
-
 def test_importar_csv(setup_database):
     csv_content = "pregunta,respuesta\n¿Cuál es la capital de Francia?,VERDADERO. París es la capital\n¿Cuál es la capital de España?,FALSO. Madrid es la capital\n"
-    response = client.post("/api/importar_csv", files={"file": ("test.csv", csv_content, "text/csv")})
-    assert response.status_code == 200
-    assert "Preguntas importadas exitosamente" in response.json()["message"]
+    resultado = importar_y_esperar(client, "/api/importar_csv", csv_content)
+    assert resultado["estado"] == "completada"
+    assert resultado["importadas"] == 2
+    assert resultado["progreso"] == 1.0
 
 def test_get_preguntas_activas(setup_database):
     response = client.get("/api/preguntas/activas")
@@ -53,7 +34,7 @@ def test_responder_pregunta_correcta(setup_database):
 def test_responder_pregunta_incorrecta(setup_database):
     # Importar otra pregunta
     csv_content = "pregunta,respuesta\n¿Cuál es la capital de Italia?,FALSO. Roma es la capital\n"
-    client.post("/api/importar_csv", files={"file": ("test2.csv", csv_content, "text/csv")})
+    importar_y_esperar(client, "/api/importar_csv", csv_content, "test2.csv")
 
     response = client.post("/api/preguntas/responder", json={"id": 2, "respuesta": "VERDADERO"})
     assert response.status_code == 200
@@ -62,9 +43,10 @@ def test_responder_pregunta_incorrecta(setup_database):
 # Tests para autoevaluación
 def test_importar_csv_autoevaluacion(setup_database):
     csv_content = "pregunta,respuesta\n¿Cuál es la capital de Francia?,París\n¿Cuál es la capital de España?,Madrid\n"
-    response = client.post("/api/autoevaluacion/importar_csv", files={"file": ("test.csv", csv_content, "text/csv")})
-    assert response.status_code == 200
-    assert "Preguntas de autoevaluación importadas exitosamente" in response.json()["message"]
+    resultado = importar_y_esperar(client, "/api/autoevaluacion/importar_csv", csv_content)
+    assert resultado["estado"] == "completada"
+    assert resultado["modo"] == "autoevaluacion"
+    assert resultado["importadas"] == 2
 
 def test_get_preguntas_activas_autoevaluacion(setup_database):
     response = client.get("/api/autoevaluacion/preguntas/activas")
@@ -90,4 +72,509 @@ def test_responder_pregunta_mal_autoevaluacion(setup_database):
     response = client.post("/api/autoevaluacion/preguntas/responder", json={"id": 2, "evaluacion": "mal"})
     assert response.status_code == 200
     assert response.json()["evaluacion"] == "mal"
-    assert response.json()["respondida"] == False  # No se marca como respondida
\ No newline at end of file
+    assert response.json()["respondida"] == False  # No se marca como respondida
+
+def test_importar_csv_reporta_rechazadas(setup_database):
+    csv_content = "pregunta,respuesta\n¿Es 1+1=2?,VERDADERO. sí\nsolo_una_columna\n,FALSO. vacía\n"
+    data = importar_y_esperar(client, "/api/importar_csv?batch_size=1", csv_content, "test3.csv")
+    assert data["importadas"] == 1
+    assert data["rechazadas"] == 2
+    assert "filas_por_segundo" in data
+
+def test_importar_csv_filas_invalidas_van_al_reporte(setup_database):
+    antes = client.get("/api/contar_preguntas").json()["total"]
+    csv_content = "pregunta,respuesta\n¿El sol es una estrella?,VERDADERO. sí\n¿La luna es un planeta?,QUIZAS. no\n"
+    data = importar_y_esperar(client, "/api/importar_csv", csv_content, "test4.csv")
+    assert data["importadas"] == 1
+    assert data["rechazadas"] == 1
+    assert client.get("/api/contar_preguntas").json()["total"] == antes + 1
+
+    reporte = client.get(data["errores_url"])
+    assert reporte.status_code == 200
+    lineas = reporte.text.strip().splitlines()
+    assert lineas[0] == "linea,motivo,contenido"
+    assert lineas[1].startswith("3,")
+
+def test_importar_csv_atomica_y_reanudable(setup_database, monkeypatch):
+    import app.importacion as importacion
+    antes = client.get("/api/contar_preguntas").json()["total"]
+    csv_content = "pregunta,respuesta\n" + "".join(f"¿Pregunta {n}?,VERDADERO. r{n}\n" for n in range(5))
+
+    insertar_original = importacion.insertar_lote
+    llamadas = []
+    def insertar_que_falla(db, tabla, filas):
+        if tabla.name == "importaciones_staging" and filas:
+            llamadas.append(len(filas))
+            if len(llamadas) == 3:
+                raise RuntimeError("Conexión perdida")
+        insertar_original(db, tabla, filas)
+    monkeypatch.setattr(importacion, "insertar_lote", insertar_que_falla)
+
+    data = importar_y_esperar(client, "/api/importar_csv?batch_size=2", csv_content, "grande.csv")
+    assert data["estado"] == "fallida"
+    assert "Conexión perdida" in data["error"]
+    # Nada visible en la tabla destino tras el fallo
+    assert client.get("/api/contar_preguntas").json()["total"] == antes
+
+    monkeypatch.setattr(importacion, "insertar_lote", insertar_original)
+    leer_original = importacion.leer_registros
+    desde = []
+    monkeypatch.setattr(importacion, "leer_registros", lambda *a: desde.append(a[3]) or leer_original(*a))
+    data = importar_y_esperar(client, "/api/importar_csv?batch_size=2", csv_content, "grande.csv")
+    assert data["estado"] == "completada"
+    assert data["reanudada"] == True
+    # Retoma desde el registro que empieza en la línea 5 (la cuarta pregunta, en el lote guardado): sin releer el resto
+    assert desde == [(len("".join(csv_content.splitlines(keepends=True)[:4]).encode()), 5)]
+    assert data["importadas"] == 5
+    assert client.get("/api/contar_preguntas").json()["total"] == antes + 5
+
+def test_importacion_tomada_por_otro_proceso(setup_database, db_session, monkeypatch):
+    import app.importacion as importacion
+    from datetime import datetime, timedelta
+    from app.models import Importacion
+    csv_content = "pregunta,respuesta\n¿Tomada?,VERDADERO\n"
+    insertar_original = importacion.insertar_lote
+    def insertar_que_falla(db, tabla, filas):
+        raise RuntimeError("Conexión perdida")
+    monkeypatch.setattr(importacion, "insertar_lote", insertar_que_falla)
+    fallida = importar_y_esperar(client, "/api/importar_csv", csv_content, "tomada.csv")
+    monkeypatch.setattr(importacion, "insertar_lote", insertar_original)
+
+    # Otro worker la está corriendo: reenviar el archivo devuelve ese trabajo sin leerlo
+    fila = db_session.get(Importacion, fallida["id"])
+    fila.estado, fila.punto_control_at = "en_progreso", datetime.utcnow()
+    db_session.commit()
+    response = client.post("/api/importar_csv", files={"file": ("tomada.csv", csv_content, "text/csv")})
+    assert response.json()["job_id"] == fallida["id"]
+    db_session.refresh(fila)
+    assert fila.estado == "en_progreso"
+    assert not importacion.procesar_importacion(db_session, fila, None)
+
+    # Sin puntos de control por más de IMPORT_ABANDONADA_SEGUNDOS se da por abandonada y se retoma
+    fila.punto_control_at = datetime.utcnow() - timedelta(seconds=importacion.IMPORT_ABANDONADA_SEGUNDOS + 1)
+    db_session.commit()
+    data = importar_y_esperar(client, "/api/importar_csv", csv_content, "tomada.csv")
+    assert (data["id"], data["estado"], data["importadas"]) == (fallida["id"], "completada", 1)
+
+def test_girar_pregunta(setup_database):
+    response = client.post("/api/preguntas/girar?muestra=3")
+    assert response.status_code == 200
+    data = response.json()
+    pregunta_id = data["pregunta"]["id"]
+    assert data["muestra"][data["indice"]] == pregunta_id
+    assert len(data["muestra"]) <= 3
+    assert pregunta_id in client.get("/api/preguntas/activas").json()["activas"]
+
+    # Al responder bien sale del índice de activas
+    activas_antes = data["activas"]
+    for respuesta in ("VERDADERO", "FALSO"):
+        if client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": respuesta}).json().get("correcto"):
+            break
+    assert client.post("/api/preguntas/girar").json()["activas"] == activas_antes - 1
+
+def test_girar_pregunta_autoevaluacion(setup_database):
+    response = client.post("/api/autoevaluacion/preguntas/girar")
+    assert response.status_code == 200
+    data = response.json()["pregunta"]
+    assert "frase" in data and "respuesta" in data
+
+def test_contar_preguntas_coincide_con_la_tabla(setup_database, db_session):
+    from app import estadisticas
+    total, respondidas = estadisticas.contar_agregado(db_session, 1, "clasico")
+    assert client.get("/api/contar_preguntas").json() == {
+        "total": total, "activas": total - respondidas, "respondidas": respondidas
+    }
+
+    client.post("/api/reiniciar_preguntas")
+    data = client.get("/api/contar_preguntas").json()
+    assert data["respondidas"] == 0
+    assert data["activas"] == data["total"] == total
+
+def test_contar_preguntas_cache_con_invalidacion(setup_database, monkeypatch):
+    from app import estadisticas
+    monkeypatch.setattr(estadisticas, "ESTADISTICAS_CACHE_TTL", 60)
+    antes = client.get("/api/autoevaluacion/contar_preguntas").json()
+    importar_y_esperar(client, "/api/autoevaluacion/importar_csv", "pregunta,respuesta\n¿Capital de Chile?,Santiago\n", "cache.csv")
+    # La importación invalida la cache aunque el TTL no haya vencido
+    assert client.get("/api/autoevaluacion/contar_preguntas").json()["total"] == antes["total"] + 1
+
+def test_responder_concurrente_cuenta_una_vez(setup_database):
+    from concurrent.futures import ThreadPoolExecutor
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿El agua hierve a 100 °C?,VERDADERO\n", "concurrente.csv")
+    pregunta_id = max(client.get("/api/preguntas/activas").json()["activas"])
+    antes = client.get("/api/contar_preguntas").json()["respondidas"]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        respuestas = list(pool.map(
+            lambda _: client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "VERDADERO"}).json(),
+            range(4),
+        ))
+    # Un solo envío marca la pregunta; el resto recibe la misma respuesta sin volver a contar
+    assert all(r["correcto"] for r in respuestas)
+    assert sum(1 for r in respuestas if not r.get("ya_respondida")) == 1
+    assert client.get("/api/contar_preguntas").json()["respondidas"] == antes + 1
+
+def test_respondidas_paginadas_por_keyset(setup_database):
+    csv_content = "pregunta,respuesta\n" + "".join(f"¿Historial {n}?,VERDADERO\n" for n in range(5))
+    importar_y_esperar(client, "/api/autoevaluacion/importar_csv", csv_content, "historial.csv")
+    for pregunta_id in client.get("/api/autoevaluacion/preguntas/activas").json()["activas"]:
+        client.post("/api/autoevaluacion/preguntas/responder", json={"id": pregunta_id, "evaluacion": "bien"})
+
+    ids, despues_de = [], None
+    while True:
+        params = {"limite": 2} if despues_de is None else {"limite": 2, "despues_de": despues_de}
+        pagina = client.get("/api/autoevaluacion/preguntas/respondidas", params=params).json()
+        assert len(pagina["respondidas"]) <= 2
+        ids += [p["id"] for p in pagina["respondidas"]]
+        despues_de = pagina["siguiente"]
+        if despues_de is None:
+            break
+    assert ids == sorted(set(ids))
+    assert len(ids) == client.get("/api/autoevaluacion/contar_preguntas").json()["respondidas"]
+
+    response = client.get("/api/autoevaluacion/preguntas/respondidas/exportar")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [p["id"] for p in lineas] == ids
+
+def test_get_pregunta_desde_cache(setup_database):
+    from app import cache_preguntas
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Cache 1?,VERDADERO\n¿Cache 2?,FALSO\n", "cache_payloads.csv")
+    client.post("/api/preguntas/girar")  # Carga el índice de activas
+    ids = client.get("/api/preguntas/activas").json()["activas"]
+    hits = cache_preguntas.busquedas.valor("clasico", "hit")
+
+    # La importación precargó los payloads: el lote sale de memoria
+    response = client.get("/api/preguntas", params={"ids": ",".join(map(str, ids + [999999]))})
+    assert [p["id"] for p in response.json()["preguntas"]] == ids
+    assert response.json()["no_disponibles"] == [999999]
+    assert cache_preguntas.busquedas.valor("clasico", "hit") == hits + len(ids)
+
+    # Una pregunta respondida deja de servirse aunque su payload siga en cache
+    verdadera = sorted(ids)[-2]
+    assert client.post("/api/preguntas/responder", json={"id": verdadera, "respuesta": "VERDADERO"}).json()["correcto"]
+    assert client.get(f"/api/preguntas/{verdadera}").status_code == 400
+    client.delete("/api/eliminar_todas_preguntas")
+    assert client.get(f"/api/preguntas/{ids[-1]}").status_code == 404
+    assert "ruleta_cache_preguntas_total" in client.get("/metrics").text
+
+def test_aciertos_de_la_cache_reutilizan_la_version_del_banco(setup_database, monkeypatch):
+    from app import estadisticas
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Versión 1?,VERDADERO\n", "version_cache.csv")
+    pregunta_id = max(client.get("/api/preguntas/activas").json()["activas"])
+    lecturas = []
+    leer = estadisticas.versiones
+    monkeypatch.setattr(estadisticas, "versiones", lambda *a: lecturas.append(a) or leer(*a))
+    monkeypatch.setattr(estadisticas, "VERSIONES_CACHE_TTL", 60)
+    for _ in range(3):
+        assert client.get(f"/api/preguntas/{pregunta_id}").status_code == 200
+    assert len(lecturas) == 1
+
+    # Sin TTL se lee en cada pedido; una escritura de este proceso descarta la guardada
+    estadisticas.invalidar()
+    monkeypatch.setattr(estadisticas, "VERSIONES_CACHE_TTL", 0)
+    client.get(f"/api/preguntas/{pregunta_id}")
+    assert len(lecturas) == 2
+    monkeypatch.setattr(estadisticas, "VERSIONES_CACHE_TTL", 60)
+    client.get(f"/api/preguntas/{pregunta_id}")
+    assert len(lecturas) == 3
+    client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "VERDADERO"})
+    assert client.get(f"/api/preguntas/{pregunta_id}").status_code == 400
+    assert len(lecturas) == 4
+
+def test_reconstruir_indices_desde_la_base(setup_database, db_session):
+    from app.indices import RegistroIndices, reconstruir
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Índice 1?,VERDADERO\n¿Índice 2?,FALSO\n", "indices.csv")
+    activas = client.get("/api/preguntas/activas").json()["activas"]
+    client.post("/api/preguntas/responder", json={"id": activas[0], "respuesta": "VERDADERO"})
+    client.post("/api/preguntas/responder", json={"id": activas[0], "respuesta": "FALSO"})
+
+    # Lo que armaría un proceso nuevo coincide con el índice que se fue actualizando
+    registro = RegistroIndices()
+    reconstruir(db_session, registro)
+    indice = registro.obtener(("clasico", 1), lambda: pytest.fail("el índice debía estar armado"))
+    assert sorted(indice) == client.get("/api/preguntas/activas").json()["activas"]
+
+    client.post("/api/reiniciar_preguntas")
+    assert len(client.get("/api/preguntas/activas").json()["activas"]) == indice.total
+
+def test_reiniciar_avanza_la_ronda_sin_tocar_las_preguntas(setup_database, db_session):
+    from app.models import Pregunta, Sala
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Ronda?,VERDADERO\n", "ronda.csv")
+    pregunta_id = max(client.get("/api/preguntas/activas").json()["activas"])
+    assert client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "VERDADERO"}).json()["correcto"]
+    ronda = db_session.get(Sala, 1).ronda_clasico
+    assert db_session.get(Pregunta, pregunta_id).ronda_respondida == ronda
+
+    client.post("/api/reiniciar_preguntas")
+    db_session.expire_all()
+    # La fila conserva la ronda vieja: vuelve a estar activa porque la sala avanzó
+    assert db_session.get(Sala, 1).ronda_clasico == ronda + 1
+    assert db_session.get(Pregunta, pregunta_id).ronda_respondida == ronda
+    assert pregunta_id in client.get("/api/preguntas/activas").json()["activas"]
+    assert client.get("/api/preguntas/respondidas").json()["respondidas"] == []
+
+    response = client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "VERDADERO"}).json()
+    assert response["correcto"] and "ya_respondida" not in response
+    assert [p["id"] for p in client.get("/api/preguntas/respondidas").json()["respondidas"]] == [pregunta_id]
+
+def test_importar_csv_sin_duplicados(setup_database, db_session):
+    from app.models import Pregunta
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Dedup 1?,VERDADERO\n¿Dedup 2?,FALSO\n", "dedup.csv")
+    antes = client.get("/api/contar_preguntas").json()["total"]
+
+    # Una frase igual salvo mayúsculas y espacios, una con otra respuesta, una nueva repetida en el archivo
+    csv_content = "pregunta,respuesta\n¿DEDUP  1?,VERDADERO\n¿Dedup 2?,VERDADERO. corregida\n¿Dedup 3?,FALSO\n¿Dedup 3?,FALSO\n"
+    data = importar_y_esperar(client, "/api/importar_csv", csv_content, "dedup_2.csv")
+    assert data["estado"] == "completada"
+    assert (data["insertadas"], data["actualizadas"], data["omitidas"]) == (1, 1, 2)
+    assert client.get("/api/contar_preguntas").json()["total"] == antes + 1
+    frases = [p.frase for p in db_session.query(Pregunta).filter(Pregunta.frase.ilike("%dedup%"))]
+    assert sorted(frases) == ["¿Dedup 1?", "¿Dedup 2?", "¿Dedup 3?"]
+    corregida = db_session.query(Pregunta).filter(Pregunta.frase == "¿Dedup 2?").one()
+    assert corregida.respuesta == "VERDADERO. corregida" and corregida.verdadero
+
+    # Reenviar el mismo archivo no lo vuelve a leer
+    data = importar_y_esperar(client, "/api/importar_csv", csv_content, "dedup_2.csv")
+    assert data["estado"] == "completada"
+    assert (data["insertadas"], data["actualizadas"], data["omitidas"]) == (0, 0, 4)
+    assert data["filas_procesadas"] == 0
+
+def test_importacion_de_otro_proceso_actualiza_la_cache(setup_database, monkeypatch):
+    from types import SimpleNamespace
+    from app import importacion, cache_preguntas
+    from app.indices import RegistroIndices
+    csv_content = "pregunta,respuesta\n¿Capital de Italia?,Roma\n¿Capital de Grecia?,Atenas\n"
+    importar_y_esperar(client, "/api/autoevaluacion/importar_csv", csv_content, "capitales.csv")
+    activas = client.get("/api/autoevaluacion/preguntas/activas").json()["activas"]
+    ids = ",".join(map(str, activas))
+    respuestas = {p["frase"]: p["respuesta"] for p in client.get("/api/autoevaluacion/preguntas", params={"ids": ids}).json()["preguntas"]}
+    assert respuestas["¿Capital de Grecia?"] == "Atenas"
+
+    # Otro worker importa una corrección: sus índices y su cache no son los de este proceso
+    otro = SimpleNamespace(cache=cache_preguntas.CachePreguntas(100), calentar=lambda db, modo, sala_id: None)
+    monkeypatch.setattr(importacion, "cache_preguntas", otro)
+    monkeypatch.setattr(importacion, "activas", RegistroIndices())
+    data = importar_y_esperar(client, "/api/autoevaluacion/importar_csv", "pregunta,respuesta\n¿Capital de Grecia?,Atenas (Grecia)\n", "correccion.csv")
+    assert data["actualizadas"] == 1
+
+    # Este proceso recarga el índice en la versión nueva y lee los payloads otra vez
+    assert client.get("/api/autoevaluacion/preguntas/activas").json()["activas"] == activas
+    preguntas = client.get("/api/autoevaluacion/preguntas", params={"ids": ids}).json()["preguntas"]
+    assert {p["frase"]: p["respuesta"] for p in preguntas}["¿Capital de Grecia?"] == "Atenas (Grecia)"
+    grecia = next(p["id"] for p in preguntas if p["frase"] == "¿Capital de Grecia?")
+    assert client.get(f"/api/autoevaluacion/preguntas/{grecia}").json()["respuesta"] == "Atenas (Grecia)"
+
+def test_reimportar_despues_de_vaciar_el_banco(setup_database):
+    csv_content = "pregunta,respuesta\n¿Vaciar 1?,VERDADERO\n¿Vaciar 2?,FALSO\n"
+    importar_y_esperar(client, "/api/importar_csv", csv_content, "vaciar.csv")
+    client.delete("/api/eliminar_todas_preguntas")
+    data = importar_y_esperar(client, "/api/importar_csv", csv_content, "vaciar.csv")
+    assert (data["insertadas"], data["omitidas"]) == (2, 0)
+    assert client.get("/api/contar_preguntas").json()["total"] == 2
+
+def test_responder_en_lote_idempotente(setup_database):
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Lote 1?,VERDADERO\n¿Lote 2?,FALSO\n", "lote.csv")
+    activas = client.get("/api/preguntas/activas").json()["activas"]
+    p1, p2 = activas[-2:]
+    antes = client.get("/api/contar_preguntas").json()["respondidas"]
+    lote = {"respuestas": [
+        {"id_cliente": "r1", "id": p1, "respuesta": "VERDADERO"},
+        {"id_cliente": "r2", "id": p2, "respuesta": "VERDADERO"},
+        {"id_cliente": "r3", "id": p2, "respuesta": "FALSO"},
+        {"id_cliente": "r4", "id": p1, "respuesta": "VERDADERO"},
+        {"id_cliente": "r1", "id": p1, "respuesta": "VERDADERO"},
+        {"id_cliente": "r5", "id": 999999, "respuesta": "FALSO"},
+    ]}
+    data = client.post("/api/preguntas/responder_lote", json=lote).json()
+    r = data["resultados"]
+    assert [x["id_cliente"] for x in r] == ["r1", "r2", "r3", "r4", "r1", "r5"]
+    assert r[0]["correcto"] and "ya_respondida" not in r[0]
+    assert r[1]["correcto"] == False
+    assert r[2]["correcto"] and "ya_respondida" not in r[2]
+    assert r[3]["ya_respondida"] and r[4]["repetida"]
+    assert r[5]["error"] == {"status": 404, "detalle": "Pregunta no encontrada"}
+    assert (data["aplicadas"], data["repetidas"]) == (5, 1)
+    assert client.get("/api/contar_preguntas").json()["respondidas"] == antes + 2
+    assert not {p1, p2} & set(client.get("/api/preguntas/activas").json()["activas"])
+
+    # El mismo lote reenviado devuelve los mismos resultados sin aplicarlos otra vez
+    repetido = client.post("/api/preguntas/responder_lote", json=lote).json()
+    assert repetido["aplicadas"] == 0
+    assert [{k: v for k, v in x.items() if k != "repetida"} for x in repetido["resultados"]] == \
+        [{k: v for k, v in x.items() if k != "repetida"} for x in r]
+    assert client.get("/api/contar_preguntas").json()["respondidas"] == antes + 2
+
+def test_etag_responde_304_hasta_que_cambia_el_banco(setup_database):
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿ETag 1?,VERDADERO\n¿ETag 2?,FALSO\n", "etag.csv")
+    for url in ("/api/preguntas/activas", "/api/contar_preguntas", "/api/preguntas/respondidas"):
+        primera = client.get(url)
+        etag = primera.headers["etag"]
+        repetida = client.get(url, headers={"If-None-Match": etag})
+        assert repetida.status_code == 304 and repetida.headers["etag"] == etag and not repetida.content
+
+    etag = client.get("/api/preguntas/activas").headers["etag"]
+    pregunta_id = max(client.get("/api/preguntas/activas").json()["activas"])
+    client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "FALSO"})
+    # La respuesta cambia la versión del banco: el listado se vuelve a enviar
+    cambiada = client.get("/api/preguntas/activas", headers={"If-None-Match": etag})
+    assert cambiada.status_code == 200 and cambiada.headers["etag"] != etag
+    assert pregunta_id not in cambiada.json()["activas"]
+    # Cada banco tiene su versión
+    etag_auto = client.get("/api/autoevaluacion/contar_preguntas").headers["etag"]
+    assert client.get("/api/autoevaluacion/contar_preguntas", headers={"If-None-Match": etag_auto}).status_code == 304
+
+def test_respuestas_grandes_comprimidas(setup_database):
+    filas = "".join(f"¿Comprimir {n}?,VERDADERO\n" for n in range(300))
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n" + filas, "comprimir.csv")
+    response = client.get("/api/preguntas/activas", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] in ("gzip", "br")
+    assert len(response.json()["activas"]) >= 300
+    # Las respuestas chicas van sin comprimir
+    assert "content-encoding" not in client.get("/api/contar_preguntas", headers={"Accept-Encoding": "gzip"}).headers
+
+def test_buscar_sin_acentos_ni_mayusculas(setup_database):
+    csv_content = (
+        "pregunta,respuesta\n"
+        "¿La canción nacional de Perú tiene seis estrofas?,VERDADERO\n"
+        "¿El árbol más alto es una secuoya?,VERDADERO\n"
+        "¿La CANCION tradicional se canta en Perú?,FALSO\n"
+    )
+    importar_y_esperar(client, "/api/importar_csv", csv_content, "buscar.csv")
+    data = client.get("/api/preguntas/buscar", params={"q": "cancion peru"}).json()
+    assert [p["frase"] for p in data["preguntas"]] == [
+        "¿La canción nacional de Perú tiene seis estrofas?", "¿La CANCION tradicional se canta en Perú?"
+    ]
+    assert data["siguiente"] is None and not data["preguntas"][0]["respondida"]
+    # Prefijos, también sobre la respuesta, y paginado por id
+    assert [p["frase"] for p in client.get("/api/preguntas/buscar", params={"q": "ÁRBO"}).json()["preguntas"]] == [
+        "¿El árbol más alto es una secuoya?"
+    ]
+    pagina = client.get("/api/preguntas/buscar", params={"q": "peru", "limite": 1}).json()
+    siguiente = client.get("/api/preguntas/buscar", params={"q": "peru", "limite": 1, "despues_de": pagina["siguiente"]}).json()
+    assert [p["id"] for p in pagina["preguntas"] + siguiente["preguntas"]] == [p["id"] for p in data["preguntas"]]
+    assert siguiente["siguiente"] is None
+
+    # El índice sigue los cambios del banco
+    client.delete("/api/eliminar_todas_preguntas")
+    assert client.get("/api/preguntas/buscar", params={"q": "peru"}).json()["preguntas"] == []
+    assert client.get("/api/autoevaluacion/preguntas/buscar", params={"q": "peru"}).json()["preguntas"] == []
+
+def test_buscar_palabras_por_su_comienzo(setup_database):
+    csv_content = "pregunta,respuesta\n¿El ÑANDÚ corre rápido?,VERDADERO. ave_corredora\n¿La descripción es larga?,FALSO\n"
+    importar_y_esperar(client, "/api/importar_csv", csv_content, "comienzo.csv")
+    def frases(q):
+        return [p["frase"] for p in client.get("/api/preguntas/buscar", params={"q": q}).json()["preguntas"]]
+    assert frases("ñand") == frases("NANDU") == ["¿El ÑANDÚ corre rápido?"]
+    assert frases("descrip") == ["¿La descripción es larga?"]
+    # Una parte del medio de una palabra no alcanza; el guion bajo separa palabras
+    assert frases("cripcion") == frases("andu") == []
+    assert frases("corredora") == ["¿El ÑANDÚ corre rápido?"]
+    client.delete("/api/eliminar_todas_preguntas")
+
+def test_buscar_en_postgres_normaliza_como_el_indice():
+    from sqlalchemy import select
+    from sqlalchemy.dialects import postgresql
+    from app import busqueda
+    from app.models import Pregunta
+    consulta, _ = busqueda._filtrar_postgres(select(Pregunta.id), Pregunta, busqueda._terminos("Canción"))
+    sql = str(consulta.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    # La palabra pasa por la misma expresión que el índice y se busca al comienzo de una palabra
+    assert "ruleta_unaccent(lower((preguntas.frase || ' ') || preguntas.respuesta)) ~" in sql
+    assert "ruleta_unaccent(lower('canción'))" in sql and "(^|[^[:alnum:]])" in sql
+    assert " LIKE " not in sql
+
+def test_estadisticas_por_pregunta_desde_los_acumulados(setup_database, db_session):
+    from sqlalchemy import func
+    from app import registro_respuestas
+    from app.models import EventoRespuesta
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Intento 1?,VERDADERO\n¿Intento 2?,FALSO\n", "intentos.csv")
+    p1, p2 = sorted(client.get("/api/preguntas/activas").json()["activas"])[-2:]
+    # Los eventos encolados de bancos anteriores (con los mismos ids) no suman
+    assert registro_respuestas.escritor.vaciar(timeout=5)
+    ultimo_evento = db_session.query(func.coalesce(func.max(EventoRespuesta.id), 0)).scalar()
+    client.post("/api/preguntas/responder", json={"id": p1, "respuesta": "FALSO"})
+    client.post("/api/preguntas/responder", json={"id": p1, "respuesta": "FALSO"})
+    client.post("/api/preguntas/responder", json={"id": p1, "respuesta": "VERDADERO"})
+    client.post("/api/preguntas/responder_lote", json={"respuestas": [
+        {"id_cliente": "intento-1", "id": p2, "respuesta": "FALSO"},
+    ]})
+    # Reenvío de un acierto ya registrado: no es un intento nuevo
+    client.post("/api/preguntas/responder", json={"id": p1, "respuesta": "VERDADERO"})
+    assert registro_respuestas.escritor.vaciar(timeout=5)
+
+    data = client.get("/api/estadisticas/preguntas").json()["preguntas"]
+    por_id = {p["id"]: p for p in data}
+    assert (por_id[p1]["intentos"], por_id[p1]["correctas"], por_id[p1]["tasa_acierto"]) == (3, 1, 0.3333)
+    assert (por_id[p2]["intentos"], por_id[p2]["tasa_acierto"]) == (1, 1.0)
+    assert [p["id"] for p in data].index(p1) < [p["id"] for p in data].index(p2)
+    # Los acumulados coinciden con los eventos registrados
+    for pregunta_id in (p1, p2):
+        eventos = db_session.query(func.count(EventoRespuesta.id)).filter(
+            EventoRespuesta.id > ultimo_evento, EventoRespuesta.pregunta_id == pregunta_id
+        ).scalar()
+        assert por_id[pregunta_id]["intentos"] == eventos
+
+def test_indice_de_activas_sigue_los_cambios_de_otro_proceso(setup_database, db_session):
+    from app import rondas, estadisticas
+    importar_y_esperar(client, "/api/importar_csv", "pregunta,respuesta\n¿Otro worker?,VERDADERO\n", "worker.csv")
+    client.post("/api/reiniciar_preguntas")
+    for pregunta_id in client.get("/api/preguntas/activas").json()["activas"]:
+        client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "VERDADERO"})
+        client.post("/api/preguntas/responder", json={"id": pregunta_id, "respuesta": "FALSO"})
+    assert client.get("/api/preguntas/activas").json()["activas"] == []
+    assert client.post("/api/preguntas/girar").status_code == 400
+
+    # Otro worker reinicia el banco: escribe en la base sin tocar el índice de este proceso
+    rondas.avanzar(db_session, 1, "clasico")
+    estadisticas.fijar(db_session, 1, "clasico", respondidas=0)
+    db_session.commit()
+
+    total = client.get("/api/contar_preguntas").json()["total"]
+    assert len(client.get("/api/preguntas/activas").json()["activas"]) == total
+    assert client.post("/api/preguntas/girar").status_code == 200
+
+def test_eventos_de_un_banco_vaciado_no_suman_a_las_preguntas_nuevas(setup_database, db_session, monkeypatch):
+    from datetime import datetime
+    from app import registro_respuestas
+    from app.models import ContadorPreguntas
+    sala_id = client.post("/api/salas/", json={"nombre": "Generaciones"}).json()["id"]
+    importar_y_esperar(client, f"/api/importar_csv?sala_id={sala_id}", "pregunta,respuesta\n¿Vieja?,VERDADERO\n", "vieja.csv")
+    generacion = db_session.get(ContadorPreguntas, (sala_id, "clasico")).generacion
+
+    # Vaciar no espera a las colas de eventos (de este ni de otros procesos)
+    monkeypatch.setattr(registro_respuestas.escritor, "vaciar", lambda *a, **k: pytest.fail("no debía esperar"))
+    client.delete(f"/api/eliminar_todas_preguntas?sala_id={sala_id}")
+    monkeypatch.undo()
+    importar_y_esperar(client, f"/api/importar_csv?sala_id={sala_id}", "pregunta,respuesta\n¿Nueva?,FALSO\n", "nueva.csv")
+    nueva = client.get(f"/api/preguntas/activas?sala_id={sala_id}").json()["activas"][0]
+    db_session.expire_all()
+    vigente = db_session.get(ContadorPreguntas, (sala_id, "clasico")).generacion
+    assert vigente > generacion
+
+    # Un evento que quedó encolado antes de vaciar se escribe ahora con el id de la pregunta nueva
+    def evento(generacion):
+        return {"sala_id": sala_id, "modo": "clasico", "pregunta_id": nueva, "jugador_id": None, "correcta": True,
+                "respondida_en": datetime.utcnow(), "generacion": generacion, "alta": None}
+    registro_respuestas.escribir_lote(db_session, [evento(generacion), evento(vigente)])
+    db_session.commit()
+    data = client.get(f"/api/estadisticas/preguntas?sala_id={sala_id}").json()["preguntas"]
+    assert [(p["id"], p["intentos"]) for p in data] == [(nueva, 1)]
+
+def test_vaciar_el_escritor_respeta_el_timeout_con_la_cola_llena(setup_database):
+    import threading
+    from app.registro_respuestas import EscritorRespuestas
+    liberar = threading.Event()
+    def fabrica():
+        liberar.wait(5)  # La base no responde
+        return TestingSessionLocal()
+    escritor = EscritorRespuestas(fabrica=fabrica, intervalo=0, max_pendientes=1)
+    escritor.registrar(1, "clasico", 1, True)
+    escritor.registrar(1, "clasico", 2, True)  # Llena la cola mientras el hilo espera a la base
+
+    inicio = time.monotonic()
+    assert escritor.vaciar(timeout=0.2) == False
+    assert time.monotonic() - inicio < 1
+    liberar.set()
+    assert escritor.vaciar(timeout=5)
+    escritor.cerrar()
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+import random
+
+from app.ranking import Clasificacion, RegistroRanking
+
+def test_clasificacion_ordena_por_puntaje_y_id():
+    clasificacion = Clasificacion([(1, "Ana", 3, 0, 0), (2, "Beto", 5, 1, 0), (3, "Caro", 3, 2, 0)])
+    assert [j["id"] for j in clasificacion.top(10)] == [2, 1, 3]
+    assert clasificacion.posicion(3) == 3
+
+    # Sube al primer puesto; el empate entre 1 y 2 lo desempata el id
+    assert clasificacion.actualizar(3, 6, 3) == (3, 1)
+    assert clasificacion.actualizar(1, 5, 1) == (3, 2)
+    assert [(j["id"], j["posicion"]) for j in clasificacion.top(2)] == [(3, 1), (1, 2)]
+    assert clasificacion.jugador(2)["posicion"] == 3
+
+    clasificacion.agregar(4, "Dani")
+    clasificacion.quitar(3)
+    assert [j["id"] for j in clasificacion.top(10)] == [1, 2, 4]
+    assert clasificacion.actualizar(3, 1, 0) is None and len(clasificacion) == 3
+
+def test_cambios_fuera_de_orden_no_pisan_uno_mas_nuevo():
+    clasificacion = Clasificacion([(1, "Ana", 2, 2, 4), (2, "Beto", 3, 0, 1)])
+    assert clasificacion.actualizar(1, 5, 3, 5) == (2, 1)
+    # La respuesta anterior (versión 4) termina después: no se aplica
+    assert clasificacion.actualizar(1, 2, 2, 4) == (1, 1)
+    assert clasificacion.jugador(1)["puntaje"] == 5
+    assert clasificacion.actualizar(1, 4, 0, 6) == (1, 1)
+    assert clasificacion.jugador(1)["consecutivas"] == 0
+
+def test_cambios_de_otro_proceso_se_aplican_por_jugador():
+    registro = RegistroRanking()
+    base = {1: ("Ana", 2, 0, 0), 2: ("Beto", 1, 0, 0), 3: ("Caro", 0, 0, 0), 4: ("Dani", 0, 0, 0)}
+    pedidos = []
+    def cargar(ids=None):
+        pedidos.append(ids)
+        return [(id_, *base[id_]) for id_ in (base if ids is None else ids)]
+    def versiones():
+        return {id_: fila[3] for id_, fila in base.items()}
+    registro.top(1, cargar, 10, versiones())
+    # Una respuesta de este proceso: se aplica en memoria y la lectura no vuelve a la base
+    base[2] = ("Beto", 5, 1, 1)
+    assert registro.actualizar(1, 2, 5, 1, 1) == {"posicion_anterior": 2, "posicion": 1}
+    assert registro.top(1, cargar, 10, versiones())[1][0]["id"] == 2 and pedidos == [None]
+
+    # Otro proceso cambió a Ana, dio de baja a Dani y dio de alta a Eva: solo se leen esas filas
+    base[1] = ("Ana", 9, 1, 1)
+    del base[4]
+    base[5] = ("Eva", 0, 0, 0)
+    total, primeros = registro.top(1, cargar, 10, versiones())
+    assert sorted(pedidos[1]) == [1, 5]
+    assert total == 4 and [j["id"] for j in primeros] == [1, 2, 3, 5]
+
+    # Si cambió más de la mitad de la sala (un reinicio) se carga entera
+    for id_, (nombre, _, _, version) in list(base.items()):
+        base[id_] = (nombre, 0, 0, version + 1)
+    registro.top(1, cargar, 10, versiones())
+    assert pedidos[-1] is None and len(pedidos) == 3
+
+def test_actualizaciones_concurrentes_quedan_con_la_ultima_version():
+    registro = RegistroRanking()
+    registro.obtener(1, lambda: [(id_, f"J{id_}", 0, 0, 0) for id_ in range(1, 21)])
+    # Cada jugador recibe sus versiones 1..50 (puntaje = versión) en cualquier orden
+    cambios = [(id_, version) for id_ in range(1, 21) for version in range(1, 51)]
+    random.Random(7).shuffle(cambios)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda c: registro.actualizar(1, c[0], c[1], 0, c[1]), cambios))
+
+    total, primeros = registro.top(1, lambda: [], 20)
+    assert total == 20
+    assert all(j["puntaje"] == 50 for j in primeros)
+    assert [j["id"] for j in primeros] == list(range(1, 21))
@@ -0,0 +1,117 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from utils import importar_y_esperar
+import pytest
+
+client = TestClient(app)
+
+def test_crear_y_listar_salas(setup_database):
+    response = client.post("/api/salas/", json={"nombre": "Curso A"})
+    assert response.status_code == 200
+    sala_id = response.json()["id"]
+    assert {"id": sala_id, "nombre": "Curso A"} in client.get("/api/salas/").json()
+
+def test_sala_inexistente(setup_database):
+    response = client.get("/api/contar_preguntas?sala_id=999")
+    assert response.status_code == 404
+
+def test_salas_aisladas(setup_database):
+    sala_a = client.post("/api/salas/", json={"nombre": "A"}).json()["id"]
+    sala_b = client.post("/api/salas/", json={"nombre": "B"}).json()["id"]
+    csv_content = "pregunta,respuesta\n¿Capital de Perú?,Lima\n¿Capital de Chile?,Santiago\n"
+    importar_y_esperar(client, f"/api/autoevaluacion/importar_csv?sala_id={sala_a}", csv_content, "sala.csv")
+    # El mismo archivo en otra sala es otra importación
+    data = importar_y_esperar(client, f"/api/autoevaluacion/importar_csv?sala_id={sala_b}", csv_content, "sala.csv")
+    assert data["reanudada"] == False
+
+    activas_a = client.get(f"/api/autoevaluacion/preguntas/activas?sala_id={sala_a}").json()["activas"]
+    activas_b = client.get(f"/api/autoevaluacion/preguntas/activas?sala_id={sala_b}").json()["activas"]
+    assert len(activas_a) == len(activas_b) == 2
+    assert not set(activas_a) & set(activas_b)
+
+    # Una pregunta de otra sala no se puede responder
+    response = client.post(f"/api/autoevaluacion/preguntas/responder?sala_id={sala_b}", json={"id": activas_a[0], "evaluacion": "bien"})
+    assert response.status_code == 404
+
+    client.post(f"/api/autoevaluacion/reiniciar_preguntas?sala_id={sala_a}")
+    client.post(f"/api/autoevaluacion/preguntas/responder?sala_id={sala_b}", json={"id": activas_b[0], "evaluacion": "bien"})
+    assert client.get(f"/api/autoevaluacion/contar_preguntas?sala_id={sala_a}").json()["respondidas"] == 0
+    assert client.get(f"/api/autoevaluacion/contar_preguntas?sala_id={sala_b}").json()["respondidas"] == 1
+
+    # Mismo nombre de jugador en salas distintas
+    assert client.post(f"/api/jugadores/?sala_id={sala_a}", json={"nombre": "Ana"}).status_code == 200
+    assert client.post(f"/api/jugadores/?sala_id={sala_b}", json={"nombre": "Ana"}).status_code == 200
+    assert len(client.get(f"/api/jugadores/?sala_id={sala_a}").json()) == 1
+
+    # Eliminar una sala borra solo sus datos
+    assert client.delete(f"/api/salas/{sala_a}").status_code == 200
+    assert client.get(f"/api/autoevaluacion/contar_preguntas?sala_id={sala_a}").status_code == 404
+    assert client.get(f"/api/autoevaluacion/contar_preguntas?sala_id={sala_b}").json()["total"] == 2
+
+def test_eventos_de_sala_inexistente(setup_database):
+    import pytest
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect("/api/jugadores/juego/eventos?sala_id=999"):
+            pass
+    assert error.value.code == 1008
+
+def test_eliminar_todas_preguntas_solo_de_la_sala(setup_database):
+    sala_a = client.post("/api/salas/", json={"nombre": "Vaciar A"}).json()["id"]
+    sala_b = client.post("/api/salas/", json={"nombre": "Vaciar B"}).json()["id"]
+    csv_content = "pregunta,respuesta\n¿Uno?,VERDADERO\n¿Dos?,FALSO\n"
+    importar_y_esperar(client, f"/api/importar_csv?sala_id={sala_a}", csv_content, "vaciar.csv")
+    importar_y_esperar(client, f"/api/importar_csv?sala_id={sala_b}", csv_content, "vaciar.csv")
+
+    # Con filas de otras salas en la tabla se borra solo la sala pedida
+    response = client.delete(f"/api/eliminar_todas_preguntas?sala_id={sala_a}")
+    assert response.json()["message"] == "Se eliminaron 2 preguntas"
+    assert client.get(f"/api/contar_preguntas?sala_id={sala_b}").json()["total"] == 2
+
+    # Sala única con preguntas: en PostgreSQL se vacía con TRUNCATE, con el mismo resultado
+    client.delete("/api/eliminar_todas_preguntas")
+    response = client.delete(f"/api/eliminar_todas_preguntas?sala_id={sala_b}")
+    assert response.json()["message"] == "Se eliminaron 2 preguntas"
+    assert client.get(f"/api/preguntas/activas?sala_id={sala_b}").json()["activas"] == []
+
+def test_sala_eliminada_por_otro_proceso(setup_database, db_session, monkeypatch):
+    from app import salas
+    from app.models import Sala
+    sala_id = client.post("/api/salas/", json={"nombre": "Otro worker"}).json()["id"]
+    assert client.get(f"/api/contar_preguntas?sala_id={sala_id}").status_code == 200
+    # Borrada sin pasar por este proceso: se acepta hasta que vence SALAS_CACHE_TTL
+    db_session.query(Sala).filter(Sala.id == sala_id).delete()
+    db_session.commit()
+    monkeypatch.setattr(salas, "SALAS_CACHE_TTL", 60)
+    assert client.get(f"/api/contar_preguntas?sala_id={sala_id}").status_code == 200
+    monkeypatch.setattr(salas, "SALAS_CACHE_TTL", 0)
+    assert client.get(f"/api/contar_preguntas?sala_id={sala_id}").status_code == 404
+
+def test_sala_conocida_no_consulta_la_base(setup_database, monkeypatch):
+    from app import salas
+    sala_id = client.post("/api/salas/", json={"nombre": "Conocida"}).json()["id"]
+    monkeypatch.setattr(salas, "SALAS_CACHE_TTL", 60)
+    assert client.get(f"/api/jugadores/?sala_id={sala_id}").status_code == 200
+    monkeypatch.delattr(salas, "Sala")  # Sin el modelo: consultar la base fallaría
+    assert client.get(f"/api/jugadores/?sala_id={sala_id}").status_code == 200
+    # Eliminada en este proceso deja de aceptarse enseguida
+    monkeypatch.undo()
+    monkeypatch.setattr(salas, "SALAS_CACHE_TTL", 60)
+    client.delete(f"/api/salas/{sala_id}")
+    assert client.get(f"/api/jugadores/?sala_id={sala_id}").status_code == 404
+
+@pytest.mark.parametrize("backend", ["memoria", "db"])
+def test_eliminar_sala_en_la_transaccion(setup_database, db_session, backend):
+    from app.estado_juego import crear_almacen
+    almacen = crear_almacen(backend)
+    sala_id = client.post("/api/salas/", json={"nombre": f"Estado {backend}"}).json()["id"]
+    almacen.iniciar(db_session, sala_id, [{"id": 1, "nombre": "Ana", "puntaje": 0, "consecutivas": 0}])
+
+    # Si la transacción se revierte, el estado queda
+    almacen.eliminar_sala(db_session, sala_id, commit=False)
+    db_session.rollback()
+    assert almacen.obtener(db_session, sala_id)["cola_pendientes"] == [1]
+
+    almacen.eliminar_sala(db_session, sala_id, commit=False)
+    db_session.commit()
+    assert almacen.obtener(db_session, sala_id)["cola_pendientes"] == []
@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+import time
+
+# Configuración de base de datos de prueba
+TEST_DATABASE_URL = "sqlite:///./test.db"
+test_engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Misma base para las rutas async; sin pool porque el TestClient usa un
+# event loop distinto en cada request
+test_async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(test_async_engine, autoflush=False)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+def importar_y_esperar(client, url, csv_content, nombre="test.csv"):
+    # Las importaciones corren en segundo plano: esperar a que termine el trabajo
+    response = client.post(url, files={"file": (nombre, csv_content, "text/csv")})
+    assert response.status_code == 202
+    for _ in range(200):
+        estado = client.get(response.json()["estado_url"]).json()
+        if estado["estado"] in ("completada", "fallida"):
+            return {**response.json(), **estado}
+        time.sleep(0.01)
+    raise AssertionError("La importación no terminó a tiempo")
@@ -17,6 +17,16 @@ import {
 } from '@chakra-ui/react';
 import axios from 'axios';
 
+const esperarImportacion = async (estadoUrl) => {
+  for (;;) {
+    const { data } = await axios.get(`http://localhost:8000${estadoUrl}`);
+    if (data.estado === 'completada' || data.estado === 'fallida') {
+      return data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 500));
+  }
+};
+
 const CargarCSV = ({ onCargar }) => {
   const [file, setFile] = useState(null);
   const [loading, setLoading] = useState(false);
@@ -46,22 +56,24 @@ const CargarCSV = ({ onCargar }) => {
     if (!file) return;
     setLoading(true);
 
-    if (clearExisting) {
-      try {
-        await axios.delete('http://localhost:8000/api/eliminar_todas_preguntas');
-      } catch (error) {
-        console.error('Error clearing existing questions', error);
-      }
-    }
-
     const formData = new FormData();
     formData.append('file', file);
 
     try {
-      await axios.post('http://localhost:8000/api/importar_csv', formData, {
+      // reemplazar=true borra y carga el banco nuevo en una sola transacción
+      const response = await axios.post('http://localhost:8000/api/importar_csv', formData, {
         headers: { 'Content-Type': 'multipart/form-data' },
+        params: { reemplazar: clearExisting },
       });
-      alert('CSV importado exitosamente');
+      // La importación corre en segundo plano: consultar el estado hasta que termine
+      const estado = await esperarImportacion(response.data.estado_url);
+      if (estado.estado === 'fallida') {
+        throw new Error(estado.error);
+      }
+      if (estado.rechazadas > 0) {
+        alert(`${estado.rechazadas} filas rechazadas. Reporte: http://localhost:8000${estado.errores_url}`);
+      }
+      alert(`CSV importado exitosamente: ${estado.insertadas} nuevas, ${estado.actualizadas} actualizadas, ${estado.omitidas} repetidas`);
       onCargar(); // Refrescar preguntas activas
       onClose(); // Cerrar modal
     } catch (error) {
@@ -3,17 +3,16 @@ import { Box, Button, Flex, Heading, Text, VStack } from '@chakra-ui/react';
 import useStore from '../store';
 import axios from 'axios';
 
-const Estadisticas = () => {
-  const { estadisticas, resetEstadisticas, setPreguntasActivas } = useStore();
+const Estadisticas = ({ onReiniciar }) => {
+  const { estadisticas, resetEstadisticas } = useStore();
   const [loading, setLoading] = useState(false);
 
   const handleReiniciarPreguntas = async () => {
     setLoading(true);
     try {
       await axios.post('http://localhost:8000/api/reiniciar_preguntas');
-      // Refrescar preguntas activas
-      const response = await axios.get('http://localhost:8000/api/preguntas/activas');
-      setPreguntasActivas(response.data.activas);
+      // Refrescar la ruleta
+      onReiniciar?.();
       alert('Preguntas reiniciadas');
     } catch (error) {
       alert('Error al reiniciar preguntas');
@@ -16,11 +16,11 @@ const EstadisticasAuto = ({ refresh }) => {
 
   const fetchEstadisticas = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/autoevaluacion/preguntas/respondidas');
+      const response = await axios.get('http://localhost:8000/api/autoevaluacion/contar_preguntas');
       const respondidas = response.data.respondidas;
       setEstadisticas({
-        totalRespondidas: respondidas.length,
-        bien: respondidas.length, // Todas las respondidas son "bien" en autoevaluación
+        totalRespondidas: respondidas,
+        bien: respondidas, // Todas las respondidas son "bien" en autoevaluación
         mal: 0 // No hay "mal" persistente
       });
     } catch (error) {
@@ -14,6 +14,7 @@ import {
 } from '@chakra-ui/react';
 import { DeleteIcon, AddIcon } from '@chakra-ui/icons';
 import axios from 'axios';
+import useEventosJuego from '../useEventosJuego';
 
 const GestionJugadores = ({ onJugadoresChange }) => {
   const [jugadores, setJugadores] = useState([]);
@@ -38,6 +39,13 @@ const GestionJugadores = ({ onJugadoresChange }) => {
     }
   };
 
+  // Altas y bajas hechas desde otras pantallas
+  useEventosJuego((evento) => {
+    if (['jugador_agregado', 'jugador_eliminado', 'resincronizar'].includes(evento.tipo)) {
+      cargarJugadores();
+    }
+  });
+
   const agregarJugador = async () => {
     if (!nuevoJugador.trim()) return;
 
@@ -1,18 +1,22 @@
 import { useState, useEffect, memo } from 'react';
-import { Table, Thead, Tbody, Tr, Th, Td, Box, Text } from '@chakra-ui/react';
+import { Table, Thead, Tbody, Tr, Th, Td, Box, Text, Button } from '@chakra-ui/react';
 import axios from 'axios';
 
 const PreguntasRespondidas = memo(({ refresh }) => {
   const [preguntas, setPreguntas] = useState([]);
+  const [siguiente, setSiguiente] = useState(null);
 
   useEffect(() => {
     fetchPreguntasRespondidas();
   }, [refresh]);
 
-  const fetchPreguntasRespondidas = async () => {
+  // Páginas por keyset: despues_de es el último id recibido
+  const fetchPreguntasRespondidas = async (despuesDe = null) => {
     try {
-      const response = await axios.get('http://localhost:8000/api/preguntas/respondidas');
-      setPreguntas(response.data.respondidas);
+      const params = despuesDe === null ? {} : { despues_de: despuesDe };
+      const response = await axios.get('http://localhost:8000/api/preguntas/respondidas', { params });
+      setPreguntas(prev => (despuesDe === null ? response.data.respondidas : [...prev, ...response.data.respondidas]));
+      setSiguiente(response.data.siguiente);
     } catch (error) {
       console.error('Error fetching preguntas respondidas', error);
     }
@@ -30,8 +34,8 @@ const PreguntasRespondidas = memo(({ refresh }) => {
             </Tr>
           </Thead>
           <Tbody>
-            {preguntas.map((p, index) => (
-              <Tr key={index}>
+            {preguntas.map((p) => (
+              <Tr key={p.id}>
                 <Td>{p.frase}</Td>
                 <Td>{p.respuesta}</Td>
               </Tr>
@@ -41,6 +45,11 @@ const PreguntasRespondidas = memo(({ refresh }) => {
       ) : (
         <Text>No hay preguntas respondidas aún.</Text>
       )}
+      {siguiente !== null && (
+        <Button size="sm" mt={2} onClick={() => fetchPreguntasRespondidas(siguiente)}>
+          Cargar más
+        </Button>
+      )}
     </Box>
   );
 });
@@ -16,6 +16,10 @@ import {
 } from '@chakra-ui/react';
 import { motion } from 'framer-motion';
 import axios from 'axios';
+import useEventosJuego from '../useEventosJuego';
+
+// Jugadores que se muestran en la tabla
+const TOP_RANKING = 50;
 
 const Puntajes = ({ refreshTrigger }) => {
   const [jugadores, setJugadores] = useState([]);
@@ -31,10 +35,11 @@ const Puntajes = ({ refreshTrigger }) => {
   const cargarPuntajes = async () => {
     try {
       setIsLoading(true);
-      const response = await axios.get('http://localhost:8000/api/jugadores/');
-      // Ordenar por puntaje descendente
-      const sortedJugadores = response.data.sort((a, b) => b.puntaje - a.puntaje);
-      setJugadores(sortedJugadores);
+      // El servidor mantiene el ranking ordenado: no hace falta ordenar acá
+      const response = await axios.get('http://localhost:8000/api/jugadores/ranking', {
+        params: { top: TOP_RANKING },
+      });
+      setJugadores(response.data.ranking);
     } catch (error) {
       console.error('Error cargando puntajes:', error);
     } finally {
@@ -42,6 +47,36 @@ const Puntajes = ({ refreshTrigger }) => {
     }
   };
 
+  // Puntajes en vivo desde los eventos del juego
+  useEventosJuego((evento) => {
+    switch (evento.tipo) {
+      case 'puntaje_actualizado': {
+        // El evento trae la nueva posición: se mueve solo a ese jugador
+        const jugador = jugadores.find(j => j.id === evento.jugador_id);
+        if (!jugador && evento.posicion > TOP_RANKING) break;
+        if (!jugador || evento.posicion == null || evento.posicion > TOP_RANKING) {
+          cargarPuntajes();
+          break;
+        }
+        const resto = jugadores.filter(j => j.id !== evento.jugador_id);
+        resto.splice(evento.posicion - 1, 0, { ...jugador, puntaje: evento.puntaje, consecutivas: evento.consecutivas });
+        setJugadores(resto);
+        break;
+      }
+      case 'juego_iniciado':
+        setJugadores(evento.jugadores.slice(0, TOP_RANKING));
+        break;
+      case 'jugador_agregado':
+      case 'jugador_eliminado':
+      case 'juego_reiniciado':
+      case 'resincronizar':
+        cargarPuntajes();
+        break;
+      default:
+        break;
+    }
+  });
+
   const getPosicionBadge = (index) => {
     switch (index) {
       case 0:
@@ -3,7 +3,6 @@ import { Box, Button, Text, VStack, HStack, Icon } from '@chakra-ui/react';
 import { motion } from 'framer-motion';
 import { Wheel } from 'react-custom-roulette';
 import { FaPlay, FaDice, FaSpinner } from 'react-icons/fa';
-import useStore from '../store';
 import axios from 'axios';
 
 // Función para reproducir sonido de giro de ruleta
@@ -54,30 +53,31 @@ const playTickSound = () => {
 };
 
 const Ruleta = ({ onSeleccionarPregunta }) => {
-  const { preguntasActivas, setPreguntasActivas } = useStore();
+  const [giro, setGiro] = useState(null);
   const [mustSpin, setMustSpin] = useState(false);
-  const [prizeNumber, setPrizeNumber] = useState(0);
   const tickIntervalRef = useRef(null);
 
   useEffect(() => {
-    fetchPreguntasActivas();
+    fetchGiro();
   }, []);
 
-  const fetchPreguntasActivas = async () => {
+  // El servidor elige la pregunta y devuelve solo una muestra de ids para la animación
+  const fetchGiro = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/preguntas/activas');
-      setPreguntasActivas(response.data.activas);
+      const response = await axios.post('http://localhost:8000/api/preguntas/girar');
+      setGiro(response.data);
     } catch (error) {
-      console.error('Error fetching preguntas activas', error);
+      setGiro(null);
+      if (error.response?.status !== 400) {
+        console.error('Error fetching giro', error);
+      }
     }
   };
 
-  const data = preguntasActivas.map(id => ({ option: id.toString() }));
+  const data = giro ? giro.muestra.map(id => ({ option: id.toString() })) : [];
 
   const handleSpinClick = () => {
     if (data.length === 0) return;
-    const newPrizeNumber = Math.floor(Math.random() * data.length);
-    setPrizeNumber(newPrizeNumber);
     setMustSpin(true);
     // Reproducir sonido inicial de giro
     playSpinSound();
@@ -92,8 +92,7 @@ const Ruleta = ({ onSeleccionarPregunta }) => {
       clearInterval(tickIntervalRef.current);
       tickIntervalRef.current = null;
     }
-    const selectedId = preguntasActivas[prizeNumber];
-    onSeleccionarPregunta(selectedId);
+    onSeleccionarPregunta(giro.pregunta.id);
   };
 
   // Limpiar intervalo al desmontar
@@ -158,7 +157,7 @@ const Ruleta = ({ onSeleccionarPregunta }) => {
             >
               <Wheel
                 mustStartSpinning={mustSpin}
-                prizeNumber={prizeNumber}
+                prizeNumber={giro ? giro.indice : 0}
                 data={data}
                 onStopSpinning={handleStopSpinning}
                 backgroundColors={['#ff8f43', '#70bbe0', '#0b3351', '#f9dd50']}
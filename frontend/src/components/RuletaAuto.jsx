@@ -51,37 +51,36 @@ const playTickSound = () => {
   }
 };
 
-const RuletaAuto = ({ onSeleccionarPregunta, preguntasActivas: preguntasActivasProp }) => {
-  const [preguntasActivas, setPreguntasActivas] = useState([]);
+const RuletaAuto = ({ onSeleccionarPregunta, jugadorId }) => {
+  const [giro, setGiro] = useState(null);
   const [mustSpin, setMustSpin] = useState(false);
-  const [prizeNumber, setPrizeNumber] = useState(0);
   const tickIntervalRef = useRef(null);
 
   useEffect(() => {
-    if (preguntasActivasProp) {
-      // Usar preguntas proporcionadas (modo multi-jugador)
-      setPreguntasActivas(preguntasActivasProp);
-    } else {
-      // Fetchear todas las preguntas (modo clásico)
-      fetchPreguntasActivas();
-    }
-  }, [preguntasActivasProp]);
-
-  const fetchPreguntasActivas = async () => {
+    fetchGiro();
+  }, [jugadorId]);
+
+  // El servidor elige la pregunta (del jugador en modo multi-jugador) y devuelve
+  // solo una muestra de ids para la animación
+  const fetchGiro = async () => {
+    const url = jugadorId
+      ? `http://localhost:8000/api/jugadores/${jugadorId}/preguntas/girar`
+      : 'http://localhost:8000/api/autoevaluacion/preguntas/girar';
     try {
-      const response = await axios.get('http://localhost:8000/api/autoevaluacion/preguntas/activas');
-      setPreguntasActivas(response.data.activas);
+      const response = await axios.post(url);
+      setGiro(response.data);
     } catch (error) {
-      console.error('Error fetching preguntas activas autoevaluacion', error);
+      setGiro(null);
+      if (error.response?.status !== 400) {
+        console.error('Error fetching giro autoevaluacion', error);
+      }
     }
   };
 
-  const data = preguntasActivas.map(id => ({ option: id.toString() }));
+  const data = giro ? giro.muestra.map(id => ({ option: id.toString() })) : [];
 
   const handleSpinClick = () => {
     if (data.length === 0) return;
-    const newPrizeNumber = Math.floor(Math.random() * data.length);
-    setPrizeNumber(newPrizeNumber);
     setMustSpin(true);
     // Reproducir sonido inicial de giro
     playSpinSound();
@@ -96,8 +95,7 @@ const RuletaAuto = ({ onSeleccionarPregunta, preguntasActivas: preguntasActivasP
       clearInterval(tickIntervalRef.current);
       tickIntervalRef.current = null;
     }
-    const selectedId = preguntasActivas[prizeNumber];
-    onSeleccionarPregunta(selectedId);
+    onSeleccionarPregunta(giro.pregunta.id);
   };
 
   // Limpiar intervalo al desmontar
@@ -134,7 +132,7 @@ const RuletaAuto = ({ onSeleccionarPregunta, preguntasActivas: preguntasActivasP
             >
               <Wheel
                 mustStartSpinning={mustSpin}
-                prizeNumber={prizeNumber}
+                prizeNumber={giro ? giro.indice : 0}
                 data={data}
                 onStopSpinning={handleStopSpinning}
                 backgroundColors={['#ff8f43', '#70bbe0', '#0b3351', '#f9dd50']}
@@ -3,6 +3,7 @@ import { Box, Button, Text, VStack, HStack, Badge, useColorModeValue, useToast,
 import { motion } from 'framer-motion';
 import axios from 'axios';
 import useStore from '../store';
+import useEventosJuego from '../useEventosJuego';
 
 const RuletaJugadores = ({ onJugadorSeleccionado, juegoIniciado, onTurnoCompletado }) => {
   const [estadoJuego, setEstadoJuego] = useState(null);
@@ -31,6 +32,38 @@ const RuletaJugadores = ({ onJugadorSeleccionado, juegoIniciado, onTurnoCompleta
     }
   };
 
+  // Aplicar los cambios que publica el servidor en lugar de volver a consultar el estado
+  useEventosJuego((evento) => {
+    if (!juegoIniciado) return;
+    switch (evento.tipo) {
+      case 'jugador_seleccionado':
+        setEstadoJuego(prev => {
+          if (!prev) return prev;
+          const cola = prev.cola_pendientes.filter(id => id !== evento.jugador_id);
+          // Igual que el servidor: si la cola queda vacía se rellena con todos
+          return {
+            ...prev,
+            turno_actual: evento.jugador_id,
+            cola_pendientes: cola.length ? cola : prev.jugadores.map(j => j.id),
+          };
+        });
+        break;
+      case 'puntaje_actualizado':
+        setEstadoJuego(prev => prev && {
+          ...prev,
+          jugadores: prev.jugadores.map(j => j.id === evento.jugador_id
+            ? { ...j, puntaje: evento.puntaje, consecutivas: evento.consecutivas }
+            : j),
+        });
+        break;
+      case 'respuesta_evaluada':
+      case 'pregunta_quitada':
+        break;
+      default:
+        cargarEstadoJuego();
+    }
+  });
+
   const girarRuleta = async () => {
     if (turnoBloqueado) {
       toast({
@@ -67,9 +100,6 @@ const RuletaJugadores = ({ onJugadorSeleccionado, juegoIniciado, onTurnoCompleta
       setJugadorSeleccionado(jugador);
       setTurnoBloqueado(true); // Bloquear giros hasta que termine el turno
 
-      // Actualizar estado
-      await cargarEstadoJuego();
-
       // Notificar al componente padre
       onJugadorSeleccionado?.(jugador);
 
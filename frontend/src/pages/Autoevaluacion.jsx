@@ -23,8 +23,6 @@ const Autoevaluacion = () => {
     setJugadorActual,
     juegoIniciado,
     setJuegoIniciado,
-    preguntasJugadorActivas,
-    setPreguntasJugadorActivas,
     turnoBloqueado,
     setTurnoBloqueado,
     resetModoMultiJugador,
@@ -88,16 +86,9 @@ const Autoevaluacion = () => {
     useStore.getState().setJugadores(jugadores);
   };
 
-  const handleJugadorSeleccionado = async (jugador) => {
+  const handleJugadorSeleccionado = (jugador) => {
+    // La ruleta del jugador pide su pregunta al servidor al montarse
     setJugadorActual(jugador);
-
-    // Cargar preguntas activas del jugador
-    try {
-      const response = await axios.get(`http://localhost:8000/api/jugadores/${jugador.id}/preguntas/activas`);
-      setPreguntasJugadorActivas(response.data.activas);
-    } catch (error) {
-      console.error('Error cargando preguntas del jugador:', error);
-    }
   };
 
   const iniciarJuego = async () => {
@@ -416,7 +407,7 @@ const Autoevaluacion = () => {
                       <RuletaAuto
                         key={`jugador-${jugadorActual.id}-${refreshRuleta}`}
                         onSeleccionarPregunta={handleSeleccionarPregunta}
-                        preguntasActivas={preguntasJugadorActivas}
+                        jugadorId={jugadorActual.id}
                       />
                     </VStack>
                   </Box>
@@ -127,7 +127,7 @@ const Home = () => {
                     <Icon as={FaChartBar} color="brand.500" />
                     <Text fontSize="lg" fontWeight="bold">Estadísticas</Text>
                   </HStack>
-                  <Estadisticas />
+                  <Estadisticas onReiniciar={handleCargar} />
                 </VStack>
               </Box>
             </motion.div>
@@ -0,0 +1,42 @@
+import { useEffect, useRef } from 'react';
+
+// Suscripción a los eventos del juego multi-jugador (WebSocket).
+// onEvento recibe cada evento ({ tipo, seq, ... }); ante "resincronizar" o una
+// reconexión conviene volver a pedir el estado completo al servidor.
+const useEventosJuego = (onEvento) => {
+  const handlerRef = useRef(onEvento);
+  handlerRef.current = onEvento;
+
+  useEffect(() => {
+    let ws;
+    let reintento;
+    let espera = 1000;
+    let cerrado = false;
+
+    const conectar = () => {
+      ws = new WebSocket('ws://localhost:8000/api/jugadores/juego/eventos');
+      ws.onopen = () => {
+        espera = 1000;
+      };
+      ws.onmessage = (mensaje) => {
+        const evento = JSON.parse(mensaje.data);
+        // Al (re)conectar se pudieron perder eventos: tratarlo como resincronizar
+        handlerRef.current?.(evento.tipo === 'conectado' ? { ...evento, tipo: 'resincronizar' } : evento);
+      };
+      ws.onclose = () => {
+        if (cerrado) return;
+        reintento = setTimeout(conectar, espera);
+        espera = Math.min(espera * 2, 30000);
+      };
+    };
+
+    conectar();
+    return () => {
+      cerrado = true;
+      clearTimeout(reintento);
+      ws?.close();
+    };
+  }, []);
+};
+
+export default useEventosJuego;